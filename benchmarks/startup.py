@@ -0,0 +1,154 @@
+'''
+check the start up cost of the query command line against a budget
+
+  python benchmarks/startup.py [--budget-ms 80] [-l <index location>]
+
+the import time of pyeverything.frontend.cmd.run is read from
+python -X importtime, the modules only indexing, colors or the fallback
+tools need must not be imported by it, with an index location the wall
+time of a query is measured as well, exits with 1 when over budget
+'''
+import argparse
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = pathlib.Path(__file__).resolve().parent.parent / 'src'
+
+CLI_MODULE = 'pyeverything.frontend.cmd.run'
+
+# none of these is needed to parse the command line and run a query
+LAZY_MODULES = [
+    'whoosh', 'multiprocessing', 'binaryornot', 'termcolor', 'subprocess',
+    'appdirs', 'flask'
+]
+
+
+def parse_arguments():
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument("--budget-ms",
+                      help="max milliseconds to import the command line",
+                      type=float,
+                      default=80.0)
+  parser.add_argument("--query-budget-ms",
+                      help="max milliseconds of a cold query",
+                      type=float,
+                      default=400.0)
+  parser.add_argument("-l",
+                      "--location",
+                      help="index location to run the query on",
+                      type=pathlib.Path,
+                      default=None)
+  parser.add_argument("-c",
+                      "--content",
+                      help="content pattern of the query",
+                      default='import')
+  parser.add_argument("-n",
+                      "--runs",
+                      help="runs to take the median of",
+                      type=int,
+                      default=5)
+
+  return parser.parse_args()
+
+
+def _env():
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join(
+      [SRC_DIR.as_posix()] +
+      ([env['PYTHONPATH']] if 'PYTHONPATH' in env else []))
+
+  return env
+
+
+def import_time_ms():
+  '''
+  return (cumulative import time of the command line in ms, the top level
+  packages it imported)
+  '''
+  proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                         f'import {CLI_MODULE}'],
+                        capture_output=True,
+                        text=True,
+                        env=_env(),
+                        check=True)
+
+  cumulative = None
+  packages = set()
+
+  # import time: self [us] | cumulative | imported package
+  for line in proc.stderr.splitlines():
+    if not line.startswith('import time:'):
+      continue
+
+    fields = line[len('import time:'):].split('|')
+
+    if len(fields) != 3 or not fields[1].strip().isdigit():
+      continue
+
+    name = fields[2].strip()
+    packages.add(name.split('.')[0])
+
+    if name == CLI_MODULE:
+      cumulative = int(fields[1]) / 1000
+
+  return cumulative, packages
+
+
+def query_time_ms(location, content, runs):
+  cmd = [
+      sys.executable, '-c', f'from {CLI_MODULE} import main; main()', '-l',
+      location.as_posix(), '--no-service', 'query', '-c', content,
+      '--path_only', '--no_color'
+  ]
+
+  times = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(cmd,
+                   stdout=subprocess.DEVNULL,
+                   env=_env(),
+                   check=True)
+    times.append((time.perf_counter() - start) * 1000)
+
+  return statistics.median(times)
+
+
+def main():
+  args = parse_arguments()
+  ok = True
+
+  times = []
+  for _ in range(args.runs):
+    cumulative, packages = import_time_ms()
+    times.append(cumulative)
+
+  cumulative = statistics.median(times)
+  print(f'import {CLI_MODULE}: {cumulative:.1f}ms, '
+        f'budget: {args.budget_ms:.1f}ms')
+
+  if cumulative > args.budget_ms:
+    ok = False
+
+  eager = sorted(packages.intersection(LAZY_MODULES))
+  if len(eager) > 0:
+    print(f'imported eagerly: {", ".join(eager)}')
+    ok = False
+
+  if args.location is not None:
+    elapsed = query_time_ms(args.location, args.content, args.runs)
+    print(f'query {args.location.as_posix()}: {elapsed:.1f}ms, '
+          f'budget: {args.query_budget_ms:.1f}ms')
+
+    if elapsed > args.query_budget_ms:
+      ok = False
+
+  sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+
+
+class CompactionScheduler(object):
+  '''
+  commits only merge small segments, this thread asks the indexer for a full
+  merge when there are too many segments or deleted documents, or when the
+  indexer went idle after the index changed, the merge runs as a task of
+  the index writer, it is asked for again after retry_interval when the
+  index did not change, the writer skips it while another process holds
+  the index lock
+  '''
+
+  def __init__(self,
+               indexer,
+               check_interval=60.0,
+               idle_time=300.0,
+               max_segments=16,
+               max_deleted_ratio=0.25,
+               retry_interval=600.0):
+    super().__init__()
+
+    self.indexer_ = indexer
+    self.check_interval_ = check_interval
+    self.idle_time_ = idle_time
+    self.max_segments_ = max_segments
+    self.max_deleted_ratio_ = max_deleted_ratio
+    self.retry_interval_ = retry_interval
+
+    self.thread_ = None
+    self.stop_event_ = threading.Event()
+    self.last_stats_ = None
+    self.last_request_time_ = None
+
+  def start(self):
+    if self.thread_ is not None:
+      return
+
+    self.stop_event_.clear()
+
+    self.thread_ = threading.Thread(target=self.__run,
+                                    name='pyeverything-compaction',
+                                    daemon=True)
+    self.thread_.start()
+
+  def stop(self):
+    if self.thread_ is None:
+      return
+
+    self.stop_event_.set()
+    self.thread_.join()
+    self.thread_ = None
+
+  def __run(self):
+    while not self.stop_event_.wait(self.check_interval_):
+      try:
+        self.__check()
+      except:
+        logging.exception('failed check index segments')
+
+  def __check(self):
+    self.indexer_.refresh_cache()
+
+    stats = self.indexer_.segment_stats()
+    reason = self.__compact_reason(stats)
+
+    if reason is None:
+      return
+
+    logging.info(f'schedule index compaction, {reason}, stats:{stats}')
+
+    self.indexer_.compact()
+
+    self.last_stats_ = stats
+    self.last_request_time_ = time.monotonic()
+
+  def __compact_reason(self, stats):
+    # a requested compaction may still be queued or running
+    if (stats == self.last_stats_ and
+        time.monotonic() - self.last_request_time_ < self.retry_interval_):
+      return None
+
+    if stats['segments'] > self.max_segments_:
+      return f'{stats["segments"]} segments'
+
+    total = stats['documents'] + stats['deleted']
+    if total > 0 and stats['deleted'] / total > self.max_deleted_ratio_:
+      return f'{stats["deleted"]} deleted documents'
+
+    if ((stats['segments'] > 1 or stats['deleted'] > 0)
+        and self.indexer_.idle_time() >= self.idle_time_):
+      return 'indexer idle'
+
+    return None
@@ -1,31 +1,203 @@
-import pathlib
-from collections import deque
-from pyeverything.vcs_ignore import VCSIgnore
-
-BUILTIN_IGNORE = set(['.git', '.svn', 'CVS', '.hg', '.gitignore'])
-
-
-def add_glboal_ignore(path_name):
-  BUILTIN_IGNORE.add(path_name)
-
-
-def walk_directory(path):
-  children = deque([(path, VCSIgnore(path))])
-
-  while len(children) > 0:
-    cur_entry, vi = children.popleft()
-    vi.load_ignore_patterns_in_path()
-
-    for child in cur_entry.iterdir():
-      if vi.ignore_path(child) or child.name in BUILTIN_IGNORE:
-        continue
-
-      if child.is_file():
-        yield child
-      elif child.is_dir():
-        children.append((child, VCSIgnore(child, vi)))
-
-
-if __name__ == '__main__':
-  for p in walk_directory(pathlib.Path('.').cwd()):
-    print(p.as_posix())
+import os
+import pathlib
+from collections import deque, namedtuple
+from pyeverything.vcs_ignore import VCSIgnore
+from .git_index import MODE_SYMLINK, MODE_TYPE_MASK, tracked_files
+
+BUILTIN_IGNORE = set(['.git', '.svn', 'CVS', '.hg', '.gitignore'])
+
+# a walked file, real_path differs from path only when the file or one of
+# its directories is a symbolic link, stat is the one stat of the walk
+FileEntry = namedtuple('FileEntry', ['path', 'real_path', 'stat'])
+
+
+def add_glboal_ignore(path_name):
+  BUILTIN_IGNORE.add(path_name)
+
+
+def is_ignored(path, vi, is_dir=False):
+  if isinstance(path, str):
+    name = os.path.basename(path)
+  else:
+    name = path.name
+
+  return name in BUILTIN_IGNORE or vi.ignore_path(path, is_dir)
+
+
+def file_entry(path):
+  '''
+  FileEntry for a path which is not from a walk
+  '''
+  path = path.as_posix() if isinstance(path, pathlib.Path) else path
+
+  return FileEntry(path, os.path.realpath(path), os.stat(path))
+
+
+def scan_directory(path, in_link=False, vi=None):
+  '''
+  list one directory with os.scandir, return (files, directories), files
+  are FileEntry records and directories are (path, in_link) pairs, the
+  entries ignored by vi are skipped
+  '''
+  files = []
+  directories = []
+
+  with os.scandir(path) as it:
+    for child in it:
+      try:
+        is_dir = child.is_dir()
+
+        if not is_dir and not child.is_file():
+          continue
+
+        # ignored directories are pruned with everything under them
+        if vi is not None and is_ignored(child.path, vi, is_dir):
+          continue
+
+        is_link = in_link or child.is_symlink()
+
+        if is_dir:
+          directories.append((child.path, is_link))
+        else:
+          files.append(
+              FileEntry(child.path,
+                        os.path.realpath(child.path) if is_link else
+                        child.path, child.stat()))
+      except OSError:
+        continue
+
+  return files, directories
+
+
+def scan_directory_tree(path, vi=None):
+  '''
+  yield (directory, VCSIgnore, files) for path and every directory under it
+  which is not ignored, directory is a string and files are FileEntry records
+  '''
+  path = path.as_posix() if isinstance(path, pathlib.Path) else path
+
+  children = deque([(path, VCSIgnore(path) if vi is None else vi, False)])
+
+  while len(children) > 0:
+    cur_entry, vi, in_link = children.popleft()
+    vi.load_ignore_patterns_in_path()
+
+    try:
+      files, directories = scan_directory(cur_entry, in_link, vi)
+    except OSError:
+      continue
+
+    for d, d_in_link in directories:
+      children.append((d, VCSIgnore(d, vi), d_in_link))
+
+    yield cur_entry, vi, files
+
+
+def walk_directory_tree(path, vi=None):
+  '''
+  yield (directory, VCSIgnore, files) for path and every directory under it
+  which is not ignored
+  '''
+  for d, d_vi, files in scan_directory_tree(path, vi):
+    yield pathlib.Path(d), d_vi, [pathlib.Path(f.path) for f in files]
+
+
+def walk_files(path):
+  '''
+  yield a FileEntry for every file under path which is not ignored
+  '''
+  for _, _, files in scan_directory_tree(path):
+    yield from files
+
+
+def walk_git_files(path):
+  '''
+  yield a FileEntry for every file under path, the files tracked by git are
+  listed from the git index, they are never ignored, only the files git
+  does not track go through VCSIgnore, every file is still stat'ed since
+  the stat data in the index is only as fresh as the last git command,
+  falls back to walk_files when path is not in a git working tree
+  '''
+  path = path.as_posix() if isinstance(path, pathlib.Path) else path
+
+  found = tracked_files(path)
+
+  if found is None:
+    yield from walk_files(path)
+    return
+
+  work_tree, entries = found
+
+  tracked = set()
+  tracked_dirs = set()
+
+  for e in entries:
+    p = os.path.join(work_tree, e.path)
+    tracked.add(p)
+
+    if os.path.basename(p) in BUILTIN_IGNORE:
+      continue
+
+    d = os.path.dirname(p)
+    while d not in tracked_dirs and len(d) > len(work_tree):
+      tracked_dirs.add(d)
+      d = os.path.dirname(d)
+
+    try:
+      if e.mode & MODE_TYPE_MASK == MODE_SYMLINK:
+        yield FileEntry(p, os.path.realpath(p), os.stat(p))
+      else:
+        yield FileEntry(p, p, os.stat(p))
+    except OSError:
+      # deleted in the working tree
+      continue
+
+  # the directories holding tracked files are always walked, the others are
+  # pruned when ignored
+  children = deque([(path, VCSIgnore(path), False)])
+
+  while len(children) > 0:
+    cur_entry, vi, in_link = children.popleft()
+    vi.load_ignore_patterns_in_path()
+
+    try:
+      it = os.scandir(cur_entry)
+    except OSError:
+      continue
+
+    with it:
+      for child in it:
+        try:
+          if child.name in BUILTIN_IGNORE or child.path in tracked:
+            continue
+
+          is_dir = child.is_dir()
+
+          if not is_dir and not child.is_file():
+            continue
+
+          if child.path not in tracked_dirs and vi.ignore_path(
+              child.path, is_dir):
+            continue
+
+          is_link = in_link or child.is_symlink()
+
+          if is_dir:
+            children.append((child.path, VCSIgnore(child.path, vi), is_link))
+          else:
+            yield FileEntry(
+                child.path,
+                os.path.realpath(child.path) if is_link else child.path,
+                child.stat())
+        except OSError:
+          continue
+
+
+def walk_directory(path):
+  for f in walk_files(path):
+    yield pathlib.Path(f.path)
+
+
+if __name__ == '__main__':
+  for f in walk_files(pathlib.Path('.').cwd()):
+    print(f.path)
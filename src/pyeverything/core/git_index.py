@@ -0,0 +1,165 @@
+import logging
+import os
+import struct
+from collections import namedtuple
+
+# the fixed part of an index entry, ctime and mtime are seconds and
+# nanoseconds, see Documentation/gitformat-index.txt of git
+ENTRY_HEADER = struct.Struct('>10I20sH')
+HEADER = struct.Struct('>4sII')
+
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE_MASK = 0x3000
+FLAG_NAME_MASK = 0x0fff
+EXTENDED_FLAG_SKIP_WORKTREE = 0x4000
+EXTENDED_FLAG_INTENT_TO_ADD = 0x2000
+
+MODE_TYPE_MASK = 0o170000
+MODE_REGULAR = 0o100000
+MODE_SYMLINK = 0o120000
+MODE_GITLINK = 0o160000
+
+GitIndexEntry = namedtuple('GitIndexEntry', [
+    'path', 'mode', 'ctime', 'ctime_ns', 'mtime', 'mtime_ns', 'ino', 'size',
+    'flags', 'extended_flags'
+])
+
+
+def find_git_dir(path):
+  '''
+  return (work tree, git dir) of the working tree containing path, None
+  when path is not inside one
+  '''
+  path = os.path.abspath(path)
+
+  while True:
+    dot_git = os.path.join(path, '.git')
+
+    if os.path.isdir(dot_git):
+      return path, dot_git
+
+    if os.path.isfile(dot_git):
+      # worktrees and submodules point to their git dir
+      try:
+        with open(dot_git, encoding='utf-8') as f:
+          line = f.readline().strip()
+      except OSError:
+        return None
+
+      if line.startswith('gitdir:'):
+        git_dir = line[len('gitdir:'):].strip()
+        return path, os.path.normpath(os.path.join(path, git_dir))
+
+      return None
+
+    parent = os.path.dirname(path)
+
+    if parent == path:
+      return None
+
+    path = parent
+
+
+def read_git_index(index_path):
+  '''
+  yield a GitIndexEntry for every entry of the index file, versions 2 to 4
+  '''
+  with open(index_path, 'rb') as f:
+    data = f.read()
+
+  signature, version, count = HEADER.unpack_from(data, 0)
+
+  if signature != b'DIRC' or version not in (2, 3, 4):
+    raise ValueError(f'unsupported git index:{index_path}, version:{version}')
+
+  offset = HEADER.size
+  previous = b''
+
+  for _ in range(count):
+    entry_start = offset
+    (ctime, ctime_ns, mtime, mtime_ns, _, ino, mode, _, _, size, _,
+     flags) = ENTRY_HEADER.unpack_from(data, offset)
+    offset += ENTRY_HEADER.size
+
+    extended_flags = 0
+    if version >= 3 and flags & FLAG_EXTENDED:
+      extended_flags = struct.unpack_from('>H', data, offset)[0]
+      offset += 2
+
+    if version == 4:
+      # the name drops a number of bytes from the end of the previous one
+      # and appends the rest, there is no padding
+      strip, offset = __read_varint(data, offset)
+      end = data.index(b'\0', offset)
+      name = previous[:len(previous) - strip] + data[offset:end]
+      offset = end + 1
+    else:
+      end = data.index(b'\0', offset)
+      name = data[offset:end]
+
+      # entries are padded with 1 to 8 nul bytes to a multiple of 8
+      offset = entry_start + ((end - entry_start) // 8 + 1) * 8
+
+    previous = name
+
+    yield GitIndexEntry(os.fsdecode(name), mode, ctime, ctime_ns, mtime,
+                        mtime_ns, ino, size, flags, extended_flags)
+
+
+def __read_varint(data, offset):
+  # the offset encoding of git, every continuation byte adds one
+  b = data[offset]
+  offset += 1
+  value = b & 0x7f
+
+  while b & 0x80:
+    b = data[offset]
+    offset += 1
+    value = ((value + 1) << 7) | (b & 0x7f)
+
+  return value, offset
+
+
+def tracked_files(root):
+  '''
+  return (work tree, entries) for the files under root tracked by the git
+  index, None when root is not in a working tree or the index can not be
+  read
+  '''
+  found = find_git_dir(root)
+
+  if found is None:
+    return None
+
+  work_tree, git_dir = found
+  index_path = os.path.join(git_dir, 'index')
+
+  try:
+    entries = list(read_git_index(index_path))
+  except (OSError, ValueError, struct.error):
+    logging.exception(f'failed read git index:{index_path}')
+    return None
+
+  root = os.path.abspath(root)
+  prefix = '' if root == work_tree else os.path.relpath(root,
+                                                        work_tree) + '/'
+
+  tracked = []
+  for e in entries:
+    # a conflicted path has an entry for each stage, sorted by stage
+    if len(tracked) > 0 and tracked[-1].path == e.path:
+      continue
+
+    if e.extended_flags & (EXTENDED_FLAG_SKIP_WORKTREE
+                           | EXTENDED_FLAG_INTENT_TO_ADD):
+      continue
+
+    if e.mode & MODE_TYPE_MASK not in (MODE_REGULAR, MODE_SYMLINK):
+      continue
+
+    if not e.path.startswith(prefix):
+      continue
+
+    tracked.append(e)
+
+  return work_tree, tracked
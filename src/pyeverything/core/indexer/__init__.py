@@ -1,43 +1,135 @@
-class IndexerImpl(object):
-
-  def __init__(self, data_path):
-    super().__init__()
-
-    self.data_path_ = data_path
-    self.index_dir_ = self.data_path_.resolve().as_posix()
-
-  def add_document(self, path, full_indexing=False):
-    raise NotImplementedError()
-
-  def begin_index(self):
-    raise NotImplementedError()
-
-  def end_index(self, index_updated=True):
-    raise NotImplementedError()
-
-  def query(self, path, content, ignore_case=True, raw_pattern=False):
-    raise NotImplementedError()
-
-  def delete_path(self, path):
-    raise NotImplementedError()
-
-  def touch_path(self, path, modified_time):
-    raise NotImplementedError()
-
-  def clear_non_exist(self, path):
-    raise NotImplementedError()
-
-  def get_index_modified_time(self, path):
-    raise NotImplementedError()
-
-  def refresh_cache(self):
-    raise NotImplementedError()
-
-  def list_indexed_path(self):
-    raise NotImplementedError()
-
-
-def get_indexer_impl(data_path):
-  from .whoosh import WhooshIndexerImpl
-
-  return WhooshIndexerImpl(data_path)
+import logging
+
+
+class IndexerImpl(object):
+
+  def __init__(self, data_path):
+    super().__init__()
+
+    self.data_path_ = data_path
+    self.index_dir_ = self.data_path_.resolve().as_posix()
+
+  def add_document(self, path, full_indexing=False):
+    raise NotImplementedError()
+
+  def begin_index(self):
+    raise NotImplementedError()
+
+  def end_index(self, index_updated=True):
+    raise NotImplementedError()
+
+  def query(self, path, content, ignore_case=True, raw_pattern=False):
+    raise NotImplementedError()
+
+  def estimate(self, path, content, ignore_case=True, raw_pattern=False):
+    '''
+    return (estimated, total) number of documents, estimated is an upper
+    bound of the candidates query() returns, from the document frequencies
+    '''
+    raise NotImplementedError()
+
+  def delete_path(self, path):
+    raise NotImplementedError()
+
+  def delete_document(self, path):
+    raise NotImplementedError()
+
+  def delete_prefix(self, path):
+    raise NotImplementedError()
+
+  def touch_path(self, path, modified_time):
+    raise NotImplementedError()
+
+  def clear_non_exist(self, path):
+    raise NotImplementedError()
+
+  def get_index_modified_time(self, path):
+    raise NotImplementedError()
+
+  def refresh_cache(self):
+    raise NotImplementedError()
+
+  def list_indexed_path(self):
+    raise NotImplementedError()
+
+  def list_documents(self):
+    raise NotImplementedError()
+
+  def compact(self):
+    raise NotImplementedError()
+
+  def segment_stats(self):
+    raise NotImplementedError()
+
+
+INDEXER_BACKENDS = ['whoosh', 'trigram', 'sqlite']
+DEFAULT_INDEXER_BACKEND = 'whoosh'
+BACKEND_FILE = 'backend'
+
+
+def get_indexer_backend(data_path):
+  try:
+    backend = (data_path / BACKEND_FILE).read_text(encoding='utf-8').strip()
+  except FileNotFoundError:
+    return DEFAULT_INDEXER_BACKEND
+
+  if backend not in INDEXER_BACKENDS:
+    logging.warning(f'unknown indexer backend:{backend}, use default')
+    return DEFAULT_INDEXER_BACKEND
+
+  return backend
+
+
+def set_indexer_backend(data_path, backend):
+  if backend not in INDEXER_BACKENDS:
+    raise ValueError(f'unknown indexer backend:{backend}')
+
+  (data_path / BACKEND_FILE).write_text(backend, encoding='utf-8')
+
+
+def create_indexer_impl(data_path, backend):
+  if backend == 'trigram':
+    from .trigram import TrigramIndexerImpl
+
+    return TrigramIndexerImpl(data_path)
+
+  if backend == 'sqlite':
+    from .sqlite import SqliteIndexerImpl
+
+    return SqliteIndexerImpl(data_path)
+
+  from .whoosh import WhooshIndexerImpl
+
+  return WhooshIndexerImpl(data_path)
+
+
+def _stored_indexer_backend(data_path):
+  '''
+  the backend of the index in the data path, None when there is no index
+  '''
+  if (data_path / BACKEND_FILE).exists():
+    return get_indexer_backend(data_path)
+
+  # indexes created before the backends were remembered are whoosh ones
+  if any(data_path.glob('_MAIN_*.toc')):
+    return DEFAULT_INDEXER_BACKEND
+
+  return None
+
+
+def get_indexer_impl(data_path, backend=None):
+  # the backend given is remembered in the data path, so later runs
+  # without a backend use the same index, an existing index is only
+  # switched to another backend by migrating it
+  stored_backend = _stored_indexer_backend(data_path)
+
+  if backend is None:
+    backend = stored_backend or DEFAULT_INDEXER_BACKEND
+  elif stored_backend is None:
+    set_indexer_backend(data_path, backend)
+  elif backend != stored_backend:
+    raise ValueError(
+        f'index in {data_path.as_posix()} uses the {stored_backend} backend, '
+        f'not {backend}, run migrate -t {backend} to switch it')
+
+  return create_indexer_impl(data_path, backend)
@@ -0,0 +1,51 @@
+import hashlib
+import logging
+import os
+from collections import namedtuple
+
+from pyeverything.core.manifest import file_digest
+
+# everything add_document needs from a file, loaded ahead of the writer
+Document = namedtuple(
+    'Document', ['path', 'create_time', 'modified_time', 'content', 'digest'])
+
+
+def load_document(p, st=None, digest=False):
+  '''
+  stat, classify and read the file at the real path p, binary files are
+  indexed without content, return None when the file can not be read
+  '''
+  # slow to import, only indexing and scanning load documents
+  from binaryornot.check import is_binary
+
+  try:
+    if st is None:
+      st = os.stat(p)
+
+    if is_binary(p):
+      return Document(p, st.st_ctime, st.st_mtime, '',
+                      file_digest(p) if digest else None)
+
+    with open(p, 'rb') as f:
+      data = f.read()
+  except:
+    logging.exception(f'failed read content:{p}')
+    return None
+
+  # same text as read_text() with universal newlines
+  content = data.decode('utf-8', errors='ignore')
+  content = content.replace('\r\n', '\n').replace('\r', '\n')
+
+  return Document(
+      p, st.st_ctime, st.st_mtime, content,
+      hashlib.blake2b(data, digest_size=16).digest() if digest else None)
+
+
+def as_document(path):
+  '''
+  add_document takes either a path or a loaded Document
+  '''
+  if isinstance(path, Document):
+    return path
+
+  return load_document(os.path.realpath(path))
@@ -0,0 +1,33 @@
+import logging
+import pathlib
+
+
+def migrate_index(source, target):
+  '''
+  copy the documents and indexed paths of source into target, the content
+  is read again from the file system since not every backend stores it
+  '''
+  roots = source.list_indexed_path()
+  document_count = 0
+  index_updated = False
+
+  target.begin_index()
+  try:
+    for path, _, _ in source.list_documents():
+      p = pathlib.Path(path)
+
+      if not p.exists():
+        logging.debug(f'skip migrating non exist file:{path}')
+        continue
+
+      target.add_document(p)
+      document_count += 1
+
+    for path, modified_time in roots:
+      target.touch_path(path, modified_time)
+
+    index_updated = True
+  finally:
+    target.end_index(index_updated)
+
+  return document_count
@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+from datetime import datetime
+from itertools import islice
+
+from pyeverything.core.regexp_match_utils import match_info
+
+HIT_ORDERS = ['path', 'mtime']
+
+
+def order_hits(hits, order=None):
+  '''
+  keep the hits in index order, or sort them by 'path' or by 'mtime' with
+  the latest modified first, sorting reads all the hits before the first
+  one is returned
+  '''
+  if order is None:
+    return hits
+
+  if order == 'path':
+    return iter(sorted(hits, key=lambda hit: hit['path']))
+
+  if order == 'mtime':
+    return iter(
+        sorted(hits,
+               key=lambda hit: hit.get('modified_time') or datetime.min,
+               reverse=True))
+
+  raise ValueError(f'unknown hit order:{order}')
+
+
+def compile_path_matcher(path, ignore_case=True, raw_pattern=False):
+  '''
+  the regex the paths of the hits are checked with, None when there is no
+  path pattern
+  '''
+  if path is None:
+    return None
+
+  if raw_pattern:
+    path = re.escape(path)
+
+  if ignore_case:
+    path = f'(?i){path}'
+
+  return re.compile(f'(?m){path}')
+
+
+def verify_hit(result, hit, path_matcher, content, path_only=False):
+  '''
+  return (found, matching info) of a hit of result, the hits are only
+  candidates, the file may not match the path, not exist any more or not
+  have the content now, there is no matching info when only the path is
+  checked
+  '''
+  path = hit['path']
+
+  if path_matcher is not None and path_matcher.search(path) is None:
+    logging.debug(f'path:{path} does not match:{path_matcher.pattern}')
+    return False, None
+
+  if not os.path.exists(path):
+    logging.debug(f'path:{path} does not exist, skipping')
+    return False, None
+
+  if path_only or content is None:
+    return True, None
+
+  try:
+    matching_info = list(result.get_matching_info(hit, content))
+  except OSError:
+    logging.debug(f'failed read path:{path}, skipping')
+    return False, None
+
+  if len(matching_info) == 0:
+    logging.debug(f'path:{path} no matching, skipping')
+    return False, None
+
+  return True, matching_info
+
+
+def make_cursor(generation, docnum):
+  '''
+  the token resuming a query after the document docnum of the index
+  generation
+  '''
+  return f'{generation}.{docnum}'
+
+
+def parse_cursor(cursor, generation):
+  '''
+  return the docnum to resume after, the docnums of another generation of
+  the index may not point to the same documents
+  '''
+  try:
+    cursor_generation, docnum = [int(x) for x in cursor.split('.')]
+  except ValueError:
+    raise ValueError(f'invalid cursor:{cursor}')
+
+  if cursor_generation != generation:
+    raise ValueError(f'stale cursor:{cursor}, index generation:{generation}')
+
+  return docnum
+
+
+class QueryResult(object):
+
+  def __init__(self,
+               hits,
+               origin_path,
+               ignore_case,
+               use_raw_match,
+               resume=None,
+               generation=0,
+               lease=None):
+    '''
+    resume(docnum) returns the hits after docnum, the hits then carry their
+    docnum, without it the hits can not be resumed, lease keeps what the
+    hits read open and is given back on close
+    '''
+    super().__init__()
+
+    self.hits_ = hits
+    self.origin_path_ = origin_path
+    self.use_raw_match_ = use_raw_match
+    self.ignore_case_ = ignore_case
+    self.resume_ = resume
+    self.generation_ = generation
+    self.lease_ = lease
+
+  def close(self):
+    self.hits_.close()
+
+    if self.lease_ is not None:
+      self.lease_.close()
+
+  def query(self, limit=None):
+    return islice(self.hits_, limit)
+
+  def iter_hits(self, order=None, cursor=None):
+    if cursor is None:
+      return order_hits(self.hits_, order)
+
+    if self.resume_ is None or order is not None:
+      raise ValueError('only hits in index order can be resumed')
+
+    self.hits_.close()
+    self.hits_ = self.resume_(parse_cursor(cursor, self.generation_))
+
+    return self.hits_
+
+  def cursor(self, hit):
+    if self.resume_ is None:
+      raise ValueError('the hits can not be resumed')
+
+    return make_cursor(self.generation_, hit['docnum'])
+
+  def query_paged(self, page, page_len=10):
+    return islice(self.hits_, (page - 1) * page_len, page * page_len)
+
+  def get_matching_info(self, hit, content):
+    '''
+    the hits of a scan carry the match info of the content they were
+    scanned for, the other files are read and matched here
+    '''
+    if 'matching_info' in hit:
+      return iter(hit['matching_info'])
+
+    return match_info(hit['path'], content, self.ignore_case_,
+                      self.use_raw_match_)
@@ -0,0 +1,462 @@
+import datetime
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+from functools import lru_cache, partial
+
+from .. import IndexerImpl
+from ..document import as_document
+from ..query_result import QueryResult
+from pyeverything.core.regexp_plan import ALL, And, estimate_plan, literal_prefix, regexp_to_plan, literal_to_plan, map_literals, ngram_plan
+
+DB_FILE = 'index.sqlite'
+
+# contentless tables only support DELETE since sqlite 3.43, older versions
+# keep a copy of the content in the fts table
+if sqlite3.sqlite_version_info >= (3, 43, 0):
+  FTS_OPTIONS = ", content='', contentless_delete=1"
+else:
+  FTS_OPTIONS = ''
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS files (
+         id INTEGER PRIMARY KEY,
+         path TEXT NOT NULL UNIQUE,
+         create_time REAL,
+         modified_time REAL)''',
+    'CREATE INDEX IF NOT EXISTS files_modified_time ON files(modified_time)',
+    '''CREATE TABLE IF NOT EXISTS indexed_paths (
+         path TEXT PRIMARY KEY,
+         create_time REAL,
+         modified_time REAL)''',
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+         path_content, content, tokenize='trigram'{FTS_OPTIONS})''',
+    # document frequencies of the trigrams for query planning
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS files_vocab
+         USING fts5vocab(files_fts, 'col')''',
+]
+
+
+def _check_trigram_tokenizer(conn):
+  '''
+  the trigram tokenizer of fts5 came with sqlite 3.34, without it the
+  index can not be created or queried
+  '''
+  try:
+    conn.execute('CREATE VIRTUAL TABLE temp.trigram_probe'
+                 " USING fts5(x, tokenize='trigram')")
+    conn.execute('DROP TABLE temp.trigram_probe')
+  except sqlite3.OperationalError as e:
+    raise ValueError(
+        'sqlite backend needs sqlite 3.34 or newer built with fts5 for '
+        f'the trigram tokenizer, found sqlite {sqlite3.sqlite_version}, {e}')
+
+
+def _timestamp(t):
+  return t.timestamp() if t is not None else None
+
+
+def _datetime(ts):
+  return datetime.datetime.fromtimestamp(ts) if ts is not None else None
+
+
+@lru_cache(maxsize=64)
+def _compile(pattern):
+  return re.compile(pattern)
+
+
+def _regexp(pattern, value):
+  return value is not None and _compile(pattern).search(value) is not None
+
+
+def plan_to_match(plan):
+  '''
+  convert a literal plan into a fts5 match expression, None matches all,
+  the trigram tokenizer can not look up literals shorter than 3
+  '''
+
+  def to_phrase(s):
+    if len(s) < 3:
+      return ALL
+
+    return s
+
+  def to_expr(p):
+    if isinstance(p, str):
+      return '"' + p.replace('"', '""') + '"'
+
+    op = ' AND ' if isinstance(p, And) else ' OR '
+    return '(' + op.join(sorted(to_expr(c) for c in p.children)) + ')'
+
+  plan = map_literals(plan, to_phrase)
+
+  if plan is ALL:
+    return None
+
+  return to_expr(plan)
+
+
+def _path_pattern(path, ignore_case, raw_pattern):
+  if path is None or path == '.*':
+    return None
+
+  path_pattern = re.escape(path) if raw_pattern else path
+  return f'(?m){"(?i)" if ignore_case else ""}{path_pattern}'
+
+
+def _path_prefix_range(path, ignore_case, raw_pattern):
+  if raw_pattern or ignore_case:
+    return None
+
+  prefix = literal_prefix(path)
+
+  if prefix is None:
+    return None
+
+  # the smallest string after all the ones starting with prefix
+  return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _pattern_plan(pattern, ignore_case, raw_pattern):
+  if pattern is None:
+    return ALL
+
+  if raw_pattern:
+    return literal_to_plan(pattern)
+
+  return regexp_to_plan(f'(?m){"(?i)" if ignore_case else ""}{pattern}')
+
+
+def _fts_match(path, content, ignore_case, raw_pattern):
+  '''
+  the fts5 match expression looking up the trigrams of the path and the
+  content, None when neither has any, the regex still checks the path
+  '''
+  columns = []
+
+  if path is not None and path != '.*':
+    match = plan_to_match(_pattern_plan(path, ignore_case, raw_pattern))
+
+    if match is not None:
+      columns.append(f'path_content:{match}')
+
+  if content is not None:
+    match = plan_to_match(_pattern_plan(content, ignore_case, raw_pattern))
+
+    if match is not None:
+      columns.append(f'content:{match}')
+
+  if len(columns) == 0:
+    return None
+
+  return ' AND '.join(columns)
+
+
+class SqliteIndexerImpl(IndexerImpl):
+
+  def __init__(self, data_path):
+    super().__init__(data_path)
+
+    self.__initialize()
+
+  def __getstate__(self):
+    # sqlite connections can not be shared with the worker process
+    return {'data_path_': self.data_path_}
+
+  def __setstate__(self, state):
+    self.__init__(state['data_path_'])
+
+  def __initialize(self):
+    self.db_path_ = os.path.join(self.index_dir_, DB_FILE)
+
+    self.conn_ = sqlite3.connect(self.db_path_,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+    self.conn_.create_function('regexp', 2, _regexp, deterministic=True)
+    self.conn_.execute('PRAGMA journal_mode=WAL')
+    self.conn_.execute('PRAGMA synchronous=NORMAL')
+
+    _check_trigram_tokenizer(self.conn_)
+
+    for stmt in SCHEMA:
+      self.conn_.execute(stmt)
+
+    logging.debug(f'open sqlite index in {self.db_path_}')
+
+    self.writing_ = False
+
+  def add_document(self, path, full_indexing=False):
+    if not self.writing_:
+      return
+
+    document = as_document(path)
+
+    if document is None:
+      return
+
+    self.__add(document.path, document.create_time, document.modified_time,
+               document.content)
+
+  def __add(self, path, create_time, modified_time, content):
+    row = self.conn_.execute('SELECT id FROM files WHERE path = ?',
+                             (path, )).fetchone()
+
+    if row is None:
+      file_id = self.conn_.execute(
+          'INSERT INTO files(path, create_time, modified_time) VALUES (?, ?, ?)',
+          (path, create_time, modified_time)).lastrowid
+    else:
+      # a file indexed again keeps its id, which is the docnum the cursors
+      # resume after
+      file_id = row[0]
+
+      self.conn_.execute(
+          'UPDATE files SET create_time = ?, modified_time = ? WHERE id = ?',
+          (create_time, modified_time, file_id))
+      self.conn_.execute('DELETE FROM files_fts WHERE rowid = ?',
+                         (file_id, ))
+
+    self.conn_.execute(
+        'INSERT INTO files_fts(rowid, path_content, content) VALUES (?, ?, ?)',
+        (file_id, path, content))
+
+  def __delete_ids(self, ids):
+    for i in ids:
+      self.conn_.execute('DELETE FROM files_fts WHERE rowid = ?', (i, ))
+      self.conn_.execute('DELETE FROM files WHERE id = ?', (i, ))
+
+    return len(ids)
+
+  def begin_index(self):
+    if self.writing_:
+      return
+
+    self.conn_.execute('BEGIN IMMEDIATE')
+    self.writing_ = True
+
+  def end_index(self, index_updated=True):
+    if not self.writing_:
+      return
+
+    logging.info(f'index updated:{index_updated}')
+
+    self.writing_ = False
+
+    if index_updated:
+      self.conn_.execute('COMMIT')
+    else:
+      self.conn_.execute('ROLLBACK')
+
+  def query(self, path, content, ignore_case=True, raw_pattern=False):
+    if path is None and content is None:
+      raise ValueError('must provide either path or content to search')
+
+    conditions = []
+    params = []
+
+    # the trigrams of the path and the content narrow the candidates, the
+    # path regex only runs on those
+    match = _fts_match(path, content, ignore_case, raw_pattern)
+    if match is not None:
+      conditions.append(
+          'f.id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)')
+      params.append(match)
+
+    path_pattern = _path_pattern(path, ignore_case, raw_pattern)
+    if path_pattern is not None:
+      prefix_range = _path_prefix_range(path, ignore_case, raw_pattern)
+
+      # an anchored path is looked up in the path index first
+      if prefix_range is not None:
+        conditions.append('f.path >= ? AND f.path < ?')
+        params.extend(prefix_range)
+
+      conditions.append('f.path REGEXP ?')
+      params.append(path_pattern)
+
+    # the ids are the docnums, a query is resumed after the last one
+    sql = ('SELECT f.id, f.path, f.create_time, f.modified_time FROM files f'
+           ' WHERE f.id > ?')
+
+    for c in conditions:
+      sql += ' AND ' + c
+
+    sql += ' ORDER BY f.id'
+
+    logging.debug(f'query sql:{sql}, params:{params}')
+
+    search = lambda after=-1: self.__hits(sql, [after] + params)
+
+    # a file keeps its id while it is indexed, a cursor stays valid
+    return QueryResult(search(), path, ignore_case, raw_pattern, search)
+
+  def estimate(self, path, content, ignore_case=True, raw_pattern=False):
+    total = self.conn_.execute('SELECT count(*) FROM files').fetchone()[0]
+
+    def doc_frequency(col, t):
+      row = self.conn_.execute(
+          'SELECT doc FROM files_vocab WHERE term = ? AND col = ?',
+          (t, col)).fetchone()
+      return 0 if row is None else row[0]
+
+    plan = ngram_plan(_pattern_plan(content, ignore_case, raw_pattern))
+    estimate = estimate_plan(plan, partial(doc_frequency, 'content'), total)
+
+    # the paths are estimated from their trigrams too, an anchored path
+    # is counted from the path index
+    path_pattern = _path_pattern(path, ignore_case, raw_pattern)
+    if path_pattern is not None and estimate > 0:
+      plan = ngram_plan(_pattern_plan(path, ignore_case, raw_pattern))
+      estimate = min(
+          estimate,
+          estimate_plan(plan, partial(doc_frequency, 'path_content'), total))
+
+      prefix_range = _path_prefix_range(path, ignore_case, raw_pattern)
+      if prefix_range is not None and estimate > 0:
+        estimate = min(
+            estimate,
+            self.conn_.execute(
+                'SELECT count(*) FROM files WHERE path >= ? AND path < ?',
+                prefix_range).fetchone()[0])
+
+    return estimate, total
+
+  def __hits(self, sql, params):
+    cur = self.conn_.execute(sql, params)
+
+    try:
+      for docnum, p, create_time, modified_time in cur:
+        yield {
+            'path': p,
+            'create_time': _datetime(create_time),
+            'modified_time': _datetime(modified_time),
+            'docnum': docnum
+        }
+    finally:
+      cur.close()
+
+  def delete_path(self, path):
+    if path is None:
+      raise ValueError('must provide path to delete')
+
+    ids = [
+        row[0] for row in self.conn_.execute(
+            'SELECT id FROM files WHERE path REGEXP ?', (path, ))
+    ]
+
+    return self.__delete_ids(ids)
+
+  def delete_document(self, path):
+    row = self.conn_.execute('SELECT id FROM files WHERE path = ?',
+                             (path, )).fetchone()
+
+    if row is not None:
+      self.__delete_ids([row[0]])
+
+  def delete_prefix(self, path):
+    # '0' follows '/', so the range covers every path under the prefix
+    prefix = path.rstrip('/') + '/'
+    params = (path, prefix, prefix[:-1] + '0')
+
+    ids = [
+        row[0] for row in self.conn_.execute(
+            'SELECT id FROM files WHERE path = ? OR (path >= ? AND path < ?)',
+            params)
+    ]
+
+    self.conn_.execute(
+        'DELETE FROM indexed_paths WHERE path = ? OR (path >= ? AND path < ?)',
+        params)
+
+    return self.__delete_ids(ids)
+
+  def touch_path(self, path, modified_time):
+    if path is None:
+      path = [x[0] for x in self.list_indexed_path()]
+    else:
+      path = [path]
+
+    for p in path:
+      pp = pathlib.Path(p)
+
+      if not pp.exists():
+        continue
+
+      logging.debug(
+          f'update indexed path:{pp.resolve().as_posix()} modified time')
+      self.conn_.execute(
+          'INSERT OR REPLACE INTO indexed_paths(path, create_time, modified_time) VALUES (?, ?, ?)',
+          (pp.resolve().as_posix(), pp.stat().st_ctime,
+           _timestamp(modified_time)))
+
+  def list_indexed_path(self):
+    try:
+      return [(p, _datetime(m)) for p, m in self.conn_.execute(
+          'SELECT path, modified_time FROM indexed_paths ORDER BY path')]
+    except:
+      logging.exception('failed')
+      return []
+
+  def list_documents(self):
+    for p, create_time, modified_time in self.conn_.execute(
+        'SELECT path, create_time, modified_time FROM files ORDER BY id'):
+      yield (p, _datetime(create_time), _datetime(modified_time))
+
+  def compact(self):
+    if self.writing_:
+      raise ValueError('can not compact index while writing')
+
+    logging.info(f'compact index in {self.db_path_}')
+
+    # merge all fts5 b-tree segments, then fold the wal back into the db
+    self.conn_.execute("INSERT INTO files_fts(files_fts) VALUES ('optimize')")
+    self.conn_.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+  def segment_stats(self):
+    segments = self.conn_.execute(
+        'SELECT count(DISTINCT segid) FROM files_fts_idx').fetchone()[0]
+    documents = self.conn_.execute('SELECT count(*) FROM files').fetchone()[0]
+
+    size = 0
+    for f in [self.db_path_, f'{self.db_path_}-wal']:
+      if os.path.exists(f):
+        size += os.path.getsize(f)
+
+    return {
+        'segments': segments,
+        'documents': documents,
+        'deleted': 0,
+        'size': size
+    }
+
+  def refresh_cache(self):
+    # every statement reads the latest committed data in wal mode
+    pass
+
+  def clear_non_exist(self, path):
+    v = path.as_posix()
+
+    exist_files = {}
+    delete_ids = []
+
+    for i, p, m in self.conn_.execute(
+        'SELECT id, path, modified_time FROM files WHERE path >= ? ORDER BY path',
+        (v, )):
+      if not p.startswith(v):
+        break
+
+      if not os.path.exists(p):
+        delete_ids.append(i)
+      else:
+        exist_files[p] = _datetime(m)
+
+    return exist_files, self.__delete_ids(delete_ids)
+
+  def get_index_modified_time(self, path):
+    row = self.conn_.execute(
+        'SELECT modified_time FROM indexed_paths WHERE path = ?',
+        (path.as_posix(), )).fetchone()
+
+    return _datetime(row[0]) if row is not None else None
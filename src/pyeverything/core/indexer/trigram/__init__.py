@@ -0,0 +1,665 @@
+import datetime
+import json
+import logging
+import os
+import pathlib
+import re
+import threading
+from collections import defaultdict
+from itertools import islice
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+from .. import IndexerImpl
+from ..document import as_document
+from ..query_result import QueryResult
+from .segment import Segment, SegmentLease, write_segment, write_deleted, segment_files
+from pyeverything.core.query_planner import MAX_CANDIDATE_RATIO
+from pyeverything.core.regexp_plan import ALL, And, estimate_plan, literal_prefix, regexp_to_plan, literal_to_plan, ngram_plan, string_ngrams
+
+TOC_FILE = 'toc.json'
+LOCK_FILE = 'write.lock'
+
+# pending documents are flushed into a new segment once the writer holds
+# this many of them, which bounds the memory used by a large indexing run
+FLUSH_DOC_COUNT = 20000
+
+# the smallest segments are merged at commit when there are more than this,
+# compact() merges all of them into one
+MAX_SEGMENT_COUNT = 8
+
+
+def _timestamp(t):
+  return t.timestamp() if t is not None else None
+
+
+def _datetime(ts):
+  return datetime.datetime.fromtimestamp(ts) if ts is not None else None
+
+
+class TrigramIndexerImpl(IndexerImpl):
+
+  def __init__(self, data_path):
+    super().__init__(data_path)
+
+    self.__initialize()
+
+  def __getstate__(self):
+    # segments hold memory maps, the worker process opens its own
+    return {'data_path_': self.data_path_}
+
+  def __setstate__(self, state):
+    self.__init__(state['data_path_'])
+
+  def __initialize(self):
+    self.trigram_dir_ = os.path.join(self.index_dir_, 'trigram')
+    os.makedirs(self.trigram_dir_, exist_ok=True)
+
+    self.toc_ = None
+    self.segments_ = []
+    self.segments_lock_ = threading.Lock()
+    self.lock_file_ = None
+    self.writer_ = None
+
+    self.__load_toc()
+
+  def __path(self, file_name):
+    return os.path.join(self.trigram_dir_, file_name)
+
+  def __read_toc(self):
+    try:
+      with open(self.__path(TOC_FILE), encoding='utf-8') as f:
+        return json.load(f)
+    except FileNotFoundError:
+      return {
+          'generation': 0,
+          'next_segment': 0,
+          'next_docid': 0,
+          'segments': [],
+          'roots': {}
+      }
+
+  def __load_toc(self):
+    toc = self.__read_toc()
+
+    if self.toc_ is not None and toc['generation'] == self.toc_['generation']:
+      return
+
+    segments = []
+    for s in toc['segments']:
+      segments.append(
+          Segment(self.trigram_dir_, s['name'], s['base'], s['deleted']))
+
+    # queries still reading the old segments hold leases on them
+    with self.segments_lock_:
+      old_segments = self.segments_
+      self.toc_ = toc
+      self.segments_ = segments
+
+    for s in old_segments:
+      s.release()
+
+    logging.debug(
+        f'open trigram index generation:{toc["generation"]} in {self.trigram_dir_}'
+    )
+
+  def __acquire(self):
+    with self.segments_lock_:
+      return SegmentLease(self.toc_['generation'], list(self.segments_))
+
+  def __write_toc(self, toc):
+    tmp_path = self.__path(f'{TOC_FILE}.tmp')
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump(toc, f)
+      f.flush()
+      os.fsync(f.fileno())
+
+    os.replace(tmp_path, self.__path(TOC_FILE))
+
+  def __lock(self):
+    self.lock_file_ = open(self.__path(LOCK_FILE), 'w')
+
+    if fcntl is not None:
+      fcntl.flock(self.lock_file_.fileno(), fcntl.LOCK_EX)
+
+  def __unlock(self):
+    if self.lock_file_ is None:
+      return
+
+    if fcntl is not None:
+      fcntl.flock(self.lock_file_.fileno(), fcntl.LOCK_UN)
+
+    self.lock_file_.close()
+    self.lock_file_ = None
+
+  def add_document(self, path, full_indexing=False):
+    if self.writer_ is None:
+      return
+
+    document = as_document(path)
+
+    if document is None:
+      return
+
+    self.writer_.add(document.path, document.create_time,
+                     document.modified_time,
+                     string_ngrams(document.content.lower()))
+
+  def begin_index(self):
+    if self.writer_ is not None:
+      return
+
+    self.__lock()
+    self.toc_ = None
+    self.__load_toc()
+
+    self.writer_ = _Writer(self.trigram_dir_, self.toc_, self.segments_)
+
+  def end_index(self, index_updated=True):
+    if self.writer_ is None:
+      return
+
+    logging.info(f'index updated:{index_updated}')
+
+    try:
+      if index_updated:
+        toc = self.writer_.commit()
+
+        if len(toc['segments']) > MAX_SEGMENT_COUNT:
+          toc = self.__merge_small_segments(toc)
+
+        self.__write_toc(toc)
+        self.__remove_unused_files(toc)
+      else:
+        self.writer_.cancel()
+    finally:
+      self.writer_ = None
+      self.__unlock()
+
+    self.__load_toc()
+
+  def __merge_small_segments(self, toc):
+    sizes = {}
+
+    for s in toc['segments']:
+      segment = Segment(self.trigram_dir_, s['name'], s['base'], s['deleted'])
+      sizes[s['name']] = segment.live_doc_count
+      segment.close()
+
+    smallest = sorted(toc['segments'], key=lambda s: sizes[s['name']])
+    count = len(toc['segments']) - MAX_SEGMENT_COUNT // 2 + 1
+
+    return self.__merge_segments(toc, set(s['name'] for s in smallest[:count]))
+
+  def __merge_segments(self, toc, names=None):
+    if names is None:
+      names = set(s['name'] for s in toc['segments'])
+
+    merging = [s for s in toc['segments'] if s['name'] in names]
+    kept = [s for s in toc['segments'] if s['name'] not in names]
+
+    segments = [
+        Segment(self.trigram_dir_, s['name'], s['base'], s['deleted'])
+        for s in merging
+    ]
+
+    try:
+      name = f'seg_{toc["next_segment"]}'
+      docs = []
+      postings = defaultdict(list)
+
+      for s in segments:
+        id_map = {}
+
+        for local_id, doc in s.live_docs():
+          id_map[local_id] = len(docs)
+          docs.append(doc)
+
+        for trigram in s.trigrams():
+          ids = [id_map[x] for x in s.postings(trigram) if x in id_map]
+
+          if len(ids) > 0:
+            postings[trigram].extend(ids)
+
+      write_segment(self.trigram_dir_, name, docs, postings)
+    finally:
+      for s in segments:
+        s.close()
+
+    logging.debug(f'merged {len(segments)} segments into {name}')
+
+    toc = dict(toc)
+    toc['next_segment'] += 1
+
+    if len(kept) == 0:
+      toc['segments'] = [{'name': name, 'base': 0, 'deleted': None}]
+      toc['next_docid'] = len(docs)
+    else:
+      toc['segments'] = kept + [{
+          'name': name,
+          'base': toc['next_docid'],
+          'deleted': None
+      }]
+      toc['next_docid'] += len(docs)
+
+    return toc
+
+  def compact(self):
+    if self.writer_ is not None:
+      raise ValueError('can not compact index while writing')
+
+    self.__lock()
+    try:
+      self.toc_ = None
+      self.__load_toc()
+
+      toc = self.toc_
+      if len(toc['segments']) > 1 or any(
+          s.live_doc_count < s.doc_count for s in self.segments_):
+        logging.info(f'compact index in {self.trigram_dir_}')
+
+        toc = self.__merge_segments(toc)
+        toc['generation'] += 1
+
+        self.__write_toc(toc)
+        self.__remove_unused_files(toc)
+    finally:
+      self.__unlock()
+
+    self.__load_toc()
+
+  def segment_stats(self):
+    size = 0
+    for f in os.listdir(self.trigram_dir_):
+      size += os.path.getsize(self.__path(f))
+
+    with self.__acquire() as segments:
+      doc_count = sum(s.doc_count for s in segments)
+      live_doc_count = sum(s.live_doc_count for s in segments)
+
+    return {
+        'segments': len(segments),
+        'documents': live_doc_count,
+        'deleted': doc_count - live_doc_count,
+        'size': size
+    }
+
+  def __remove_unused_files(self, toc):
+    used = set([TOC_FILE, LOCK_FILE])
+
+    for s in toc['segments']:
+      used.update(segment_files(s['name'], s['deleted']))
+
+    for f in os.listdir(self.trigram_dir_):
+      if f in used:
+        continue
+
+      try:
+        os.remove(self.__path(f))
+      except OSError:
+        logging.exception(f'failed remove unused index file:{f}')
+
+  def query(self, path, content, ignore_case=True, raw_pattern=False):
+    if path is None and content is None:
+      raise ValueError('must provide either path or content to search')
+
+    path_matcher = _path_matcher(path, ignore_case, raw_pattern)
+    plan = _content_plan(content, ignore_case, raw_pattern)
+
+    logging.debug(f'query path:{path}, content plan:{plan}')
+
+    lease = self.__acquire()
+    search = lambda after=-1: self.__search(lease.segments, plan,
+                                            path_matcher, after)
+
+    return QueryResult(search(), path, ignore_case, raw_pattern, search,
+                       lease.generation, lease)
+
+  def estimate(self, path, content, ignore_case=True, raw_pattern=False):
+    with self.__acquire() as segments:
+      total = sum(segment.live_doc_count for segment in segments)
+
+      plan = _content_plan(content, ignore_case, raw_pattern)
+      estimate = estimate_plan(
+          plan, lambda t: sum(s.doc_frequency(t) for s in segments), total)
+
+      # paths are not indexed, they are matched against the documents, the
+      # planner only compares the estimate with its share of the documents,
+      # so counting stops once that is passed
+      path_matcher = _path_matcher(path, ignore_case, raw_pattern)
+      if path_matcher is not None and estimate > 0:
+        matching = (1 for segment in segments
+                    for _, doc in segment.live_docs() if path_matcher(doc[0]))
+        estimate = sum(
+            islice(matching, min(estimate,
+                                 int(total * MAX_CANDIDATE_RATIO) + 1)))
+
+    return estimate, total
+
+  def __search(self, segments, plan, path_matcher, after=-1):
+    # docnums are the global docids, merged segments get new ones after
+    # all the others
+    for segment in sorted(segments, key=lambda s: s.base):
+      if segment.base + segment.doc_count <= after + 1:
+        continue
+
+      local_ids = _evaluate_plan(plan, segment)
+
+      if local_ids is None:
+        local_ids = range(segment.doc_count)
+      else:
+        local_ids = sorted(local_ids)
+
+      for local_id in local_ids:
+        if local_id in segment.deleted or segment.base + local_id <= after:
+          continue
+
+        p, create_time, modified_time = segment.doc(local_id)
+
+        if path_matcher is not None and not path_matcher(p):
+          continue
+
+        yield {
+            'path': p,
+            'create_time': _datetime(create_time),
+            'modified_time': _datetime(modified_time),
+            'docnum': segment.base + local_id
+        }
+
+  def delete_path(self, path):
+    if path is None:
+      raise ValueError('must provide path to delete')
+
+    pattern = re.compile(path)
+
+    return self.writer_.delete_matching(
+        lambda p, _: pattern.search(p) is not None)
+
+  def delete_document(self, path):
+    self.writer_.delete(path)
+
+  def delete_prefix(self, path):
+    prefix = path.rstrip('/') + '/'
+
+    for p in list(self.writer_.roots.keys()):
+      if p == path or p.startswith(prefix):
+        del self.writer_.roots[p]
+
+    return self.writer_.delete_matching(
+        lambda p, _: p == path or p.startswith(prefix))
+
+  def touch_path(self, path, modified_time):
+    if path is None:
+      path = list(self.writer_.roots.keys())
+    else:
+      path = [path]
+
+    for p in path:
+      pp = pathlib.Path(p)
+
+      if not pp.exists():
+        continue
+
+      logging.debug(
+          f'update indexed path:{pp.resolve().as_posix()} modified time')
+      self.writer_.roots[pp.resolve().as_posix()] = [
+          pp.stat().st_ctime, _timestamp(modified_time)
+      ]
+
+  def list_indexed_path(self):
+    return [(p, _datetime(times[1]))
+            for p, times in self.toc_['roots'].items()]
+
+  def list_documents(self):
+    with self.__acquire() as segments:
+      for segment in segments:
+        for _, (p, create_time, modified_time) in segment.live_docs():
+          yield (p, _datetime(create_time), _datetime(modified_time))
+
+  def refresh_cache(self):
+    self.__load_toc()
+
+  def clear_non_exist(self, path):
+    v = path.as_posix()
+
+    exist_files = {}
+    delete_file_count = 0
+
+    def check_path(p, modified_time):
+      nonlocal delete_file_count
+
+      if not p.startswith(v):
+        return False
+
+      if not os.path.exists(p):
+        delete_file_count += 1
+        return True
+
+      exist_files[p] = _datetime(modified_time)
+      return False
+
+    self.writer_.delete_matching(check_path)
+
+    return exist_files, delete_file_count
+
+  def get_index_modified_time(self, path):
+    try:
+      return _datetime(self.toc_['roots'][path.as_posix()][1])
+    except KeyError:
+      return None
+
+
+def _path_matcher(path, ignore_case, raw_pattern):
+  '''
+  return a function telling whether a document path matches, None when all
+  do, the prefix of an anchored path is compared before the regex runs
+  '''
+  if path is None or path == '.*':
+    return None
+
+  path_pattern = re.escape(path) if raw_pattern else path
+  regex = re.compile(f'(?m){"(?i)" if ignore_case else ""}{path_pattern}')
+
+  prefix = None
+  if not raw_pattern and not ignore_case:
+    prefix = literal_prefix(path)
+
+  if prefix is None:
+    return lambda p: regex.search(p) is not None
+
+  return lambda p: p.startswith(prefix) and regex.search(p) is not None
+
+
+def _content_plan(content, ignore_case, raw_pattern):
+  if content is None:
+    return ALL
+
+  if raw_pattern:
+    plan = literal_to_plan(content)
+  else:
+    plan = regexp_to_plan(f'(?m){"(?i)" if ignore_case else ""}{content}')
+
+  return ngram_plan(plan)
+
+
+def _evaluate_plan(plan, segment):
+  '''
+  return the local document ids of the segment satisfying the trigram plan,
+  None means every document
+  '''
+  if plan is ALL:
+    return None
+
+  if isinstance(plan, str):
+    return set(segment.postings(plan))
+
+  results = [_evaluate_plan(c, segment) for c in plan.children]
+
+  if isinstance(plan, And):
+    results = sorted([r for r in results if r is not None], key=len)
+
+    if len(results) == 0:
+      return None
+
+    return results[0].intersection(*results[1:])
+
+  if any(r is None for r in results):
+    return None
+
+  return set().union(*results)
+
+
+class _Writer(object):
+  '''
+  pending state of one begin_index/end_index session
+  '''
+
+  def __init__(self, index_dir, toc, segments):
+    super().__init__()
+
+    self.index_dir_ = index_dir
+    self.toc_ = toc
+    self.segments_ = segments
+    self.next_segment_ = toc['next_segment']
+    self.next_docid_ = toc['next_docid']
+    self.roots = dict(toc['roots'])
+
+    self.new_segments_ = []
+    self.deletes_ = defaultdict(set)
+    self.paths_ = None
+
+    self.__new_pending()
+
+  def __new_pending(self):
+    self.pending_name_ = f'seg_{self.next_segment_}'
+    self.next_segment_ += 1
+    self.pending_docs_ = []
+    self.pending_postings_ = defaultdict(list)
+
+  def __path_map(self):
+    # path -> (segment name, local id, modified time) for every live
+    # document, only built when the session adds or deletes documents
+    if self.paths_ is None:
+      self.paths_ = {}
+
+      for s in self.segments_:
+        for local_id, doc in s.live_docs():
+          self.paths_[doc[0]] = (s.name, local_id, doc[2])
+
+    return self.paths_
+
+  def add(self, path, create_time, modified_time, trigrams):
+    paths = self.__path_map()
+
+    if path in paths:
+      name, local_id, _ = paths[path]
+      self.deletes_[name].add(local_id)
+
+    local_id = len(self.pending_docs_)
+    self.pending_docs_.append((path, create_time, modified_time))
+
+    for t in trigrams:
+      self.pending_postings_[t].append(local_id)
+
+    paths[path] = (self.pending_name_, local_id, modified_time)
+
+    if len(self.pending_docs_) >= FLUSH_DOC_COUNT:
+      self.__flush()
+
+  def delete(self, path):
+    paths = self.__path_map()
+
+    if path in paths:
+      name, local_id, _ = paths.pop(path)
+      self.deletes_[name].add(local_id)
+
+  def delete_matching(self, func):
+    '''
+    delete every live document for which func(path, modified_time) is true,
+    return the number of deleted documents
+    '''
+    paths = self.__path_map()
+    count = 0
+
+    for p, (name, local_id, modified_time) in list(paths.items()):
+      if not func(p, modified_time):
+        continue
+
+      del paths[p]
+      self.deletes_[name].add(local_id)
+      count += 1
+
+    return count
+
+  def __flush(self):
+    if len(self.pending_docs_) == 0:
+      return
+
+    write_segment(self.index_dir_, self.pending_name_, self.pending_docs_,
+                  self.pending_postings_)
+
+    self.new_segments_.append((self.pending_name_, len(self.pending_docs_)))
+    logging.debug(
+        f'flush {len(self.pending_docs_)} documents into {self.pending_name_}'
+    )
+
+    self.__new_pending()
+
+  def commit(self):
+    self.__flush()
+
+    generation = self.toc_['generation'] + 1
+    segments = []
+    next_docid = self.next_docid_
+
+    def deleted_file(name, old_deleted, old_file):
+      deleted = self.deletes_.get(name)
+
+      if not deleted:
+        return old_file
+
+      file_name = f'{name}.{generation}.del'
+      write_deleted(self.index_dir_, file_name, old_deleted | deleted)
+
+      return file_name
+
+    for s in self.segments_:
+      if s.live_doc_count - len(self.deletes_.get(s.name, ())) <= 0:
+        continue
+
+      segments.append({
+          'name': s.name,
+          'base': s.base,
+          'deleted': deleted_file(s.name, s.deleted, s.deleted_file)
+      })
+
+    for name, count in self.new_segments_:
+      if count - len(self.deletes_.get(name, ())) <= 0:
+        continue
+
+      segments.append({
+          'name': name,
+          'base': next_docid,
+          'deleted': deleted_file(name, set(), None)
+      })
+      next_docid += count
+
+    return {
+        'generation': generation,
+        'next_segment': self.next_segment_,
+        'next_docid': next_docid,
+        'segments': segments,
+        'roots': self.roots
+    }
+
+  def cancel(self):
+    for name, _ in self.new_segments_:
+      for f in segment_files(name):
+        try:
+          os.remove(os.path.join(self.index_dir_, f))
+        except OSError:
+          pass
@@ -0,0 +1,241 @@
+import mmap
+import os
+import pickle
+import threading
+
+# a segment is an immutable set of documents written by one writer flush
+#
+#   <name>.docs   pickled list of (path, create_time, modified_time)
+#   <name>.lex    pickled dict of trigram -> (offset, length, count),
+#                 offset and length locate the postings in .post
+#   <name>.post   delta + varint encoded sorted local document ids,
+#                 memory mapped by readers
+#
+# deleted documents are recorded in <name>.<generation>.del files which
+# are rewritten by the writer, the segment itself never changes
+
+
+def encode_postings(ids):
+  out = bytearray()
+  last = 0
+
+  for i in ids:
+    v = i - last
+    last = i
+
+    while v >= 0x80:
+      out.append((v & 0x7F) | 0x80)
+      v >>= 7
+
+    out.append(v)
+
+  return bytes(out)
+
+
+def decode_postings(buf, offset, length):
+  ids = []
+  last = 0
+  v = 0
+  shift = 0
+
+  for b in buf[offset:offset + length]:
+    v |= (b & 0x7F) << shift
+
+    if b & 0x80:
+      shift += 7
+      continue
+
+    last += v
+    ids.append(last)
+    v = 0
+    shift = 0
+
+  return ids
+
+
+def write_segment(index_dir, name, docs, postings):
+  lexicon = {}
+
+  with open(os.path.join(index_dir, f'{name}.post'), 'wb') as f:
+    offset = 0
+
+    for trigram in sorted(postings):
+      ids = postings[trigram]
+      data = encode_postings(ids)
+      f.write(data)
+
+      lexicon[trigram] = (offset, len(data), len(ids))
+      offset += len(data)
+
+  with open(os.path.join(index_dir, f'{name}.lex'), 'wb') as f:
+    pickle.dump(lexicon, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+  with open(os.path.join(index_dir, f'{name}.docs'), 'wb') as f:
+    pickle.dump(docs, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_deleted(index_dir, file_name, deleted):
+  with open(os.path.join(index_dir, file_name), 'wb') as f:
+    pickle.dump(deleted, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def segment_files(name, deleted_file=None):
+  files = [f'{name}.docs', f'{name}.lex', f'{name}.post']
+
+  if deleted_file is not None:
+    files.append(deleted_file)
+
+  return files
+
+
+class Segment(object):
+
+  def __init__(self, index_dir, name, base, deleted_file=None):
+    super().__init__()
+
+    self.index_dir_ = index_dir
+    self.name_ = name
+    self.base_ = base
+    self.deleted_file_ = deleted_file
+    self.postings_ = b''
+    self.postings_file_ = None
+
+    # the reference of the index generation opening the segment, queries
+    # reading it take their own
+    self.refs_ = 1
+    self.refs_lock_ = threading.Lock()
+
+    self.__load()
+
+  def __path(self, file_name):
+    return os.path.join(self.index_dir_, file_name)
+
+  def __load(self):
+    with open(self.__path(f'{self.name_}.docs'), 'rb') as f:
+      self.docs_ = pickle.load(f)
+
+    with open(self.__path(f'{self.name_}.lex'), 'rb') as f:
+      self.lexicon_ = pickle.load(f)
+
+    if self.deleted_file_ is not None:
+      with open(self.__path(self.deleted_file_), 'rb') as f:
+        self.deleted_ = pickle.load(f)
+    else:
+      self.deleted_ = set()
+
+    self.postings_file_ = open(self.__path(f'{self.name_}.post'), 'rb')
+
+    if os.fstat(self.postings_file_.fileno()).st_size > 0:
+      self.postings_ = mmap.mmap(self.postings_file_.fileno(),
+                                 0,
+                                 access=mmap.ACCESS_READ)
+
+  def retain(self):
+    with self.refs_lock_:
+      if self.refs_ == 0:
+        raise ValueError(f'segment {self.name_} is closed')
+
+      self.refs_ += 1
+
+  def release(self):
+    '''
+    drop a reference, the postings are unmapped with the last one
+    '''
+    with self.refs_lock_:
+      self.refs_ -= 1
+
+      if self.refs_ > 0:
+        return
+
+    self.close()
+
+  def close(self):
+    if isinstance(self.postings_, mmap.mmap):
+      self.postings_.close()
+
+    self.postings_ = b''
+
+    if self.postings_file_ is not None:
+      self.postings_file_.close()
+      self.postings_file_ = None
+
+  @property
+  def name(self):
+    return self.name_
+
+  @property
+  def base(self):
+    return self.base_
+
+  @property
+  def deleted_file(self):
+    return self.deleted_file_
+
+  @property
+  def deleted(self):
+    return self.deleted_
+
+  @property
+  def doc_count(self):
+    return len(self.docs_)
+
+  @property
+  def live_doc_count(self):
+    return len(self.docs_) - len(self.deleted_)
+
+  def doc(self, local_id):
+    return self.docs_[local_id]
+
+  def live_docs(self):
+    for local_id, doc in enumerate(self.docs_):
+      if local_id not in self.deleted_:
+        yield local_id, doc
+
+  def trigrams(self):
+    return self.lexicon_.keys()
+
+  def postings(self, trigram):
+    try:
+      offset, length, _ = self.lexicon_[trigram]
+    except KeyError:
+      return []
+
+    return decode_postings(self.postings_, offset, length)
+
+  def doc_frequency(self, trigram):
+    try:
+      return self.lexicon_[trigram][2]
+    except KeyError:
+      return 0
+
+
+class SegmentLease(object):
+  '''
+  references on the segments of one index generation, they stay open
+  until every lease on them is closed
+  '''
+
+  def __init__(self, generation, segments):
+    super().__init__()
+
+    self.generation = generation
+    self.segments = segments
+    self.closed_ = False
+
+    for s in self.segments:
+      s.retain()
+
+  def close(self):
+    if self.closed_:
+      return
+
+    self.closed_ = True
+
+    for s in self.segments:
+      s.release()
+
+  def __enter__(self):
+    return self.segments
+
+  def __exit__(self, *exc_info):
+    self.close()
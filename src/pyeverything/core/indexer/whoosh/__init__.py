@@ -1,212 +1,295 @@
-import logging
-import datetime
-import pathlib
-import re
-from binaryornot.check import is_binary
-
-from whoosh.fields import Schema, ID, DATETIME, NGRAM, KEYWORD
-from whoosh import index
-from whoosh.filedb.filestore import FileStorage
-from whoosh.qparser import MultifieldParser
-
-from .. import IndexerImpl
-from .query_result import QueryResult
-from .regexp import regexp_to_query
-
-FILE_INDEXING_SCHEMA = Schema(path=ID(stored=True, unique=True),
-                              content=NGRAM(minsize=1, maxsize=3),
-                              path_content=NGRAM(minsize=1, maxsize=3),
-                              tag=KEYWORD,
-                              create_time=DATETIME(stored=True),
-                              modified_time=DATETIME(stored=True))
-
-
-class WhooshIndexerImpl(IndexerImpl):
-
-  def __init__(self, data_path):
-    super().__init__(data_path)
-
-    self.__initialize()
-
-  def __initialize(self):
-    self.storage_ = FileStorage(self.index_dir_)
-
-    if index.exists_in(self.index_dir_):
-      self.index_ = self.storage_.open_index(schema=FILE_INDEXING_SCHEMA)
-      logging.debug(f'open existing index in {self.index_dir_}')
-    else:
-      self.index_ = self.storage_.create_index(FILE_INDEXING_SCHEMA)
-      logging.debug(f'create new index in {self.index_dir_}')
-
-    self.writer_ = None
-
-  def add_document(self, path, full_indexing=False):
-    if self.writer_ is None:
-      return
-
-    content = ''
-    if not is_binary(path.resolve().as_posix()):
-      try:
-        content = path.read_text(encoding='utf-8', errors='ignore')
-      except:
-        logging.exception(f'failed read content:{path.resolve().as_posix()}')
-        return
-
-    self.writer_.update_document(
-        path=path.resolve().as_posix(),
-        path_content=path.resolve().as_posix(),
-        create_time=datetime.datetime.fromtimestamp(path.stat().st_ctime),
-        modified_time=datetime.datetime.fromtimestamp(path.stat().st_mtime),
-        content=content)
-
-  def begin_index(self):
-    if self.writer_ is not None:
-      return
-
-    self.writer_ = self.index_.writer(proc=4, limitmb=512, multisegment=True)
-
-  def end_index(self, index_updated=True):
-    if self.writer_ is None:
-      return
-
-    logging.info(f'index updated:{index_updated}')
-
-    if index_updated:
-      self.writer_.commit(optimize=True)
-    else:
-      self.writer_.cancel()
-
-    self.writer_ = None
-
-  def query(self, path, content, ignore_case=True, raw_pattern=False):
-    if path is None and content is None:
-      raise ValueError('must provide either path or content to search')
-
-    fields = []
-
-    origin_path = path
-    use_raw_match = raw_pattern
-
-    query_str = "NOT tag:'indexed_path'"
-
-    if path is not None:
-      fields.append('path_content')
-
-      if not use_raw_match:
-        path_query_str = regexp_to_query(
-            f'(?m){"(?i)" if ignore_case else ""}{path}', 1)
-      else:
-        path_query_str = path
-
-      if len(path_query_str) == 0:
-        logging.warning(f'unable to parse path query:{path} as regex')
-        path_query_str = path
-
-      if path != '.*':
-        query_str += f' path_content:{path_query_str}'
-
-    if content is not None:
-      fields.append('content')
-
-      if not use_raw_match:
-        content_query_str = regexp_to_query(
-            f'(?m){"(?i)" if ignore_case else ""}{content}', 1)
-      else:
-        content_query_str = content
-
-      if len(content_query_str) == 0:
-        logging.warning(f'unable to parse content query:{content} as regex')
-        content_query_str = content
-      query_str += f' content:{content_query_str}'
-
-    qp = MultifieldParser(fields, schema=self.index_.schema)
-
-    query = qp.parse(query_str)
-
-    logging.debug(f'query str:{query_str}, query_parsed:{query}')
-
-    return QueryResult(self.index_.searcher(), query, origin_path, ignore_case,
-                       use_raw_match)
-
-  def delete_path(self, path):
-    if path is None:
-      raise ValueError('must provide path to delete')
-
-    results = self.query(path, None)
-
-    pattern = re.compile(path)
-
-    for hit in results.query():
-      p = pathlib.Path(hit['path'])
-
-      if pattern.search(p.as_posix()) is None:
-        continue
-
-      self.writer_.delete_by_term('path', p.as_posix())
-
-  def touch_path(self, path, modified_time):
-    if path is None:
-      indexed_path = self.list_indexed_path()
-
-      path = [x[0] for x in indexed_path]
-    else:
-      path = [path]
-
-    for p in path:
-      pp = pathlib.Path(p)
-
-      if not pp.exists():
-        continue
-
-      logging.debug(
-          f'update indexed path:{pp.resolve().as_posix()} modified time')
-      self.writer_.update_document(path=pp.resolve().as_posix(),
-                                   create_time=datetime.datetime.fromtimestamp(
-                                       pp.stat().st_ctime),
-                                   modified_time=modified_time,
-                                   content='',
-                                   tag='indexed_path')
-
-  def list_indexed_path(self):
-    try:
-      with self.index_.searcher() as sr:
-        return [(fields['path'], fields['modified_time'])
-                for fields in sr.documents(tag='indexed_path')]
-    except:
-      logging.exception('failed')
-      return []
-
-  def refresh_cache(self):
-    if not self.index_.up_to_date():
-      self.index_ = self.index_.refresh()
-
-  def clear_non_exist(self, path):
-    v = path.as_posix()
-
-    results = self.query(v, None)
-
-    exist_files = {}
-    delete_file_count = 0
-
-    for hit in results.query():
-      p = pathlib.Path(hit['path'])
-
-      if not p.as_posix().startswith(v):
-        continue
-
-      if not p.exists():
-        self.writer_.delete_by_term('path', p.as_posix())
-        delete_file_count += 1
-      else:
-        exist_files[p.as_posix()] = hit['modified_time']
-
-    return exist_files, delete_file_count
-
-  def get_index_modified_time(self, path):
-    try:
-      with self.index_.searcher() as sr:
-        for fields in sr.documents(tag='indexed_path'):
-          if fields['path'] == path.as_posix():
-            return fields['modified_time']
-    except:
-      return None
+import logging
+import datetime
+import pathlib
+import re
+
+from whoosh.fields import Schema, ID, DATETIME, NGRAM, KEYWORD
+from whoosh import index
+from whoosh.filedb.filestore import FileStorage
+from whoosh.query import Or, Prefix, Term
+
+from .. import IndexerImpl
+from ..document import as_document
+from .query_result import QueryResult
+from .query_plan import document_query, plan_query, term_plan
+from .searcher_pool import SearcherPool
+from pyeverything.core.regexp_plan import estimate_plan, literal_prefix
+
+FILE_INDEXING_SCHEMA = Schema(path=ID(stored=True, unique=True),
+                              content=NGRAM(minsize=1, maxsize=3),
+                              path_content=NGRAM(minsize=1, maxsize=3),
+                              tag=KEYWORD,
+                              create_time=DATETIME(stored=True),
+                              modified_time=DATETIME(stored=True))
+
+# seconds compact() waits for the writer of another process
+COMPACT_LOCK_TIMEOUT = 5.0
+
+
+class WhooshIndexerImpl(IndexerImpl):
+
+  def __init__(self, data_path):
+    super().__init__(data_path)
+
+    self.__initialize()
+
+  def __initialize(self):
+    self.storage_ = FileStorage(self.index_dir_)
+
+    if index.exists_in(self.index_dir_):
+      self.index_ = self.storage_.open_index(schema=FILE_INDEXING_SCHEMA)
+      logging.debug(f'open existing index in {self.index_dir_}')
+    else:
+      self.index_ = self.storage_.create_index(FILE_INDEXING_SCHEMA)
+      logging.debug(f'create new index in {self.index_dir_}')
+
+    # the queries share a searcher until the writer commits
+    self.searchers_ = SearcherPool(self.index_)
+    self.writer_ = None
+
+  def add_document(self, path, full_indexing=False):
+    if self.writer_ is None:
+      return
+
+    document = as_document(path)
+
+    if document is None:
+      return
+
+    self.writer_.update_document(
+        path=document.path,
+        path_content=document.path,
+        create_time=datetime.datetime.fromtimestamp(document.create_time),
+        modified_time=datetime.datetime.fromtimestamp(document.modified_time),
+        content=document.content)
+
+  def begin_index(self):
+    if self.writer_ is not None:
+      return
+
+    self.writer_ = self.index_.writer(proc=4, limitmb=512, multisegment=True)
+
+  def end_index(self, index_updated=True):
+    if self.writer_ is None:
+      return
+
+    logging.info(f'index updated:{index_updated}')
+
+    if index_updated:
+      # only writers need it
+      from whoosh.writing import MERGE_SMALL
+
+      # only small segments are merged here, a full merge rewrites the
+      # whole index and is left to compact()
+      self.writer_.commit(mergetype=MERGE_SMALL)
+    else:
+      self.writer_.cancel()
+
+    self.writer_ = None
+
+  def query(self, path, content, ignore_case=True, raw_pattern=False):
+    if path is None and content is None:
+      raise ValueError('must provide either path or content to search')
+
+    queries = []
+
+    if path is not None and path != '.*':
+      queries.append(
+          plan_query('path_content', path, ignore_case, raw_pattern))
+
+      # an anchored path looks up the range of the path terms
+      prefix = None
+      if not raw_pattern and not ignore_case:
+        prefix = literal_prefix(path)
+
+      if prefix is not None:
+        queries.append(Prefix('path', prefix))
+
+    if content is not None:
+      queries.append(plan_query('content', content, ignore_case, raw_pattern))
+
+    query = document_query(queries)
+
+    logging.debug(f'query path:{path}, content:{content}, query:{query}')
+
+    return QueryResult(self.searchers_.acquire(), query, path, ignore_case,
+                       raw_pattern)
+
+  def estimate(self, path, content, ignore_case=True, raw_pattern=False):
+    patterns = []
+
+    if path is not None and path != '.*':
+      patterns.append(('path_content', path))
+
+    if content is not None:
+      patterns.append(('content', content))
+
+    with self.searchers_.acquire() as sr:
+      roots = len(list(sr.documents(tag='indexed_path')))
+      total = max(0, sr.doc_count() - roots)
+
+      estimate = total
+      for field, pattern in patterns:
+        plan = term_plan(pattern, ignore_case, raw_pattern)
+        estimate = min(
+            estimate,
+            estimate_plan(plan, lambda t: sr.doc_frequency(field, t), total))
+
+    return estimate, total
+
+  def delete_path(self, path):
+    if path is None:
+      raise ValueError('must provide path to delete')
+
+    results = self.query(path, None)
+
+    pattern = re.compile(path)
+    delete_file_count = 0
+
+    try:
+      for hit in results.iter_hits():
+        p = pathlib.Path(hit['path'])
+
+        if pattern.search(p.as_posix()) is None:
+          continue
+
+        self.writer_.delete_by_term('path', p.as_posix())
+        delete_file_count += 1
+    finally:
+      results.close()
+
+    return delete_file_count
+
+  def delete_document(self, path):
+    self.writer_.delete_by_term('path', path)
+
+  def delete_prefix(self, path):
+    prefix = path.rstrip('/') + '/'
+    roots = [
+        p for p, _ in self.list_indexed_path()
+        if p == path or p.startswith(prefix)
+    ]
+
+    # the prefix query enumerates the path terms, no document is scored
+    query = Or([Term('path', path), Prefix('path', prefix)])
+
+    # the indexed path markers are not counted as documents
+    return self.writer_.delete_by_query(query) - len(roots)
+
+  def touch_path(self, path, modified_time):
+    if path is None:
+      indexed_path = self.list_indexed_path()
+
+      path = [x[0] for x in indexed_path]
+    else:
+      path = [path]
+
+    for p in path:
+      pp = pathlib.Path(p)
+
+      if not pp.exists():
+        continue
+
+      logging.debug(
+          f'update indexed path:{pp.resolve().as_posix()} modified time')
+      self.writer_.update_document(path=pp.resolve().as_posix(),
+                                   create_time=datetime.datetime.fromtimestamp(
+                                       pp.stat().st_ctime),
+                                   modified_time=modified_time,
+                                   content='',
+                                   tag='indexed_path')
+
+  def list_indexed_path(self):
+    try:
+      with self.searchers_.acquire() as sr:
+        return [(fields['path'], fields['modified_time'])
+                for fields in sr.documents(tag='indexed_path')]
+    except:
+      logging.exception('failed')
+      return []
+
+  def list_documents(self):
+    roots = set([x[0] for x in self.list_indexed_path()])
+
+    with self.searchers_.acquire() as sr:
+      for _, fields in sr.reader().iter_docs():
+        if fields['path'] in roots:
+          continue
+
+        yield (fields['path'], fields.get('create_time'),
+               fields.get('modified_time'))
+
+  def compact(self):
+    if self.writer_ is not None:
+      raise ValueError('can not compact index while writing')
+
+    logging.info(f'compact index in {self.index_dir_}')
+
+    try:
+      writer = self.index_.writer(timeout=COMPACT_LOCK_TIMEOUT)
+    except index.LockError:
+      # another process is writing, the compaction is asked for again later
+      logging.info(f'index in {self.index_dir_} is locked, compaction skipped')
+      return
+
+    writer.commit(optimize=True)
+    self.refresh_cache()
+
+  def segment_stats(self):
+    segments = self.index_._segments()
+
+    # the markers of the indexed paths are not files
+    with self.searchers_.acquire() as sr:
+      roots = len(list(sr.documents(tag='indexed_path')))
+
+    size = 0
+    for name in self.storage_.list():
+      if name.startswith(self.index_.indexname) or name.startswith(
+          f'_{self.index_.indexname}'):
+        size += self.storage_.file_length(name)
+
+    return {
+        'segments': len(segments),
+        'documents': max(0,
+                         sum(s.doc_count() for s in segments) - roots),
+        'deleted': sum(s.deleted_count() for s in segments),
+        'size': size
+    }
+
+  def refresh_cache(self):
+    if not self.index_.up_to_date():
+      self.index_ = self.index_.refresh()
+
+  def clear_non_exist(self, path):
+    v = path.as_posix()
+
+    results = self.query(v, None)
+
+    exist_files = {}
+    delete_file_count = 0
+
+    try:
+      for hit in results.iter_hits():
+        p = pathlib.Path(hit['path'])
+
+        if not p.as_posix().startswith(v):
+          continue
+
+        if not p.exists():
+          self.writer_.delete_by_term('path', p.as_posix())
+          delete_file_count += 1
+        else:
+          exist_files[p.as_posix()] = hit['modified_time']
+    finally:
+      results.close()
+
+    return exist_files, delete_file_count
+
+  def get_index_modified_time(self, path):
+    try:
+      with self.searchers_.acquire() as sr:
+        for fields in sr.documents(tag='indexed_path'):
+          if fields['path'] == path.as_posix():
+            return fields['modified_time']
+    except:
+      return None
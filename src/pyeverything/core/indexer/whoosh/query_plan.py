@@ -0,0 +1,83 @@
+import functools
+
+from whoosh.query import And, Every, Or, Term
+
+from pyeverything.core import regexp_plan
+from pyeverything.core.regexp_plan import ALL, regexp_to_plan, literal_to_plan, make_and, map_literals, string_ngrams
+
+# the content and path_content fields are lowercased 1 to 3 grams, a literal
+# up to 3 chars is one term, a longer one is the and of its 3 grams
+NGRAM_SIZE = 3
+
+# an or with more children than this costs more to look up than the
+# documents it filters out, it is dropped which only loosens the query
+MAX_OR_FANOUT = 64
+
+
+def __literal_terms(s):
+  if len(s) <= NGRAM_SIZE:
+    return s
+
+  return make_and(string_ngrams(s, NGRAM_SIZE))
+
+
+@functools.lru_cache(maxsize=256)
+def term_plan(pattern, ignore_case=True, raw_pattern=False):
+  '''
+  the plan over the terms of the n-gram fields a text matching the pattern
+  contains, cached since helm sends the same patterns again
+  '''
+  if raw_pattern:
+    plan = literal_to_plan(pattern)
+  else:
+    plan = regexp_to_plan(f'(?m){"(?i)" if ignore_case else ""}{pattern}')
+
+  return map_literals(plan, __literal_terms)
+
+
+def __to_query(field, plan):
+  if plan is ALL:
+    return None
+
+  if isinstance(plan, str):
+    return Term(field, plan)
+
+  children = [__to_query(field, c) for c in plan.children]
+
+  if isinstance(plan, regexp_plan.And):
+    children = [c for c in children if c is not None]
+
+    if len(children) == 0:
+      return None
+
+    return And(children).normalize()
+
+  if any(c is None for c in children) or len(children) > MAX_OR_FANOUT:
+    return None
+
+  return Or(children).normalize()
+
+
+@functools.lru_cache(maxsize=256)
+def plan_query(field, pattern, ignore_case=True, raw_pattern=False):
+  '''
+  build the whoosh query a document has to match in field for the pattern
+  to match its text, None when the pattern does not constrain the field
+  '''
+  return __to_query(field, term_plan(pattern, ignore_case, raw_pattern))
+
+
+def document_query(queries):
+  '''
+  and the field queries together, the indexed path markers never match
+  '''
+  queries = [q for q in queries if q is not None]
+
+  if len(queries) == 0:
+    query = Every()
+  elif len(queries) == 1:
+    query = queries[0]
+  else:
+    query = And(queries).normalize()
+
+  return query - Term('tag', 'indexed_path')
@@ -1,32 +1,73 @@
-import pathlib
-import logging
+from whoosh.reading import TermNotFound
 
-from . import matching
-from pyeverything.core.regexp_match_utils import regexp_match_info
+from pyeverything.core.regexp_match_utils import match_info
+from ..query_result import make_cursor, order_hits, parse_cursor
 
 
 class QueryResult(object):
 
-  def __init__(self, searcher, query, origin_path, ignore_case, use_raw_match):
+  def __init__(self, lease, query, origin_path, ignore_case, use_raw_match):
+    '''
+    lease is a SearcherLease on the shared searcher, it is given back on close
+    '''
     super().__init__()
 
-    self.searcher_ = searcher
+    self.lease_ = lease
+    self.searcher_ = lease.searcher
     self.query_ = query
     self.origin_path_ = origin_path
     self.use_raw_match_ = use_raw_match
     self.ignore_case_ = ignore_case
 
   def close(self):
-    self.searcher_.close()
+    self.lease_.close()
 
   def query(self, limit=None):
     return self.searcher_.search(self.query_, limit=limit)
 
+  def iter_hits(self, order=None, cursor=None):
+    '''
+    yield the stored fields of the matching documents as the matcher finds
+    them, nothing is scored or collected unless the hits are ordered
+    '''
+    after = -1
+
+    if cursor is not None:
+      if order is not None:
+        raise ValueError('only hits in index order can be resumed')
+
+      after = parse_cursor(cursor, self.searcher_.reader().generation())
+
+    return order_hits(self.__hits(after), order)
+
+  def cursor(self, hit):
+    return make_cursor(self.searcher_.reader().generation(), hit['docnum'])
+
+  def __hits(self, after):
+    for sub_searcher, offset in self.searcher_.leaf_searchers():
+      if offset + sub_searcher.doc_count_all() <= after + 1:
+        continue
+
+      try:
+        matcher = self.query_.matcher(sub_searcher)
+      except TermNotFound:
+        continue
+
+      if after >= offset and matcher.is_active():
+        matcher.skip_to(after - offset + 1)
+
+      while matcher.is_active():
+        docnum = matcher.id()
+
+        fields = sub_searcher.stored_fields(docnum)
+        fields['docnum'] = offset + docnum
+        yield fields
+
+        matcher.next()
+
   def query_paged(self, page, page_len=10):
     return self.searcher_.search_page(self.query_, page, pagelen=page_len)
 
   def get_matching_info(self, hit, content):
-    if self.use_raw_match_:
-      return matching.get_matching_info(hit)
-    else:
-      return regexp_match_info(hit['path'], content, self.ignore_case_)
+    return match_info(hit['path'], content, self.ignore_case_,
+                      self.use_raw_match_)
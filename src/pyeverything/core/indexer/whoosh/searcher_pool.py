@@ -0,0 +1,116 @@
+import logging
+import threading
+
+
+class SearcherLease(object):
+  '''
+  a reference to the shared searcher of the pool, the searcher stays open
+  until every lease on it is closed
+  '''
+
+  def __init__(self, pool, entry):
+    super().__init__()
+
+    self.pool_ = pool
+    self.entry_ = entry
+    self.searcher = entry.searcher
+    self.closed_ = False
+
+  def close(self):
+    if self.closed_:
+      return
+
+    self.closed_ = True
+    self.pool_._release(self.entry_)
+
+  def __enter__(self):
+    return self.searcher
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+class _Entry(object):
+
+  def __init__(self, searcher):
+    super().__init__()
+
+    self.searcher = searcher
+    self.refs = 0
+
+
+class SearcherPool(object):
+  '''
+  one searcher shared by the queries of an index generation, a commit of
+  the writer is picked up by the next acquire
+  '''
+
+  def __init__(self, index):
+    super().__init__()
+
+    self.index_ = index
+    self.lock_ = threading.Lock()
+    self.current_ = None
+
+    # searchers of older generations which still have leases
+    self.retired_ = []
+
+  def __getstate__(self):
+    # the indexing process opens its own searchers
+    return {'index_': self.index_}
+
+  def __setstate__(self, state):
+    self.__init__(state['index_'])
+
+  def acquire(self):
+    with self.lock_:
+      self.__refresh()
+
+      self.current_.refs += 1
+      return SearcherLease(self, self.current_)
+
+  def __refresh(self):
+    if self.current_ is None:
+      self.current_ = _Entry(self.index_.searcher())
+      return
+
+    searcher = self.current_.searcher
+
+    if searcher.up_to_date():
+      return
+
+    if self.current_.refs == 0:
+      # refresh reuses the readers of the segments which did not change and
+      # closes the others, nobody else reads them
+      self.current_ = _Entry(searcher.refresh())
+    else:
+      self.retired_.append(self.current_)
+      self.current_ = _Entry(self.index_.searcher())
+
+    logging.debug(
+        f'searcher generation:{self.current_.searcher.reader().generation()}')
+
+  def _release(self, entry):
+    with self.lock_:
+      entry.refs -= 1
+
+      if entry.refs == 0 and entry in self.retired_:
+        self.retired_.remove(entry)
+        entry.searcher.close()
+
+  def close(self):
+    '''
+    close the searchers without leases, the others are closed when their
+    last lease is
+    '''
+    with self.lock_:
+      for entry in [self.current_] + self.retired_:
+        if entry is not None and entry.refs == 0:
+          entry.searcher.close()
+
+      self.retired_ = [e for e in self.retired_ if e.refs > 0]
+
+      if self.current_ is not None and self.current_.refs > 0:
+        self.retired_.append(self.current_)
+
+      self.current_ = None
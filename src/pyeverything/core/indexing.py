@@ -1,239 +1,887 @@
-import logging
-import datetime
-import sys
-import pathlib
-import multiprocessing as mp
-from multiprocessing import Process, Queue, Value
-from appdirs import AppDirs
-
-from .file_system_helper import walk_directory
-from .indexer import get_indexer_impl
-
-if sys.platform != 'win32':
-  try:
-    mp.set_start_method('forkserver')
-  except:
-    pass
-
-
-class Indexer(object):
-
-  def __init__(self, data_path=None, use_service=True):
-    super().__init__()
-
-    self.appdirs_ = AppDirs('pyeverything', 'angsto-tech')
-    self.data_path_ = data_path
-    self.data_queue_ = None
-    self.indexing_process_ = None
-    self.shutdown_ = Value('d', 0)
-    self.use_service_ = use_service
-
-    self.__initialize()
-
-  def __initialize(self):
-    if isinstance(self.data_path_, str):
-      self.data_path_ = pathlib.Path(self.data_path_)
-    elif self.data_path_ is None:
-      self.data_path_ = self.__get_default_datapath()
-
-    self.data_path_ = self.data_path_.expanduser().resolve()
-
-    self.data_path_.mkdir(parents=True, exist_ok=True)
-    logging.debug(
-        f'indexing data stored in {self.data_path_.resolve().as_posix()}')
-
-    self.indexer_impl_ = get_indexer_impl(self.data_path_)
-
-    if not self.use_service_:
-      self.data_queue_ = Queue()
-
-  def __get_default_datapath(self):
-    return pathlib.Path(self.appdirs_.user_config_dir) / 'cache'
-
-  def start(self):
-    if self.indexing_process_ is not None or not self.use_service_:
-      return
-
-    self.data_queue_ = Queue()
-    self.shutdown_.value = 0
-
-    self.indexing_process_ = Process(target=Indexer.indexing_func,
-                                     args=(self, ))
-    self.indexing_process_.start()
-
-  def stop(self):
-    if self.indexing_process_ is None or not self.use_service_:
-      return
-
-    self.shutdown_.value = 1
-    self.data_queue_.put_nowait(None)
-    self.indexing_process_.join()
-
-  def index(self, path, full_indexing=False):
-    if isinstance(path, str):
-      path = pathlib.Path(path)
-
-    self.data_queue_.put_nowait((path, full_indexing, False, None, False))
-
-    if not self.use_service_:
-      self.data_queue_.put_nowait(None)
-      Indexer.indexing_func(self)
-
-  def remove(self, path):
-    self.data_queue_.put_nowait((path, False, True, None, False))
-
-    if not self.use_service_:
-      self.data_queue_.put_nowait(None)
-      Indexer.indexing_func(self)
-
-  def query(self, path, content, ignore_case=True, raw_pattern=False):
-    return self.indexer_impl_.query(path, content, ignore_case, raw_pattern)
-
-  def touch(self, path, modify_time):
-    self.data_queue_.put_nowait((path, False, False, modify_time, False))
-
-    if not self.use_service_:
-      self.data_queue_.put_nowait(None)
-      Indexer.indexing_func(self)
-
-  def update(self, path):
-    if isinstance(path, str):
-      path = pathlib.Path(path)
-
-    self.data_queue_.put_nowait((path, False, False, None, True))
-
-    if not self.use_service_:
-      self.data_queue_.put_nowait(None)
-      Indexer.indexing_func(self)
-
-  def list_indexed_path(self):
-    return self.indexer_impl_.list_indexed_path()
-
-  def refresh_cache(self):
-    return self.indexer_impl_.refresh_cache()
-
-  def __remove_index_func(self, path):
-    logging.debug(f'remove index for: {path}')
-
-    self.indexer_impl_.begin_index()
-    try:
-      self.indexer_impl_.delete_path(path)
-    except:
-      logging.exception(f'error removing index:{path}')
-    finally:
-      self.indexer_impl_.end_index()
-      logging.debug(f'done remove index for: {path}')
-
-  def __touch_index_func(self, path, modified_time):
-    logging.debug(f'touch index for: {path}')
-
-    self.indexer_impl_.begin_index()
-    try:
-      self.indexer_impl_.touch_path(path, modified_time)
-    except:
-      logging.exception(f'error touch index:{path}')
-    finally:
-      self.indexer_impl_.end_index()
-      logging.debug(f'done touch index for: {path}')
-
-  @staticmethod
-  def indexing_func(indexer):
-    while True:
-      if indexer.shutdown_.value == 1:
-        logging.debug('1.quit indexing function process')
-        break
-
-      task = indexer.data_queue_.get()
-
-      if task is None or indexer.shutdown_.value == 1:
-        logging.debug('2.quit indexing function process')
-        break
-
-      path, full_indexing, remove, touch, update = task
-
-      if remove:
-        indexer.__remove_index_func(path)
-        continue
-
-      if touch is not None:
-        indexer.__touch_index_func(path, touch)
-        continue
-
-      index_updated = False
-      delete_file_count = 0
-      new_added_file_count = 0
-
-      try:
-        path = path.resolve()
-
-        modified_time = None
-        exist_files = {}
-
-        logging.info(f'indexing path:{path.as_posix()}, update:{update}')
-
-        if update:
-          indexer.indexer_impl_.begin_index()
-          exist_files, delete_file_count = indexer.indexer_impl_.clear_non_exist(path)
-          modified_time = indexer.indexer_impl_.get_index_modified_time(path)
-          index_updated = index_updated or (delete_file_count > 0)
-
-        if path.is_dir() and path.exists():
-          entries = walk_directory(path)
-        elif path.is_file() and path.exists():
-          entries = [path]
-        else:
-          logging.warning(
-              f'get a index request with invalid path:{path.as_posix()}')
-          continue
-
-        logging.debug(f'begin index for: {path.as_posix()}')
-
-        if not update:
-          indexer.indexer_impl_.begin_index()
-
-        for entry in entries:
-          if indexer.shutdown_.value == 1:
-            logging.debug('3.quit indexing function process')
-            break
-
-          e_mtime = datetime.datetime.fromtimestamp(entry.stat().st_mtime)
-          if modified_time is not None and e_mtime <= modified_time:
-            skip_file = True
-
-            try:
-              s_mtime = exist_files[entry.as_posix()]
-
-              if s_mtime < e_mtime:
-                skip_file = False
-            except (KeyError):
-              skip_file = False
-
-            if skip_file:
-              logging.debug(
-                  f'skip {entry.as_posix()} since not modified, {e_mtime} < {modified_time}'
-              )
-              continue
-
-          logging.debug(f'indexing document:{entry.as_posix()}')
-          indexer.indexer_impl_.add_document(entry, full_indexing)
-          index_updated = True
-          new_added_file_count += 1
-
-        indexer.indexer_impl_.touch_path(path.as_posix(),
-                                         datetime.datetime.now())
-      except:
-        logging.exception(f'failed index {task}')
-      finally:
-        indexer.indexer_impl_.end_index(index_updated)
-        logging.info(
-            f'index for: {path.as_posix() if not isinstance(path, str) else path} is done, deleted:{delete_file_count}, new files:{new_added_file_count}'
-        )
-
-
-if __name__ == '__main__':
-  ix = Indexer()
-
-  r = ix.query('core', 'editor')
-
-  for item in r.query():
-    print(item['path'])
+import logging
+import datetime
+import os
+import sys
+import pathlib
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .file_system_helper import file_entry, walk_files, walk_git_files
+from .indexer import get_indexer_impl, get_indexer_backend, create_indexer_impl, set_indexer_backend
+from .indexer.document import load_document
+from .indexer.query_result import QueryResult
+from .indexer.migrate import migrate_index
+from .manifest import FileManifest
+from .pipeline import prefetch
+from .query_planner import plan_query
+from .regexp_match_utils import match_info
+from .regexp_plan import literal_prefix
+
+# a task is (path, full_indexing, remove, touch, update, files, compact)
+
+
+def default_data_path():
+  '''
+  the index location used when none is given
+  '''
+  from appdirs import AppDirs
+
+  appdirs = AppDirs('pyeverything', 'angsto-tech')
+
+  return pathlib.Path(appdirs.user_config_dir) / 'cache'
+
+
+def process_context():
+  '''
+  the multiprocessing context of the processes the service starts, it does
+  not fork the threads of the service, multiprocessing is only imported
+  when a process is started
+  '''
+  import multiprocessing as mp
+
+  return mp.get_context('spawn' if sys.platform == 'win32' else 'forkserver')
+
+
+class _LocalValue(object):
+  '''
+  the shutdown flag when the indexing runs in this process
+  '''
+
+  def __init__(self, value):
+    super().__init__()
+
+    self.value = value
+
+
+def _task_kind(task):
+  path, full_indexing, remove, touch, update, files, compact = task
+
+  if compact:
+    return 'compact'
+
+  if remove:
+    return 'remove'
+
+  if touch is not None:
+    return 'touch'
+
+  if files is not None:
+    return 'sync'
+
+  return 'update' if update else 'index'
+
+
+def _task_path(task):
+  path = task[0]
+
+  if isinstance(path, str):
+    path = pathlib.Path(path)
+
+  return path.resolve().as_posix()
+
+
+def _is_under(path, root):
+  return path == root or path.startswith(root.rstrip('/') + '/')
+
+
+def __covers(a_kind, a_path, b_kind, b_path):
+  # indexing a root re-adds everything under it but never removes what is
+  # gone, updating a root does both, so only updates cover update and sync
+  # tasks
+  if not _is_under(b_path, a_path):
+    return False
+
+  if a_kind == 'index':
+    return b_kind == 'index'
+
+  return a_kind == 'update' and b_kind in ('index', 'update', 'sync')
+
+
+def __coalesce_run(run):
+  items = []
+  sync_paths = {}
+
+  for task in run:
+    kind = _task_kind(task)
+    path = _task_path(task)
+
+    if kind == 'sync':
+      if path in sync_paths:
+        sync_paths[path].update(task[5])
+        continue
+
+      sync_paths[path] = set(task[5])
+
+    items.append((kind, path, task))
+
+  result = []
+  touched = []
+
+  for i, (kind, path, task) in enumerate(items):
+    covered_by = None
+
+    for j, (o_kind, o_path, _) in enumerate(items):
+      if i == j or not __covers(o_kind, o_path, kind, path):
+        continue
+
+      # of two identical tasks the first one is kept
+      if o_kind == kind and o_path == path and j > i:
+        continue
+
+      covered_by = o_path
+      break
+
+    if covered_by is None:
+      if kind == 'sync':
+        task = (task[0], False, False, None, False, sorted(sync_paths[path]),
+                False)
+
+      result.append(task)
+    elif kind == 'index' and covered_by != path:
+      # a nested root is still recorded as indexed
+      touched.append((path, False, False, datetime.datetime.now(), False,
+                      None, False))
+
+  return result + touched
+
+
+def coalesce_tasks(tasks):
+  '''
+  drop duplicated index and update tasks and the ones nested under another
+  queued root, and merge the sync tasks of the same root, remove and touch
+  tasks keep their position and split the batch into separate runs, a
+  single compact task is kept at the end
+  '''
+  result = []
+  run = []
+  compact = None
+
+  for task in tasks:
+    kind = _task_kind(task)
+
+    if kind == 'compact':
+      compact = task
+    elif kind in ('remove', 'touch'):
+      result.extend(__coalesce_run(run))
+      result.append(task)
+      run = []
+    else:
+      run.append(task)
+
+  result.extend(__coalesce_run(run))
+
+  if compact is not None:
+    result.append(compact)
+
+  return result
+
+
+def _writer_sessions(tasks):
+  '''
+  split the batch into the runs of tasks sharing one writer session, the
+  whoosh writer only deletes committed documents, so the documents added
+  are committed before a remove or touch task following them
+  '''
+  sessions = []
+  session = []
+  adding = False
+
+  for task in tasks:
+    kind = _task_kind(task)
+
+    if kind in ('remove', 'touch'):
+      if adding:
+        sessions.append(session)
+        session = []
+        adding = False
+    else:
+      adding = True
+
+    session.append(task)
+
+  if len(session) > 0:
+    sessions.append(session)
+
+  return sessions
+
+
+class Indexer(object):
+
+  def __init__(self,
+               data_path=None,
+               use_service=True,
+               backend=None,
+               batch_size=1000,
+               commit_latency=1.0,
+               read_workers=4,
+               read_queue_depth=64,
+               use_git_index=False):
+    super().__init__()
+
+    self.data_path_ = data_path
+    self.data_queue_ = None
+    self.indexing_process_ = None
+    self.shutdown_ = _LocalValue(0)
+    self.use_service_ = use_service
+    self.backend_ = backend
+    self.batch_size_ = batch_size
+    self.commit_latency_ = commit_latency
+    self.read_workers_ = read_workers
+    self.read_queue_depth_ = read_queue_depth
+    self.read_pool_ = None
+    self.use_git_index_ = use_git_index
+    self.batch_depth_ = 0
+    self.last_task_time_ = time.monotonic()
+    self.reports_ = None
+
+    self.__initialize()
+
+  def __initialize(self):
+    if isinstance(self.data_path_, str):
+      self.data_path_ = pathlib.Path(self.data_path_)
+    elif self.data_path_ is None:
+      self.data_path_ = self.__get_default_datapath()
+
+    self.data_path_ = self.data_path_.expanduser().resolve()
+
+    self.data_path_.mkdir(parents=True, exist_ok=True)
+    logging.debug(
+        f'indexing data stored in {self.data_path_.resolve().as_posix()}')
+
+    if self.backend_ is None:
+      self.backend_ = get_indexer_backend(self.data_path_)
+
+    self.indexer_impl_ = get_indexer_impl(self.data_path_, self.backend_)
+
+    self.manifest_ = FileManifest(self.data_path_)
+
+    if not self.use_service_:
+      self.data_queue_ = queue.Queue()
+
+  def __get_default_datapath(self):
+    return default_data_path()
+
+  def start(self):
+    if self.indexing_process_ is not None or not self.use_service_:
+      return
+
+    ctx = process_context()
+
+    self.data_queue_ = ctx.Queue()
+    self.shutdown_ = ctx.Value('d', 0)
+
+    self.indexing_process_ = ctx.Process(target=Indexer.indexing_func,
+                                         args=(self, ))
+    self.indexing_process_.start()
+
+  def stop(self):
+    if self.indexing_process_ is None or not self.use_service_:
+      return
+
+    self.shutdown_.value = 1
+    self.data_queue_.put_nowait(None)
+    self.indexing_process_.join()
+
+  def __put_task(self, task):
+    self.last_task_time_ = time.monotonic()
+    self.data_queue_.put_nowait(task)
+
+    if not self.use_service_ and self.batch_depth_ == 0:
+      self.data_queue_.put_nowait(None)
+      Indexer.indexing_func(self)
+
+  @contextmanager
+  def batch(self):
+    '''
+    without service the tasks queued inside the block run together in one
+    writer session when the block exits, the yielded list then holds the
+    (operation, path, document count) reports of the tasks
+    '''
+    reports = []
+
+    self.batch_depth_ += 1
+    if self.batch_depth_ == 1:
+      self.reports_ = reports
+
+    try:
+      yield reports
+    finally:
+      self.batch_depth_ -= 1
+
+      if not self.use_service_ and self.batch_depth_ == 0:
+        self.data_queue_.put_nowait(None)
+        Indexer.indexing_func(self)
+
+      if self.batch_depth_ == 0:
+        self.reports_ = None
+
+  def index(self, path, full_indexing=False):
+    if isinstance(path, str):
+      path = pathlib.Path(path)
+
+    self.__put_task((path, full_indexing, False, None, False, None, False))
+
+  def remove(self, path):
+    self.__put_task((path, False, True, None, False, None, False))
+
+  def sync_files(self, root, paths):
+    '''
+    re-index the given files of an indexed root, paths which do not exist
+    any more are removed from the index together with everything under them
+    '''
+    self.__put_task((root, False, False, None, False, paths, False))
+
+  def plan(self,
+           path,
+           content,
+           ignore_case=True,
+           raw_pattern=False,
+           resumable=False):
+    '''
+    a resumable plan gives hits which can be resumed with a cursor
+    '''
+    return plan_query(self.indexer_impl_, path, content, ignore_case,
+                      raw_pattern, allow_scan=not resumable)
+
+  def query(self,
+            path,
+            content,
+            ignore_case=True,
+            raw_pattern=False,
+            plan=None):
+    '''
+    the hits are candidates the path and content patterns still have to be
+    matched against, a plan from plan() is made when none is given
+    '''
+    if plan is None:
+      plan = self.plan(path, content, ignore_case, raw_pattern)
+
+    logging.debug(f'query path:{path}, content:{content}, plan:{plan}')
+
+    if plan.strategy == 'scan':
+      return QueryResult(self.__scan(path, content, ignore_case, raw_pattern),
+                         path, ignore_case, raw_pattern)
+
+    if plan.strategy == 'path':
+      return self.indexer_impl_.query(path, None, ignore_case, raw_pattern)
+
+    return self.indexer_impl_.query(path, content, ignore_case, raw_pattern)
+
+  def __scan(self, path, content, ignore_case, raw_pattern):
+    '''
+    yield the indexed documents with matching path and content, the files
+    are read and matched in the read pool, the same documents as the index
+    strategies would give, only without looking up the content, the hits
+    carry their match info so the files are not read again to verify them
+    '''
+    flags = f'(?m){"(?i)" if ignore_case else ""}'
+
+    path_matcher = None
+    if path is not None and path != '.*':
+      path_matcher = re.compile(flags +
+                                (re.escape(path) if raw_pattern else path))
+
+    # an anchored path is compared before the regex runs
+    prefix = None
+    if path_matcher is not None and not raw_pattern and not ignore_case:
+      prefix = literal_prefix(path)
+
+    def entries():
+      for doc in self.indexer_impl_.list_documents():
+        p = doc[0]
+
+        if prefix is not None and not p.startswith(prefix):
+          continue
+
+        if path_matcher is not None and path_matcher.search(p) is None:
+          continue
+
+        yield doc
+
+    def match(doc):
+      # binary files are indexed without content, they never match
+      try:
+        if is_binary(doc[0]):
+          return []
+
+        return list(match_info(doc[0], content, ignore_case, raw_pattern))
+      except:
+        logging.exception(f'failed read content:{doc[0]}')
+        return []
+
+    def hit(doc, matching_info):
+      p, create_time, modified_time = doc
+
+      return {
+          'path': p,
+          'create_time': create_time,
+          'modified_time': modified_time,
+          'matching_info': matching_info
+      }
+
+    # slow to import, only indexing and scanning read files
+    from binaryornot.check import is_binary
+
+    if self.read_workers_ <= 0:
+      for doc in entries():
+        matching_info = match(doc)
+        if len(matching_info) > 0:
+          yield hit(doc, matching_info)
+      return
+
+    with ThreadPoolExecutor(max_workers=self.read_workers_) as pool:
+      for doc, matching_info in prefetch(pool, match, entries(),
+                                         max(1, self.read_queue_depth_)):
+        if len(matching_info) > 0:
+          yield hit(doc, matching_info)
+
+  def touch(self, path, modify_time):
+    self.__put_task((path, False, False, modify_time, False, None, False))
+
+  def update(self, path):
+    if isinstance(path, str):
+      path = pathlib.Path(path)
+
+    self.__put_task((path, False, False, None, True, None, False))
+
+  def compact(self):
+    '''
+    merge all index segments into one after the queued tasks are done
+    '''
+    self.__put_task((None, False, False, None, False, None, True))
+
+  def segment_stats(self):
+    return self.indexer_impl_.segment_stats()
+
+  def idle_time(self):
+    '''
+    seconds since the last task was queued
+    '''
+    return time.monotonic() - self.last_task_time_
+
+  def list_indexed_path(self):
+    return self.indexer_impl_.list_indexed_path()
+
+  def refresh_cache(self):
+    return self.indexer_impl_.refresh_cache()
+
+  def backend(self):
+    return self.backend_
+
+  def migrate(self, backend):
+    target = create_indexer_impl(self.data_path_, backend)
+
+    logging.info(f'migrate index in {self.data_path_.as_posix()} to {backend}')
+    document_count = migrate_index(self.indexer_impl_, target)
+
+    set_indexer_backend(self.data_path_, backend)
+    self.indexer_impl_ = target
+    self.backend_ = backend
+
+    return document_count
+
+  def __report(self, op, path, count):
+    if self.reports_ is not None:
+      self.reports_.append((op, path, count))
+
+  def __remove_index_func(self, path):
+    if isinstance(path, str):
+      path = pathlib.Path(path)
+
+    path = path.expanduser().resolve().as_posix()
+
+    logging.debug(f'remove index for: {path}')
+
+    delete_file_count = self.indexer_impl_.delete_prefix(path)
+
+    # files reached through links are stored outside of the removed roots
+    for p in self.manifest_.remove_prefix(path):
+      self.indexer_impl_.delete_document(p)
+      delete_file_count += 1
+
+    logging.info(
+        f'remove index for: {path} is done, deleted:{delete_file_count}')
+    self.__report('remove', path, delete_file_count)
+
+    return True
+
+  def __touch_index_func(self, path, modified_time):
+    logging.debug(f'touch index for: {path}')
+
+    self.indexer_impl_.touch_path(path, modified_time)
+
+    logging.debug(f'done touch index for: {path}')
+    return True
+
+  def __walk_files(self, path):
+    if self.use_git_index_:
+      return walk_git_files(path)
+
+    return walk_files(path)
+
+  def __load_documents(self, entries, digest=False):
+    '''
+    yield (entry, document) for the FileEntry records, the files are read
+    and classified ahead by the read pool while the writer indexes
+    '''
+    func = lambda e: load_document(e.real_path, e.stat, digest)
+
+    if self.read_pool_ is None:
+      for e in entries:
+        yield e, func(e)
+      return
+
+    yield from prefetch(self.read_pool_, func, entries,
+                        self.read_queue_depth_)
+
+  def __sync_files_func(self, root, paths):
+    logging.debug(f'sync {len(paths)} files for: {root}')
+
+    index_updated = False
+    scan_done = False
+
+    # roots indexed before the manifest existed are left to a full update
+    has_manifest = self.manifest_.has_root(root)
+
+    def changed_files():
+      nonlocal index_updated
+
+      for p in paths:
+        if os.path.isfile(p):
+          entry = file_entry(p)
+
+          if has_manifest and self.manifest_.mark_unchanged(
+              entry.real_path, entry.stat):
+            continue
+
+          yield entry
+        elif not os.path.exists(p):
+          # the documents are stored under the path without links
+          p = os.path.realpath(p)
+          logging.debug(f'remove document:{p}')
+
+          if has_manifest:
+            for removed in self.manifest_.remove(p):
+              self.indexer_impl_.delete_document(removed)
+          else:
+            self.indexer_impl_.delete_path(f'^{re.escape(p)}(/|$)')
+
+          index_updated = True
+
+    if has_manifest:
+      self.manifest_.begin_scan(root)
+    try:
+      for entry, document in self.__load_documents(changed_files(),
+                                                   has_manifest):
+        if document is None:
+          continue
+
+        logging.debug(f'indexing document:{entry.path}')
+        self.indexer_impl_.add_document(document)
+
+        if has_manifest:
+          self.manifest_.record(entry.real_path, entry.stat, document.digest)
+
+        index_updated = True
+
+      scan_done = True
+    finally:
+      self.manifest_.end_scan(scan_done)
+      logging.debug(f'done sync files for: {root}')
+
+    return index_updated
+
+  def __update_index_func(self, path, full_indexing):
+    logging.info(f'updating path:{path.as_posix()} using manifest')
+
+    scan_done = False
+    delete_file_count = 0
+    changed_file_count = 0
+    completed = True
+
+    def changed_files():
+      nonlocal completed
+
+      if path.is_dir():
+        entries = self.__walk_files(path)
+      elif path.is_file():
+        entries = [file_entry(path)]
+      else:
+        entries = []
+
+      for entry in entries:
+        if self.shutdown_.value == 1:
+          logging.debug('quit updating for shutdown')
+          completed = False
+          break
+
+        if self.manifest_.mark_unchanged(entry.real_path, entry.stat):
+          continue
+
+        yield entry
+
+    self.manifest_.begin_scan(path.as_posix())
+    try:
+      # stat data changed, the content may still be the same
+      for entry, document in self.__load_documents(changed_files(), True):
+        p = entry.real_path
+
+        if document is None:
+          continue
+
+        if document.digest == self.manifest_.get_digest(p):
+          logging.debug(f'skip {p} since content not changed')
+          self.manifest_.record(p, entry.stat, document.digest)
+          continue
+
+        logging.debug(f'indexing document:{p}')
+        self.indexer_impl_.add_document(document, full_indexing)
+        self.manifest_.record(p, entry.stat, document.digest)
+        changed_file_count += 1
+
+      # files not seen by an interrupted walk may still exist
+      if completed:
+        for p in self.manifest_.unseen_paths():
+          logging.debug(f'remove document:{p}')
+          self.indexer_impl_.delete_document(p)
+          delete_file_count += 1
+
+        self.manifest_.remove_unseen()
+
+      self.indexer_impl_.touch_path(path.as_posix(), datetime.datetime.now())
+      scan_done = True
+    finally:
+      self.manifest_.end_scan(scan_done)
+      logging.info(
+          f'update for: {path.as_posix()} is done, deleted:{delete_file_count}, new or changed files:{changed_file_count}'
+      )
+
+    return (changed_file_count + delete_file_count) > 0
+
+  def __index_path_func(self, path, full_indexing, update):
+    index_updated = False
+    delete_file_count = 0
+    new_added_file_count = 0
+    scan_done = False
+
+    path = path.resolve()
+
+    modified_time = None
+    exist_files = {}
+
+    logging.info(f'indexing path:{path.as_posix()}, update:{update}')
+
+    if update:
+      exist_files, delete_file_count = self.indexer_impl_.clear_non_exist(path)
+      modified_time = self.indexer_impl_.get_index_modified_time(path)
+      index_updated = index_updated or (delete_file_count > 0)
+
+    if path.is_dir() and path.exists():
+      entries = self.__walk_files(path)
+    elif path.is_file() and path.exists():
+      entries = [file_entry(path)]
+    else:
+      logging.warning(
+          f'get a index request with invalid path:{path.as_posix()}')
+      return index_updated
+
+    logging.debug(f'begin index for: {path.as_posix()}')
+
+    def changed_files():
+      for entry in entries:
+        if self.shutdown_.value == 1:
+          logging.debug('3.quit indexing function process')
+          break
+
+        e_mtime = datetime.datetime.fromtimestamp(entry.stat.st_mtime)
+        if modified_time is not None and e_mtime <= modified_time:
+          skip_file = True
+
+          try:
+            s_mtime = exist_files[entry.real_path]
+
+            if s_mtime < e_mtime:
+              skip_file = False
+          except (KeyError):
+            skip_file = False
+
+          if skip_file:
+            logging.debug(
+                f'skip {entry.path} since not modified, {e_mtime} < {modified_time}'
+            )
+            self.manifest_.record(entry.real_path, entry.stat)
+            continue
+
+        yield entry
+
+    # record the files seen, the following updates of this root can
+    # then diff against the manifest
+    self.manifest_.begin_scan(path.as_posix())
+    try:
+      for entry, document in self.__load_documents(changed_files(), True):
+        if document is None:
+          self.manifest_.record(entry.real_path, entry.stat)
+          continue
+
+        logging.debug(f'indexing document:{entry.real_path}')
+        self.indexer_impl_.add_document(document, full_indexing)
+        self.manifest_.record(entry.real_path, entry.stat, document.digest)
+        index_updated = True
+        new_added_file_count += 1
+
+      self.indexer_impl_.touch_path(path.as_posix(), datetime.datetime.now())
+      scan_done = True
+    finally:
+      self.manifest_.end_scan(scan_done)
+      logging.info(
+          f'index for: {path.as_posix()} is done, deleted:{delete_file_count}, new files:{new_added_file_count}'
+      )
+
+    return index_updated
+
+  def __run_task(self, task):
+    path, full_indexing, remove, touch, update, files, compact = task
+
+    if remove:
+      return self.__remove_index_func(path)
+
+    if touch is not None:
+      return self.__touch_index_func(path, touch)
+
+    if files is not None:
+      return self.__sync_files_func(path, files)
+
+    if isinstance(path, str):
+      path = pathlib.Path(path)
+
+    if update and not path.exists():
+      logging.info(f'indexed path:{path.as_posix()} does not exist any more')
+      return self.__remove_index_func(path)
+
+    if update and self.manifest_.has_root(path.resolve().as_posix()):
+      return self.__update_index_func(path.resolve(), full_indexing)
+
+    return self.__index_path_func(path, full_indexing, update)
+
+  def __compact_func(self):
+    try:
+      self.indexer_impl_.compact()
+    except:
+      logging.exception('failed compact index')
+
+  def __run_batch(self, tasks):
+    compact = any(_task_kind(t) == 'compact' for t in tasks)
+    tasks = [t for t in tasks if _task_kind(t) != 'compact']
+
+    for session in _writer_sessions(tasks):
+      if self.shutdown_.value == 1:
+        break
+
+      self.__run_tasks(session)
+
+    if compact and self.shutdown_.value == 0:
+      self.__compact_func()
+
+  def __run_tasks(self, tasks):
+    logging.debug(f'run {len(tasks)} tasks in one writer session')
+
+    index_updated = False
+    committed = False
+
+    if self.read_workers_ > 0:
+      self.read_pool_ = ThreadPoolExecutor(self.read_workers_,
+                                           'pyeverything-reader')
+
+    self.indexer_impl_.begin_index()
+    self.manifest_.begin()
+    try:
+      for task in tasks:
+        if self.shutdown_.value == 1:
+          logging.debug('skip remaining tasks for shutdown')
+          break
+
+        try:
+          index_updated = self.__run_task(task) or index_updated
+        except:
+          logging.exception(f'failed run task {task}')
+
+      self.indexer_impl_.end_index(index_updated)
+      committed = True
+    finally:
+      if not committed:
+        self.indexer_impl_.end_index(False)
+
+      self.manifest_.end(committed)
+
+      # the prefetches cancel the reads they queued when they are closed,
+      # cancel_futures of shutdown needs python 3.9
+      if self.read_pool_ is not None:
+        self.read_pool_.shutdown(wait=True)
+        self.read_pool_ = None
+
+  def __next_batch(self):
+    '''
+    return (tasks, quit), waits up to commit latency for more tasks to
+    join the batch once the first one arrived
+    '''
+    task = self.data_queue_.get()
+
+    if task is None:
+      return [], True
+
+    tasks = [task]
+    deadline = time.monotonic() + self.commit_latency_
+
+    while len(tasks) < self.batch_size_:
+      try:
+        timeout = deadline - time.monotonic()
+
+        if timeout > 0:
+          task = self.data_queue_.get(timeout=timeout)
+        else:
+          task = self.data_queue_.get_nowait()
+      except queue.Empty:
+        break
+
+      if task is None:
+        return tasks, True
+
+      tasks.append(task)
+
+    return tasks, False
+
+  @staticmethod
+  def indexing_func(indexer):
+    while True:
+      if indexer.shutdown_.value == 1:
+        logging.debug('1.quit indexing function process')
+        break
+
+      tasks, quit = indexer.__next_batch()
+
+      if indexer.shutdown_.value == 1:
+        logging.debug('2.quit indexing function process')
+        break
+
+      if len(tasks) > 0:
+        batch = coalesce_tasks(tasks)
+        logging.info(
+            f'indexing batch of {len(batch)} tasks, {len(tasks)} queued')
+
+        indexer.__run_batch(batch)
+
+      if quit:
+        logging.debug('quit indexing function process')
+        break
+
+
+if __name__ == '__main__':
+  ix = Indexer()
+
+  r = ix.query('core', 'editor')
+
+  for item in r.query():
+    print(item['path'])
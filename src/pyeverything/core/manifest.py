@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import os
+import sqlite3
+
+MANIFEST_FILE = 'manifest.sqlite'
+
+# the manifest remembers what the file system looked like when each indexed
+# root was last scanned, so update only touches added, changed and deleted
+# files instead of re-checking the index for every file
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS manifest_roots (
+         root TEXT PRIMARY KEY,
+         scan INTEGER NOT NULL)''',
+    '''CREATE TABLE IF NOT EXISTS manifest (
+         root TEXT NOT NULL,
+         path TEXT NOT NULL,
+         mtime_ns INTEGER NOT NULL,
+         size INTEGER NOT NULL,
+         inode INTEGER NOT NULL,
+         digest BLOB,
+         scan INTEGER NOT NULL,
+         PRIMARY KEY (root, path)) WITHOUT ROWID''',
+]
+
+
+def file_digest(path):
+  h = hashlib.blake2b(digest_size=16)
+
+  with open(path, 'rb') as f:
+    while True:
+      data = f.read(1024 * 1024)
+
+      if len(data) == 0:
+        break
+
+      h.update(data)
+
+  return h.digest()
+
+
+class FileManifest(object):
+
+  def __init__(self, data_path):
+    super().__init__()
+
+    self.db_path_ = os.path.join(data_path.as_posix(), MANIFEST_FILE)
+    self.conn_ = None
+    self.root_ = None
+    self.scan_ = None
+
+  def __getstate__(self):
+    # sqlite connections can not be shared with the worker process
+    state = self.__dict__.copy()
+    state['conn_'] = None
+
+    return state
+
+  def __connection(self):
+    if self.conn_ is None:
+      self.conn_ = sqlite3.connect(self.db_path_, isolation_level=None)
+      self.conn_.execute('PRAGMA journal_mode=WAL')
+      self.conn_.execute('PRAGMA synchronous=NORMAL')
+
+      for stmt in SCHEMA:
+        self.conn_.execute(stmt)
+
+    return self.conn_
+
+  def has_root(self, root):
+    return self.__connection().execute(
+        'SELECT 1 FROM manifest_roots WHERE root = ?',
+        (root, )).fetchone() is not None
+
+  def begin(self):
+    self.__connection().execute('BEGIN IMMEDIATE')
+
+  def end(self, commit=True):
+    self.__connection().execute('COMMIT' if commit else 'ROLLBACK')
+
+  def begin_scan(self, root):
+    '''
+    start a scan of root inside the transaction opened by begin()
+    '''
+    conn = self.__connection()
+    conn.execute('SAVEPOINT scan')
+
+    row = conn.execute('SELECT scan FROM manifest_roots WHERE root = ?',
+                       (root, )).fetchone()
+
+    self.root_ = root
+    self.scan_ = 1 if row is None else row[0] + 1
+
+    conn.execute(
+        'INSERT OR REPLACE INTO manifest_roots(root, scan) VALUES (?, ?)',
+        (root, self.scan_))
+
+    logging.debug(f'begin manifest scan:{self.scan_} for {root}')
+
+  def end_scan(self, commit=True):
+    if self.scan_ is None:
+      return
+
+    conn = self.__connection()
+
+    if not commit:
+      conn.execute('ROLLBACK TO scan')
+
+    conn.execute('RELEASE scan')
+
+    self.root_ = None
+    self.scan_ = None
+
+  def mark_unchanged(self, path, st):
+    '''
+    return True and mark the path as seen when its stat data did not change
+    since the last scan
+    '''
+    cur = self.__connection().execute(
+        '''UPDATE manifest SET scan = ?
+           WHERE root = ? AND path = ?
+             AND mtime_ns = ? AND size = ? AND inode = ?''',
+        (self.scan_, self.root_, path, st.st_mtime_ns, st.st_size,
+         st.st_ino))
+
+    return cur.rowcount == 1
+
+  def get_digest(self, path):
+    row = self.__connection().execute(
+        'SELECT digest FROM manifest WHERE root = ? AND path = ?',
+        (self.root_, path)).fetchone()
+
+    return None if row is None else row[0]
+
+  def record(self, path, st, digest=None):
+    self.__connection().execute(
+        '''INSERT OR REPLACE INTO
+             manifest(root, path, mtime_ns, size, inode, digest, scan)
+             VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (self.root_, path, st.st_mtime_ns, st.st_size, st.st_ino, digest,
+         self.scan_))
+
+  def remove(self, path):
+    '''
+    remove path and everything recorded under it, return the removed paths
+    '''
+    conn = self.__connection()
+    prefix = path.rstrip('/') + '/'
+
+    removed = [
+        row[0] for row in conn.execute(
+            '''SELECT path FROM manifest
+               WHERE root = ? AND (path = ? OR (path >= ? AND path < ?))''',
+            (self.root_, path, prefix, prefix[:-1] + '0'))
+    ]
+
+    conn.executemany('DELETE FROM manifest WHERE root = ? AND path = ?',
+                     [(self.root_, p) for p in removed])
+
+    return removed
+
+  def remove_prefix(self, path):
+    '''
+    forget path and everything under it in all roots, roots under path are
+    dropped too, return the paths outside of path the dropped roots reached
+    through links which no other root records
+    '''
+    conn = self.__connection()
+    prefix = path.rstrip('/') + '/'
+    params = (path, prefix, prefix[:-1] + '0')
+
+    conn.execute(
+        'DELETE FROM manifest WHERE path = ? OR (path >= ? AND path < ?)',
+        params)
+
+    linked = set(row[0] for row in conn.execute(
+        'SELECT path FROM manifest WHERE root = ? OR (root >= ? AND root < ?)',
+        params))
+
+    conn.execute(
+        'DELETE FROM manifest WHERE root = ? OR (root >= ? AND root < ?)',
+        params)
+    conn.execute(
+        'DELETE FROM manifest_roots WHERE root = ? OR (root >= ? AND root < ?)',
+        params)
+
+    return [
+        p for p in sorted(linked) if conn.execute(
+            'SELECT 1 FROM manifest WHERE path = ?', (p, )).fetchone() is None
+    ]
+
+  def unseen_paths(self):
+    '''
+    paths recorded by an earlier scan which the current scan did not see,
+    the files are deleted or ignored now
+    '''
+    cur = self.__connection().execute(
+        'SELECT path FROM manifest WHERE root = ? AND scan != ?',
+        (self.root_, self.scan_))
+
+    try:
+      for row in cur:
+        yield row[0]
+    finally:
+      cur.close()
+
+  def remove_unseen(self):
+    cur = self.__connection().execute(
+        'DELETE FROM manifest WHERE root = ? AND scan != ?',
+        (self.root_, self.scan_))
+
+    return cur.rowcount
@@ -0,0 +1,62 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+def prefetch(executor, func, items, depth=64):
+  '''
+  yield (item, func(item)) in the order of items while up to depth calls
+  run ahead in the executor, items is consumed on the caller's thread
+  '''
+  pending = deque()
+  items = iter(items)
+
+  try:
+    while True:
+      while len(pending) < depth:
+        try:
+          item = next(items)
+        except StopIteration:
+          break
+
+        pending.append((item, executor.submit(func, item)))
+
+      if len(pending) == 0:
+        return
+
+      item, future = pending.popleft()
+      yield item, future.result()
+  finally:
+    for _, future in pending:
+      future.cancel()
+
+
+def prefetch_unordered(executor, func, items, depth=64):
+  '''
+  yield (item, func(item)) in the order the calls finish while up to depth
+  calls run ahead in the executor, items is consumed on the caller's thread
+  '''
+  pending = {}
+  items = iter(items)
+  exhausted = False
+
+  try:
+    while True:
+      while not exhausted and len(pending) < depth:
+        try:
+          item = next(items)
+        except StopIteration:
+          exhausted = True
+          break
+
+        pending[executor.submit(func, item)] = item
+
+      if len(pending) == 0:
+        return
+
+      done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+      for future in done:
+        yield pending.pop(future), future.result()
+  finally:
+    for future in pending:
+      future.cancel()
@@ -0,0 +1,51 @@
+import logging
+from collections import namedtuple
+
+# above this ratio of candidates to documents the index lookup does not
+# save enough files from being read to pay for itself
+MAX_CANDIDATE_RATIO = 0.5
+
+# strategy is one of
+#   index  look up path and content in the index
+#   path   look up only the path in the index, the content is matched on
+#          the files
+#   scan   read the indexed documents directly, without a lookup
+# estimate and total are the document counts the strategy was chosen from
+QueryPlan = namedtuple('QueryPlan', ['strategy', 'estimate', 'total'])
+
+
+def plan_query(indexer_impl,
+               path,
+               content,
+               ignore_case=True,
+               raw_pattern=False,
+               max_ratio=MAX_CANDIDATE_RATIO,
+               allow_scan=True):
+  '''
+  choose the query strategy from the document frequencies of the index, the
+  hits of a scan have no docnums and can not be resumed
+  '''
+  if content is None:
+    return QueryPlan('index', None, None)
+
+  try:
+    estimate, total = indexer_impl.estimate(None, content, ignore_case,
+                                            raw_pattern)
+  except:
+    logging.exception(f'failed estimate content:{content}')
+    return QueryPlan('index', None, None)
+
+  if total == 0 or estimate <= total * max_ratio:
+    return QueryPlan('index', estimate, total)
+
+  if path is not None and path != '.*':
+    path_estimate, _ = indexer_impl.estimate(path, None, ignore_case,
+                                             raw_pattern)
+
+    if path_estimate <= total * max_ratio:
+      return QueryPlan('path', path_estimate, total)
+
+  if not allow_scan:
+    return QueryPlan('index', estimate, total)
+
+  return QueryPlan('scan', estimate, total)
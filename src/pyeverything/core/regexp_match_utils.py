@@ -1,52 +1,222 @@
 import logging
-import pathlib
+import mmap
+import os
 import re
+import time
 
-from io import StringIO
+import sre_parse
+from contextlib import contextmanager
+from functools import lru_cache
+from sre_constants import LITERAL
 
+_NON_ASCII = re.compile(rb'[\x80-\xff]')
 
-def regexp_match_info(path, pattern, ignore_case=False):
-  text = pathlib.Path(path).read_text(encoding='utf-8', errors='ignore')
+# smaller files are read, mapping them costs more than reading them
+MMAP_MIN_SIZE = 1024 * 1024
+
+# seconds since the last modification before a file is mapped, a file
+# truncated under the map raises SIGBUS on access, files which may still
+# be written are read instead
+MMAP_MIN_AGE = 5.0
+
+
+@lru_cache(maxsize=64)
+def compile_pattern(pattern, ignore_case=False):
+  '''
+  the pattern is compiled once for all the files it is matched against
+  '''
+  return re.compile(f'(?m){"(?i)" if ignore_case else ""}{pattern}')
+
+
+@lru_cache(maxsize=64)
+def _bytes_pattern(pattern):
+  '''
+  the bytes version of a compiled str pattern, which matches the same on
+  ascii text, None when there is none
+  '''
+  if not pattern.pattern.isascii():
+    return None
 
+  try:
+    return re.compile(pattern.pattern.encode('ascii'),
+                      pattern.flags & (re.I | re.M | re.S | re.X))
+  except re.error:
+    return None
+
+
+def regexp_match_info(path, pattern, ignore_case=False):
+  '''
+  yield (line, column, length, line text) for the matches in the file, ascii
+  files are mapped and matched as bytes, only the lines with a match are
+  decoded
+  '''
   logging.debug(
       f'matching file:{path} using:{pattern}, ignore_case:{ignore_case}')
 
   if isinstance(pattern, str):
-    token_iter = re.finditer(f'(?m){"(?i)" if ignore_case else ""}{pattern}',
-                             text)
+    pattern = compile_pattern(pattern, ignore_case)
+
+  # bytes and str patterns only agree on ascii text
+  bytes_pattern = _bytes_pattern(pattern)
+  bytes_spans = None
+
+  if bytes_pattern is not None:
+    bytes_spans = lambda text: _regexp_spans(bytes_pattern, text)
+
+  yield from _match_file(path, bytes_spans,
+                         lambda text: _regexp_spans(pattern, text))
+
+
+def literal_match_info(path, literal, ignore_case=False):
+  '''
+  yield (line, column, length, line text) for the occurrences of literal in
+  the file, found by plain substring search
+  '''
+  logging.debug(f'matching file:{path} using literal:{literal}, '
+                f'ignore_case:{ignore_case}')
+
+  if len(literal) == 0:
+    yield from regexp_match_info(path, '', ignore_case)
+    return
+
+  bytes_spans = None
+
+  if ignore_case:
+    # lower() keeps the offsets of ascii text only, the others are left to
+    # the case insensitive regex
+    if literal.isascii():
+      needle = literal.lower().encode('ascii')
+      bytes_spans = lambda text: _find_spans(text[:].lower(), needle)
+
+    pattern = compile_pattern(re.escape(literal), True)
+    str_spans = lambda text: _regexp_spans(pattern, text)
   else:
-    token_iter = pattern.finditer(text)
+    if literal.isascii():
+      needle = literal.encode('ascii')
+      bytes_spans = lambda text: _find_spans(text, needle)
+
+    str_spans = lambda text: _find_spans(text, literal)
+
+  yield from _match_file(path, bytes_spans, str_spans)
+
 
-  return generate_match_info(text, token_iter, lambda t: t.start(),
-                             lambda t: t.end())
+def match_info(path, content, ignore_case=False, raw_pattern=False):
+  '''
+  the match info of the content pattern in the file, raw patterns and
+  patterns without regex syntax are searched as literals
+  '''
+  literal = content if raw_pattern else literal_pattern(content)
 
+  if literal is not None:
+    return literal_match_info(path, literal, ignore_case)
 
-def generate_match_info(text, token_iter, start_char, end_char):
+  return regexp_match_info(path, content, ignore_case)
+
+
+@lru_cache(maxsize=64)
+def literal_pattern(pattern):
+  '''
+  the string the pattern matches when it is made of literal chars only,
+  otherwise None
+  '''
   try:
-    t = next(token_iter)
-  except (StopIteration):
-    return
+    parsed = sre_parse.parse(pattern)
+  except re.error:
+    return None
+
+  if parsed.state.flags & ~sre_parse.SRE_FLAG_UNICODE:
+    return None
+
+  if len(parsed) == 0 or any(op != LITERAL for op, _ in parsed):
+    return None
+
+  return ''.join(chr(av) for _, av in parsed)
+
+
+@contextmanager
+def _file_data(path):
+  '''
+  the bytes of the file, large files which were not modified lately are
+  mapped, a file truncated while it is matched can still kill the process
+  with SIGBUS, which the age check only makes unlikely
+  '''
+  with open(path, 'rb') as f:
+    st = os.fstat(f.fileno())
+
+    # empty files can not be mapped
+    if (st.st_size == 0 or st.st_size < MMAP_MIN_SIZE
+        or time.time() - st.st_mtime < MMAP_MIN_AGE):
+      yield f.read()
+      return
+
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+      # the file changed between the stat and the map
+      if len(mm) != st.st_size or os.fstat(f.fileno()).st_size != len(mm):
+        mm.close()
+        f.seek(0)
+        yield f.read()
+      else:
+        yield mm
+    finally:
+      mm.close()
 
-  line_start = 0
+
+def _match_file(path, bytes_spans, str_spans):
+  # bytes_spans is used on the bytes of ascii files without \r, str_spans on
+  # the text decoded with universal newlines
+  with _file_data(path) as data:
+    if len(data) == 0:
+      return
+
+    if (bytes_spans is not None and _NON_ASCII.search(data) is None
+        and data.find(b'\r') == -1):
+      yield from _match_lines(data, bytes_spans(data), b'\n')
+    else:
+      text = data[:].decode('utf-8', errors='ignore')
+      text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+      yield from _match_lines(text, str_spans(text), '\n')
+
+
+def _regexp_spans(pattern, text):
+  for m in pattern.finditer(text):
+    yield m.span()
+
+
+def _find_spans(text, s):
+  start = text.find(s)
+
+  while start != -1:
+    yield start, start + len(s)
+    start = text.find(s, start + len(s))
+
+
+def _match_lines(text, spans, newline):
+  # the line of a match is counted from the one of the previous match, a
+  # match is cut at the end of its line
   line_count = 0
+  counted = 0
+
+  for start, end in spans:
+    # mmap has no count(), the slice is counted at the same speed
+    line_count += text[counted:start].count(newline)
+    counted = start
 
-  for line in StringIO(text):
-    line_end = line_start + len(line)
+    line_start = text.rfind(newline, 0, start) + 1
 
-    _s_char = start_char(t)
-    _e_char = end_char(t)
+    # there is no line after the last newline
+    if line_start == len(text):
+      break
 
-    while _s_char >= line_start and _e_char < line_end:
-      yield (line_count, _s_char - line_start, _e_char - _s_char,
-             line.replace('\n', '').replace('\r', ''))
+    line_end = text.find(newline, start)
 
-      try:
-        t = next(token_iter)
-      except (StopIteration):
-        return
+    if line_end == -1:
+      line_end = len(text)
 
-      _s_char = start_char(t)
-      _e_char = end_char(t)
+    line = text[line_start:line_end]
+    if isinstance(line, bytes):
+      line = line.decode('ascii')
 
-    line_count += 1
-    line_start = line_end
+    yield (line_count, start - line_start, min(end, line_end) - start, line)
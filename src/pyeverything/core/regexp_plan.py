@@ -0,0 +1,335 @@
+import re
+import sre_parse
+from collections import namedtuple
+from itertools import product
+
+from sre_constants import LITERAL, MAX_REPEAT, MIN_REPEAT
+from sre_constants import IN, BRANCH, SUBPATTERN, MAXREPEAT
+from sre_constants import ASSERT, ASSERT_NOT, AT, NEGATE, RANGE
+from sre_constants import AT_BEGINNING, AT_BEGINNING_STRING, SRE_FLAG_UNICODE
+
+# a regular expression is turned into a boolean plan over literal strings
+# every matching text must contain, following
+# https://swtch.com/~rsc/regexp/regexp4.html
+#
+# a plan is ALL (no constraint), a str literal, And(children) or
+# Or(children), children are frozensets so plans are hashable and
+# duplicated children are removed for free
+
+MAX_EXACT_SET = 16
+MAX_CLASS_SIZE = 8
+
+
+class _All(object):
+
+  def __repr__(self):
+    return 'ALL'
+
+
+ALL = _All()
+
+And = namedtuple('And', ['children'])
+Or = namedtuple('Or', ['children'])
+
+# exact is the set of all strings the node can match, None if unknown
+# or too large, plan is used when exact is None
+_Info = namedtuple('_Info', ['exact', 'plan'])
+
+_EMPTY = _Info(frozenset(['']), ALL)
+_UNKNOWN = _Info(None, ALL)
+
+
+def make_and(children):
+  items = set()
+
+  for c in children:
+    if c is ALL:
+      continue
+
+    if isinstance(c, And):
+      items.update(c.children)
+    else:
+      items.add(c)
+
+  # a longer literal implies all of its substrings
+  literals = [x for x in items if isinstance(x, str)]
+  for x in literals:
+    if any(x != y and x in y for y in literals):
+      items.discard(x)
+
+  # And(x, Or(x, y)) is x
+  for x in list(items):
+    if isinstance(x, Or) and len(x.children & items) > 0:
+      items.discard(x)
+
+  if len(items) == 0:
+    return ALL
+
+  if len(items) == 1:
+    return items.pop()
+
+  return And(frozenset(items))
+
+
+def make_or(children):
+  items = set()
+
+  for c in children:
+    if c is ALL:
+      return ALL
+
+    if isinstance(c, Or):
+      items.update(c.children)
+    else:
+      items.add(c)
+
+  # a shorter literal is implied by all the literals containing it
+  literals = [x for x in items if isinstance(x, str)]
+  for x in literals:
+    if any(x != y and y in x for y in literals):
+      items.discard(x)
+
+  # Or(x, And(x, y)) is x
+  for x in list(items):
+    if isinstance(x, And) and len(x.children & items) > 0:
+      items.discard(x)
+
+  if len(items) == 0:
+    return ALL
+
+  if len(items) == 1:
+    return items.pop()
+
+  return Or(frozenset(items))
+
+
+def __exact_to_plan(exact):
+  return make_or([s if len(s) > 0 else ALL for s in exact])
+
+
+def __to_plan(info):
+  if info.exact is None:
+    return info.plan
+
+  return __exact_to_plan(info.exact)
+
+
+def __concat(a, b):
+  if a.exact is not None and b.exact is not None:
+    if len(a.exact) * len(b.exact) <= MAX_EXACT_SET:
+      return _Info(frozenset(x + y for x, y in product(a.exact, b.exact)),
+                   ALL)
+
+  return _Info(None, make_and([__to_plan(a), __to_plan(b)]))
+
+
+def __alternate(infos):
+  if all(i.exact is not None for i in infos):
+    exact = frozenset().union(*[i.exact for i in infos])
+
+    if len(exact) <= MAX_EXACT_SET:
+      return _Info(exact, ALL)
+
+  return _Info(None, make_or([__to_plan(i) for i in infos]))
+
+
+def __in_to_info(av):
+  chars = set()
+
+  for op, v in av:
+    if op == NEGATE:
+      return _UNKNOWN
+    elif op == LITERAL:
+      chars.add(chr(v).lower())
+    elif op == RANGE:
+      lo, hi = v
+
+      if hi - lo >= MAX_CLASS_SIZE:
+        return _UNKNOWN
+
+      chars.update(chr(c).lower() for c in range(lo, hi + 1))
+    else:
+      return _UNKNOWN
+
+  if len(chars) == 0 or len(chars) > MAX_CLASS_SIZE:
+    return _UNKNOWN
+
+  return _Info(frozenset(chars), ALL)
+
+
+def __repeat_to_info(low, high, subtree):
+  sub = __tree_to_info(subtree)
+
+  if low == 0:
+    if high == 1 and sub.exact is not None:
+      return __alternate([_EMPTY, sub])
+
+    return _UNKNOWN
+
+  if low == high and sub.exact is not None:
+    info = sub
+    for _ in range(low - 1):
+      info = __concat(info, sub)
+
+    return info
+
+  info = sub
+  if high == MAXREPEAT or high > low:
+    # at least low copies, anything after that is unknown
+    for _ in range(low - 1):
+      info = __concat(info, sub)
+
+    return _Info(None, __to_plan(info))
+
+  return _Info(None, __to_plan(sub))
+
+
+def __node_to_info(op, av):
+  if op == LITERAL:
+    return _Info(frozenset([chr(av).lower()]), ALL)
+  elif op == IN:
+    return __in_to_info(av)
+  elif op in (MAX_REPEAT, MIN_REPEAT):
+    low, high, subtree = av
+    return __repeat_to_info(low, high, subtree)
+  elif op == SUBPATTERN:
+    return __tree_to_info(av[-1])
+  elif op == BRANCH:
+    return __alternate([__tree_to_info(x) for x in av[1]])
+  elif op == ASSERT:
+    # the asserted text has to be somewhere in the matching text
+    return _Info(None, __to_plan(__tree_to_info(av[1])))
+  elif op in (AT, ASSERT_NOT):
+    return _EMPTY
+
+  # NOT_LITERAL, ANY, CATEGORY, GROUPREF and the rest
+  return _UNKNOWN
+
+
+def __tree_to_info(pattern):
+  # literals are joined while the exact strings are known, the run is
+  # flushed into the plan when a node with unknown strings shows up
+  plans = []
+  run = _EMPTY
+
+  for op, av in pattern:
+    info = __node_to_info(op, av)
+
+    if info.exact is None:
+      plans.extend([__to_plan(run), info.plan])
+      run = _EMPTY
+      continue
+
+    joined = __concat(run, info)
+
+    if joined.exact is None:
+      plans.append(__to_plan(run))
+      run = info
+    else:
+      run = joined
+
+  if len(plans) == 0:
+    return run
+
+  plans.append(__to_plan(run))
+
+  return _Info(None, make_and(plans))
+
+
+def regexp_to_plan(regex_str):
+  '''
+  build a case folded literal plan for the regular expression, every text
+  the regular expression can match satisfies the plan
+  '''
+  return __to_plan(__tree_to_info(sre_parse.parse(regex_str)))
+
+
+def literal_to_plan(s):
+  return s.lower() if len(s) > 0 else ALL
+
+
+def map_literals(plan, func):
+  '''
+  rebuild the plan by replacing each literal with func(literal)
+  '''
+  if plan is ALL:
+    return ALL
+
+  if isinstance(plan, str):
+    return func(plan)
+
+  children = [map_literals(c, func) for c in plan.children]
+
+  if isinstance(plan, And):
+    return make_and(children)
+
+  return make_or(children)
+
+
+def string_ngrams(s, n=3):
+  return set(s[i:i + n] for i in range(len(s) - n + 1))
+
+
+def ngram_plan(plan, n=3):
+  '''
+  rewrite the literal plan into a plan over n-grams, literals shorter
+  than n can not be looked up and become ALL
+  '''
+
+  def to_ngrams(s):
+    if len(s) < n:
+      return ALL
+
+    return make_and(string_ngrams(s, n))
+
+  return map_literals(plan, to_ngrams)
+
+
+def estimate_plan(plan, doc_frequency, total):
+  '''
+  upper bound of the number of documents satisfying the plan, doc_frequency
+  returns the number of documents containing a literal
+  '''
+  if plan is ALL:
+    return total
+
+  if isinstance(plan, str):
+    return min(total, doc_frequency(plan))
+
+  estimates = [estimate_plan(c, doc_frequency, total) for c in plan.children]
+
+  if isinstance(plan, And):
+    return min(estimates)
+
+  return min(total, sum(estimates))
+
+
+def literal_prefix(regex_str):
+  '''
+  the literal text a match of the regular expression anchored at the
+  beginning starts with, None when it is not anchored or the case is
+  ignored
+  '''
+  try:
+    pattern = sre_parse.parse(regex_str)
+  except re.error:
+    return None
+
+  if pattern.state.flags & ~SRE_FLAG_UNICODE:
+    return None
+
+  if len(pattern) == 0 or pattern[0] not in ((AT, AT_BEGINNING),
+                                             (AT, AT_BEGINNING_STRING)):
+    return None
+
+  prefix = []
+  for op, av in pattern[1:]:
+    if op != LITERAL:
+      break
+
+    prefix.append(chr(av))
+
+  if len(prefix) == 0:
+    return None
+
+  return ''.join(prefix)
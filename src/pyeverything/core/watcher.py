@@ -0,0 +1,315 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import pathlib
+import select
+import struct
+import sys
+import threading
+import time
+
+from .file_system_helper import is_ignored, walk_directory_tree
+from pyeverything.vcs_ignore import VCSIgnore
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_watch_supported():
+  return sys.platform.startswith('linux') and ctypes.util.find_library(
+      'c') is not None
+
+
+class _Inotify(object):
+
+  def __init__(self):
+    super().__init__()
+
+    self.libc_ = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    self.fd_ = self.libc_.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+    if self.fd_ < 0:
+      e = ctypes.get_errno()
+      raise OSError(e, os.strerror(e))
+
+  def fileno(self):
+    return self.fd_
+
+  def close(self):
+    if self.fd_ >= 0:
+      os.close(self.fd_)
+      self.fd_ = -1
+
+  def add_watch(self, path, mask=WATCH_MASK):
+    wd = self.libc_.inotify_add_watch(self.fd_, os.fsencode(path), mask)
+
+    if wd < 0:
+      e = ctypes.get_errno()
+      raise OSError(e, os.strerror(e), path)
+
+    return wd
+
+  def rm_watch(self, wd):
+    self.libc_.inotify_rm_watch(self.fd_, wd)
+
+  def read_events(self):
+    '''
+    yield (wd, mask, name) for the pending events
+    '''
+    try:
+      data = os.read(self.fd_, 64 * 1024)
+    except BlockingIOError:
+      return
+
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+      wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+      offset += EVENT_HEADER.size
+
+      name = data[offset:offset + name_len].rstrip(b'\0')
+      offset += name_len
+
+      yield wd, mask, os.fsdecode(name)
+
+
+class IndexWatcher(object):
+  '''
+  watch the indexed roots with inotify and feed the changed files into the
+  indexer queue, bursts of events are coalesced until no event arrived for
+  debounce seconds or max_delay seconds passed since the first one
+  '''
+
+  def __init__(self,
+               indexer,
+               debounce=0.5,
+               max_delay=5.0,
+               root_check_interval=30.0):
+    super().__init__()
+
+    self.indexer_ = indexer
+    self.debounce_ = debounce
+    self.max_delay_ = max_delay
+    self.root_check_interval_ = root_check_interval
+
+    self.inotify_ = None
+    self.thread_ = None
+    self.stop_event_ = threading.Event()
+
+    # wd -> (directory, VCSIgnore, root)
+    self.watches_ = {}
+    self.roots_ = {}
+
+    self.pending_ = {}
+    self.first_event_time_ = None
+    self.last_event_time_ = None
+    self.overflow_ = False
+
+  def start(self):
+    if self.thread_ is not None:
+      return
+
+    self.inotify_ = _Inotify()
+    self.stop_event_.clear()
+
+    self.thread_ = threading.Thread(target=self.__run,
+                                    name='pyeverything-watcher',
+                                    daemon=True)
+    self.thread_.start()
+
+  def stop(self):
+    if self.thread_ is None:
+      return
+
+    self.stop_event_.set()
+    self.thread_.join()
+    self.thread_ = None
+
+    self.inotify_.close()
+    self.inotify_ = None
+
+  def __run(self):
+    next_root_check = 0
+
+    while not self.stop_event_.is_set():
+      now = time.monotonic()
+
+      if now >= next_root_check:
+        try:
+          self.__check_roots()
+        except:
+          logging.exception('failed update watched roots')
+
+        next_root_check = now + self.root_check_interval_
+
+      readable, _, _ = select.select([self.inotify_], [], [], self.debounce_)
+
+      if len(readable) > 0:
+        for wd, mask, name in self.inotify_.read_events():
+          try:
+            self.__handle_event(wd, mask, name)
+          except:
+            logging.exception(f'failed handle watch event for:{name}')
+
+      self.__flush_if_ready()
+
+  def __check_roots(self):
+    self.indexer_.refresh_cache()
+
+    roots = set(p for p, _ in self.indexer_.list_indexed_path())
+
+    for root in roots - set(self.roots_.keys()):
+      self.__watch_root(root)
+
+    for root in set(self.roots_.keys()) - roots:
+      self.__unwatch_root(root)
+
+  def __watch_root(self, root):
+    p = pathlib.Path(root)
+
+    if not p.exists():
+      return
+
+    logging.info(f'watching indexed path:{root}')
+
+    self.roots_[root] = []
+
+    if p.is_dir():
+      self.__watch_tree(p, VCSIgnore(p), root)
+    else:
+      # a single indexed file, events of the other files are filtered
+      self.__add_watch(p.parent, VCSIgnore(p.parent), root)
+
+  def __unwatch_root(self, root):
+    logging.info(f'stop watching path:{root}')
+
+    for wd in self.roots_.pop(root, []):
+      self.inotify_.rm_watch(wd)
+      self.watches_.pop(wd, None)
+
+  def __watch_tree(self, path, vi, root, report_files=False):
+    for d, d_vi, files in walk_directory_tree(path, vi):
+      self.__add_watch(d, d_vi, root)
+
+      # files created before the watch was added would be missed
+      if report_files:
+        for f in files:
+          self.__add_pending(root, f.as_posix())
+
+  def __add_watch(self, path, vi, root):
+    try:
+      wd = self.inotify_.add_watch(path.as_posix())
+    except OSError as e:
+      if e.errno == errno.ENOSPC:
+        logging.warning(
+            f'inotify watch limit reached, {path.as_posix()} is not watched')
+      else:
+        logging.debug(f'failed watch {path.as_posix()}:{e}')
+      return
+
+    self.watches_[wd] = (path, vi, root)
+    self.roots_[root].append(wd)
+
+  def __handle_event(self, wd, mask, name):
+    if mask & IN_Q_OVERFLOW:
+      logging.warning('inotify queue overflow, rescan all indexed paths')
+      self.overflow_ = True
+      self.__touch_pending()
+      return
+
+    if mask & IN_IGNORED:
+      entry = self.watches_.pop(wd, None)
+
+      if entry is not None and wd in self.roots_.get(entry[2], []):
+        self.roots_[entry[2]].remove(wd)
+
+      return
+
+    try:
+      directory, vi, root = self.watches_[wd]
+    except KeyError:
+      return
+
+    if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+      if directory.as_posix() == root:
+        self.__add_pending(root, root)
+      return
+
+    if len(name) == 0:
+      return
+
+    path = directory / name
+
+    if not pathlib.Path(root).is_dir() and path.as_posix() != root:
+      return
+
+    if is_ignored(path, vi, (mask & IN_ISDIR) != 0):
+      return
+
+    if mask & IN_ISDIR:
+      if mask & (IN_CREATE | IN_MOVED_TO):
+        self.__watch_tree(path, VCSIgnore(path, vi), root, report_files=True)
+      elif mask & (IN_DELETE | IN_MOVED_FROM):
+        self.__add_pending(root, path.as_posix())
+      return
+
+    self.__add_pending(root, path.as_posix())
+
+  def __touch_pending(self):
+    now = time.monotonic()
+
+    if self.first_event_time_ is None:
+      self.first_event_time_ = now
+
+    self.last_event_time_ = now
+
+  def __add_pending(self, root, path):
+    self.pending_.setdefault(root, set()).add(path)
+    self.__touch_pending()
+
+  def __flush_if_ready(self):
+    if self.first_event_time_ is None:
+      return
+
+    now = time.monotonic()
+
+    if (now - self.last_event_time_ < self.debounce_
+        and now - self.first_event_time_ < self.max_delay_):
+      return
+
+    pending = self.pending_
+    overflow = self.overflow_
+
+    self.pending_ = {}
+    self.overflow_ = False
+    self.first_event_time_ = None
+    self.last_event_time_ = None
+
+    if overflow:
+      for root in self.roots_.keys():
+        self.indexer_.update(root)
+      return
+
+    for root, paths in pending.items():
+      logging.debug(f'{len(paths)} paths changed under {root}')
+      self.indexer_.sync_files(root, sorted(paths))
@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import socket
+
+# the unix socket a running service answers queries on, in its index
+# location
+QUERY_SOCKET = 'query.sock'
+
+# the operations the service runs for the command line
+QUERY_OPS = ['query', 'helm-ag', 'helm-files']
+
+
+def query_socket_path(location):
+  return os.path.join(location, QUERY_SOCKET)
+
+
+def _read_messages(f):
+  for line in f:
+    yield json.loads(line)
+
+
+def query_service(location, cmd_line_args, cwd):
+  '''
+  send the command line to the service of the index location, return an
+  iterator of the lines it outputs, None when there is no service or it
+  can not run the command
+  '''
+  if not hasattr(socket, 'AF_UNIX'):
+    return None
+
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+  try:
+    sock.connect(query_socket_path(location))
+  except OSError:
+    # no service, or a socket left behind by one which is gone
+    sock.close()
+    return None
+
+  f = sock.makefile('rw', encoding='utf-8')
+
+  try:
+    f.write(json.dumps({'args': cmd_line_args, 'cwd': cwd}) + '\n')
+    f.flush()
+
+    messages = _read_messages(f)
+    first = next(messages, None)
+  except (OSError, ValueError):
+    logging.debug('failed query service', exc_info=True)
+    first = None
+
+  if first is None or first.get('fallback'):
+    f.close()
+    sock.close()
+    return None
+
+  return _output_lines(sock, f, first, messages)
+
+
+def _output_lines(sock, f, first, messages):
+  try:
+    message = first
+
+    while message is not None:
+      if 'line' in message:
+        yield message['line']
+      elif 'error' in message:
+        logging.error(f'service failed query, {message["error"]}')
+
+      if message.get('done'):
+        break
+
+      message = next(messages, None)
+  finally:
+    f.close()
+    sock.close()
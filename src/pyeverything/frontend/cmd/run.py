@@ -7,16 +7,21 @@ import logging
 import pathlib
 import queue
 import re
-import subprocess
 
-from binaryornot.check import is_binary
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
 from functools import reduce, partial
 from io import StringIO
-from multiprocessing import Process, JoinableQueue, Queue, Value, freeze_support, set_start_method
-from termcolor import colored
 
-from pyeverything.core.indexing import Indexer
+# the query and helm commands run on every key stroke of helm, so what only
+# indexing, colors or the fallback tools need is imported where it is used
+from pyeverything.core.indexing import Indexer, default_data_path, process_context
+from pyeverything.core.file_system_helper import scan_directory
+from pyeverything.core.indexer import INDEXER_BACKENDS
+from pyeverything.core.indexer.query_result import HIT_ORDERS, compile_path_matcher, verify_hit
+from pyeverything.core.pipeline import prefetch, prefetch_unordered
 from pyeverything.core.regexp_match_utils import regexp_match_info
+from pyeverything.frontend.cmd.client import QUERY_OPS, query_service
 
 
 def parse_arguments(cmd_line_args):
@@ -34,6 +39,35 @@ def parse_arguments(cmd_line_args):
                       type=pathlib.Path,
                       required=False,
                       default=None)
+  parser.add_argument("-b",
+                      "--backend",
+                      help="indexer backend, remembered in the index location",
+                      choices=INDEXER_BACKENDS,
+                      required=False,
+                      default=None)
+  parser.add_argument("--read-workers",
+                      help="threads reading files ahead of the index writer",
+                      type=int,
+                      default=4)
+  parser.add_argument("--read-queue-depth",
+                      help="max number of files read ahead of the writer",
+                      type=int,
+                      default=64)
+  parser.add_argument("-j",
+                      "--jobs",
+                      help="threads matching the query candidates, 0 for none",
+                      type=int,
+                      default=4)
+  parser.add_argument(
+      "--no-service",
+      help="search in this process even when a service runs on the index",
+      action="store_true",
+      default=False)
+  parser.add_argument(
+      "--git-index",
+      help="list the files tracked by git from the git index of a root",
+      action="store_true",
+      default=False)
 
   sub_parsers = parser.add_subparsers(dest='op')
 
@@ -58,6 +92,12 @@ def parse_arguments(cmd_line_args):
       "update indexed files, remove deleted file, add new and update modified files",
       action="store_true",
       default=False)
+  index_parser.add_argument(
+      "-c",
+      "--compact",
+      help="merge all index segments into one after indexing",
+      action="store_true",
+      default=False)
   index_parser.add_argument("-f",
                             "--file",
                             help="file contains path to be indexed",
@@ -94,9 +134,42 @@ def parse_arguments(cmd_line_args):
   query_parser.add_argument('--limit', type=int, default=None)
   query_parser.add_argument('--page', type=int, default=None)
   query_parser.add_argument('--page_size', type=int, default=20)
+  query_parser.add_argument(
+      '--cursor',
+      help='output a page of files after the cursor printed by the last page,'
+      ' the first page without one',
+      nargs='?',
+      const='',
+      default=None)
+  query_parser.add_argument(
+      '--sort',
+      help='sort the files by path or by latest modified, not index order',
+      choices=HIT_ORDERS,
+      default=None)
+  query_parser.add_argument(
+      '--unordered',
+      help='output the files in the order they are matched, not index order',
+      action='store_true',
+      default=False)
+  query_parser.add_argument(
+      '--explain',
+      help='print the query plan with its estimated and actual candidates',
+      action='store_true',
+      default=False)
 
   list_parser = sub_parsers.add_parser('list', help='list indexed path')
 
+  stats_parser = sub_parsers.add_parser('stats',
+                                        help='show index segment statistics')
+
+  migrate_parser = sub_parsers.add_parser(
+      'migrate', help='copy the index into another backend and switch to it')
+  migrate_parser.add_argument('-t',
+                              '--to',
+                              help='backend to migrate to',
+                              choices=INDEXER_BACKENDS,
+                              required=True)
+
   helm_ag_parser = sub_parsers.add_parser('helm-ag',
                                           help='compatible with helm-ag')
   helm_ag_parser.add_argument('--ignore',
@@ -114,9 +187,26 @@ def parse_arguments(cmd_line_args):
                                              help='helm find files')
   helm_files_parser.add_argument('pattern_and_path', type=str, nargs='+')
 
+  sub_parsers.add_parser(
+      'serve-stdio',
+      help='answer json-rpc search requests on stdin, one message a line')
+
   return parser.parse_args(cmd_line_args)
 
 
+def parse_client_arguments(cmd_line_args):
+  '''
+  parse a command line sent by a client, the help and usage argparse
+  prints go to stderr, stdout may be the channel to the client, return
+  None when the command line is invalid or only asks for help
+  '''
+  with redirect_stdout(sys.stderr):
+    try:
+      return parse_arguments(cmd_line_args)
+    except SystemExit:
+      return None
+
+
 def find_index_location(p):
   everything_path = find_pyeverything(p)
 
@@ -129,7 +219,40 @@ def find_index_location(p):
 
 
 def main():
-  run_with_args(sys.argv[1:], False)
+  lines = forward_to_service(sys.argv[1:])
+
+  if lines is None:
+    run_with_args(sys.argv[1:], False)
+    return
+
+  for p in lines:
+    print(p)
+
+
+def forward_to_service(cmd_line_args, cwd=None):
+  '''
+  run a query in the service running on the index location, it has the
+  index open already, return the output lines, None when no service runs
+  '''
+  args = parse_arguments(cmd_line_args)
+
+  if args.no_service or args.op not in QUERY_OPS:
+    return None
+
+  if cwd is None:
+    cwd = pathlib.Path('.').cwd()
+
+  location = args.location
+
+  if location is None and args.op != 'query':
+    location = find_index_location(cwd)
+
+  if location is None:
+    location = default_data_path()
+
+  location = pathlib.Path(location).expanduser().resolve()
+
+  return query_service(location.as_posix(), cmd_line_args, cwd.as_posix())
 
 
 __g_Indexeres = {}
@@ -147,12 +270,12 @@ def run_with_args(cmd_line_args,
     output_func(p)
 
 
-def run_with_args_iter(cmd_line_args, cache=True):
-  global __g_DefaultIndexer
-  global __g_Indexeres
-
+def run_with_args_iter(cmd_line_args, cache=True, cwd=None):
   args = parse_arguments(cmd_line_args)
 
+  if cwd is None:
+    cwd = pathlib.Path('.').cwd()
+
   if args.debug > 0:
     logging.getLogger('').setLevel(logging.DEBUG)
   else:
@@ -163,6 +286,12 @@ def run_with_args_iter(cmd_line_args, cache=True):
 
   logging.debug(f'operation:{args.op}')
 
+  if args.op == 'serve-stdio':
+    from pyeverything.frontend.cmd.stdio_server import serve_stdio
+
+    serve_stdio(args)
+    return
+
   if args.op == 'helm-ag' or args.op == 'helm-files':
     if len(args.pattern_and_path) > 2:
       logging.error(' '.join(sys.argv))
@@ -172,20 +301,13 @@ def run_with_args_iter(cmd_line_args, cache=True):
   if args.location is not None:
     logging.debug(f'index store location:{args.location.resolve().as_posix()}')
   elif args.op == 'helm-ag' or args.op == 'helm-files':
-    args.location = find_index_location(pathlib.Path('.').cwd())
-
-  if not cache:
-    indexer = Indexer(args.location, False)
-  elif args.location is None:
-    if __g_DefaultIndexer is None:
-      __g_DefaultIndexer = Indexer(args.location, False)
-
-    indexer = __g_DefaultIndexer
-  else:
-    if args.location not in __g_Indexeres:
-      __g_Indexeres[args.location] = Indexer(args.location, False)
+    args.location = find_index_location(cwd)
 
-    indexer = __g_Indexeres[args.location]
+  try:
+    indexer = get_indexer(args, cache)
+  except ValueError as e:
+    logging.error(f'failed open index, {e}')
+    return
 
   indexer.refresh_cache()
 
@@ -196,38 +318,14 @@ def run_with_args_iter(cmd_line_args, cache=True):
   elif args.op == 'list':
     for p, m in indexer.list_indexed_path():
       yield f'path:{p}, modified time:{m}'
-  elif args.op == 'helm-ag':
-    args.path = pathlib.Path('.').cwd().resolve().as_posix()
-    args.content = args.pattern_and_path[0]
-    args.no_color = True
-    args.ackmate = False
-    args.path_only = False
-    args.ignore_case = False
-    args.raw_pattern = False
-    args.limit = None
-    args.page = None
-    args.page_size = 20
-    args.no_group = True
-
-    if not has_pyeverything_index(indexer, pathlib.Path('.').cwd()):
-      call_tool_if_no_index(indexer, args)
-      return
+  elif args.op == 'stats':
+    yield from do_stats(indexer, args)
+  elif args.op == 'migrate':
+    yield from do_migrate(indexer, args)
+  elif args.op == 'helm-ag' or args.op == 'helm-files':
+    set_helm_query_args(args, cwd)
 
-    yield from do_query(indexer, args)
-  elif args.op == 'helm-files':
-    args.path = args.pattern_and_path[0]
-    args.content = None
-    args.no_color = True
-    args.ackmate = False
-    args.path_only = False
-    args.ignore_case = False
-    args.raw_pattern = False
-    args.limit = None
-    args.page = None
-    args.page_size = 20
-    args.no_group = True
-
-    if not has_pyeverything_index(indexer, pathlib.Path('.').cwd()):
+    if not has_pyeverything_index(indexer, cwd):
       call_tool_if_no_index(indexer, args)
       return
 
@@ -236,14 +334,91 @@ def run_with_args_iter(cmd_line_args, cache=True):
     parse_arguments(['-h'])
 
 
+def get_indexer(args, cache=True):
+  '''
+  the indexer of args.location, with cache it is kept open for the next
+  command line with the same location
+  '''
+  global __g_DefaultIndexer
+  global __g_Indexeres
+
+  create_indexer = partial(Indexer,
+                           args.location,
+                           False,
+                           args.backend,
+                           read_workers=args.read_workers,
+                           read_queue_depth=args.read_queue_depth,
+                           use_git_index=args.git_index)
+
+  if not cache:
+    return create_indexer()
+
+  if args.location is None:
+    if __g_DefaultIndexer is None:
+      __g_DefaultIndexer = create_indexer()
+
+    return __g_DefaultIndexer
+
+  if args.location not in __g_Indexeres:
+    __g_Indexeres[args.location] = create_indexer()
+
+  return __g_Indexeres[args.location]
+
+
+def set_helm_query_args(args, cwd):
+  '''
+  turn the helm-ag and helm-files arguments into query arguments
+  '''
+  if args.op == 'helm-ag':
+    # anchored, so the index looks up the files under cwd only
+    args.path = '^' + re.escape(cwd.resolve().as_posix() + '/')
+    args.content = args.pattern_and_path[0]
+  else:
+    args.path = args.pattern_and_path[0]
+    args.content = None
+
+  args.no_color = True
+  args.ackmate = False
+  args.path_only = False
+  args.ignore_case = False
+  args.raw_pattern = False
+  args.limit = None
+  args.page = None
+  args.page_size = 20
+  args.cursor = None
+  args.no_group = True
+  args.explain = False
+  args.unordered = False
+  args.sort = None
+
+
 def do_index(indexer, args):
   touch_time = get_touch_time(args)
 
   logging.debug(
       f'f={args.file} p={args.args} t={touch_time}, r={args.remove}, u={args.update}'
   )
+
+  # all the paths are indexed in one writer session
+  with indexer.batch() as reports:
+    __queue_index_tasks(indexer, args, touch_time)
+
+    if args.compact:
+      indexer.compact()
+
+  for op, path, count in reports:
+    if op == 'remove':
+      yield f'removed {count} documents under {path}'
+
+
+def __queue_index_tasks(indexer, args, touch_time):
   if args.file is not None:
     for line in args.file:
+      line = line.strip()
+
+      if len(line) == 0:
+        continue
+
       if args.remove:
         indexer.remove(line)
       elif touch_time is not None:
@@ -271,6 +446,28 @@ def do_index(indexer, args):
         indexer.update(p)
 
 
+def do_stats(indexer, args):
+  stats = indexer.segment_stats()
+
+  yield f'backend:{indexer.backend()}'
+  yield f'segments:{stats["segments"]}'
+  yield f'documents:{stats["documents"]}'
+  yield f'deleted documents:{stats["deleted"]}'
+  yield f'size:{stats["size"]}'
+
+
+def do_migrate(indexer, args):
+  backend = indexer.backend()
+
+  if backend == args.to:
+    yield f'index is already using {args.to}'
+    return
+
+  count = indexer.migrate(args.to)
+
+  yield f'migrated {count} documents from {backend} to {args.to}'
+
+
 def get_touch_time(args):
   if args.touch == '':
     return None
@@ -286,60 +483,127 @@ def get_touch_time(args):
 
 
 def get_path_matcher(args):
-  if args.path is None:
-    return None
+  return compile_path_matcher(args.path, args.ignore_case, args.raw_pattern)
 
-  path = args.path
 
-  if args.raw_pattern:
-    path = re.escape(path)
+def do_query(indexer, args, cancel=None):
+  '''
+  yield the output lines of the query, setting the cancel event stops
+  reading hits and matching the files queued for the verification threads
+  '''
+  # the hits are candidates, path and content are checked anyway later
+  plan = indexer.plan(args.path, args.content, args.ignore_case,
+                      args.raw_pattern, args.cursor is not None)
 
-  if args.ignore_case:
-    path = f'(?i){path}'
+  if args.explain:
+    yield (f'plan:{plan.strategy}, estimated candidates:{plan.estimate}, '
+           f'documents:{plan.total}')
 
-  path = f'(?m){path}'
-
-  return re.compile(path)
+  r = indexer.query(args.path, args.content, args.ignore_case,
+                    args.raw_pattern, plan)
 
+  # the result holds the searcher of the index until it is closed
+  try:
+    yield from __query_files(r, args, cancel)
+  finally:
+    r.close()
 
-def do_query(indexer, args):
-  # do not use args.path for index query if there is content query
-  # will check path anyway later
-  r = indexer.query(args.path if args.content is None else None, args.content,
-                    args.ignore_case, args.raw_pattern)
 
+def __query_files(r, args, cancel=None):
   if args.ackmate:
     args.no_color = True
 
   path_matcher = get_path_matcher(args)
 
-  if args.page is not None:
-    results = r.query_paged(args.page, args.page_size)
+  # the limit and the pages count the files left after the checks below,
+  # not the hits
+  skip = 0
+  limit = args.limit
+  ordered = not args.unordered
+
+  if args.cursor is not None:
+    try:
+      results = r.iter_hits(cursor=args.cursor or None)
+    except ValueError as e:
+      logging.error(f'failed resume query, {e}')
+      return
+
+    limit = args.page_size
+    ordered = True
   else:
-    results = r.query(args.limit)
+    results = r.iter_hits(args.sort)
+
+    if args.page is not None:
+      skip = (args.page - 1) * args.page_size
+      limit = args.page_size
+
+  candidates = 0
 
-  for hit in results:
-    path = hit['path']
+  def cancelled():
+    return cancel is not None and cancel.is_set()
 
-    p_path = pathlib.Path(path)
+  def count(hits):
+    nonlocal candidates
 
-    if path_matcher is not None and path_matcher.search(path) is None:
-      logging.debug(f'pat:{path} does not match pattern:{args.path}, skipping')
+    for hit in hits:
+      if cancelled():
+        return
+
+      candidates += 1
+      yield hit
+
+  def verify(hit):
+    if cancelled():
+      return False, None
+
+    return verify_hit(r, hit, path_matcher, args.content, args.path_only)
+
+  found_count = 0
+
+  for hit, (found, matching_info) in __verify_hits(count(results), verify,
+                                                   args.jobs, ordered):
+    if cancelled():
+      break
+
+    if not found:
       continue
 
-    if not p_path.exists():
-      logging.debug(f'path:{path} does not exist, skipping')
+    if skip > 0:
+      skip -= 1
       continue
 
-    if args.path_only or args.content is None:
-      matching_info = None
-    else:
-      matching_info = r.get_matching_info(hit, args.content)
+    yield from __output_match_info(hit['path'], matching_info, args)
+
+    found_count += 1
+    if limit is not None and found_count >= limit:
+      # the next page resumes after the last file output
+      if args.cursor is not None:
+        yield f'next cursor:{r.cursor(hit)}'
+      break
 
-    yield from __output_match_info(path, matching_info, args)
+  if args.explain:
+    yield f'actual candidates:{candidates}'
+
+
+def __verify_hits(hits, verify, jobs, ordered=True):
+  '''
+  yield (hit, verify(hit)) with the files read and matched by jobs threads,
+  in the order of the hits or in the order the files are done
+  '''
+  if jobs <= 0:
+    for hit in hits:
+      yield hit, verify(hit)
+    return
+
+  fetch = prefetch if ordered else prefetch_unordered
+
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    yield from fetch(pool, verify, hits, jobs * 4)
 
 
 def __output_match_info(path, match_info_iter, args):
+  if not args.no_color:
+    from termcolor import colored
 
   def output_path():
     if args.ackmate:
@@ -449,6 +713,8 @@ def call_ag(args):
   if args.op == 'helm-files':
     ag_cmds.extend(['.'])
 
+  import subprocess
+
   subprocess.run(ag_cmds)
 
 
@@ -470,6 +736,8 @@ def call_rg(args):
 
   rg_cmds.extend(args.pattern_and_path)
 
+  import subprocess
+
   subprocess.run(rg_cmds)
 
 
@@ -488,27 +756,33 @@ def __process_directory(file_proc, q, q_result, do_quit):
       continue
 
     try:
-      for child in p.iterdir():
-        if child.is_file():
-          file_proc(child)
-        elif child.is_dir():
-          q.put(child)
+      files, directories = scan_directory(*p)
+
+      for child in files:
+        file_proc(child)
+
+      for d in directories:
+        q.put(d)
+    except OSError:
+      logging.debug(f'failed scan directory:{p}')
     finally:
       q.task_done()
 
 
 def helm_files_file_proc(path_matcher, q_result, child):
-  child_path = child.resolve().as_posix()
+  child_path = child.real_path
   if path_matcher.search(child_path) is not None:
     q_result.put(child_path)
 
 
 def helm_ag_file_proc(args, path_matcher, pattern_matcher, q_result, child):
-  child_path = child.resolve().as_posix()
+  child_path = child.real_path
 
   if path_matcher.search(child_path) is None:
     return
 
+  from binaryornot.check import is_binary
+
   if is_binary(child_path):
     return
 
@@ -523,8 +797,10 @@ def helm_ag_file_proc(args, path_matcher, pattern_matcher, q_result, child):
 
 
 def walk_directory(args):
+  ctx = process_context()
+
   root_path = pathlib.Path('.').cwd()
-  q_result = Queue()
+  q_result = ctx.Queue()
 
   pattern_matcher = re.compile(f'(?m){args.pattern_and_path[0]}')
   if args.op == 'helm-files':
@@ -538,24 +814,24 @@ def walk_directory(args):
   else:
     raise ValueError(f'unsupported op:{args.op}')
 
-  process_count = int(os.cpu_count() / 2 or 1)
+  process_count = max(1, (os.cpu_count() or 1) // 2)
 
   proc = [None] * process_count
-  q = JoinableQueue()
-  q.put(root_path)
+  q = ctx.JoinableQueue()
+  q.put((root_path.as_posix(), False))
 
-  do_quit = Value('i')
+  do_quit = ctx.Value('i')
 
   do_quit.value = 0
 
   for i in range(process_count):
-    proc[i] = Process(target=__process_directory,
-                      args=(
-                          process_func,
-                          q,
-                          q_result,
-                          do_quit,
-                      ))
+    proc[i] = ctx.Process(target=__process_directory,
+                          args=(
+                              process_func,
+                              q,
+                              q_result,
+                              do_quit,
+                          ))
     proc[i].start()
 
   q.join()
@@ -570,6 +846,8 @@ def walk_directory(args):
 
 
 def _run_cmd(cmd_args, dir=None):
+  import subprocess
+
   proc = subprocess.run(cmd_args, capture_output=True, cwd=dir)
 
   proc.check_returncode()
@@ -607,10 +885,8 @@ def call_tool_if_no_index(indexer, args):
 
 
 if __name__ == '__main__':
+  from multiprocessing import freeze_support
+
   freeze_support()
-  try:
-    set_start_method('spawn' if sys.platform == 'win32' else 'forkserver')
-  except:
-    pass
 
   main()
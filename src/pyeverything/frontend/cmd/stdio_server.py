@@ -0,0 +1,239 @@
+import json
+import logging
+import pathlib
+import sys
+import threading
+
+from pyeverything.frontend.cmd.client import QUERY_OPS
+from pyeverything.frontend.cmd.run import do_query, find_index_location, get_indexer, has_pyeverything_index, parse_client_arguments, set_helm_query_args
+
+# json-rpc error codes, the cancelled request code is the one of the
+# language server protocol, editors know it already
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+REQUEST_CANCELLED = -32800
+NO_INDEX = -32001
+SEARCH_FAILED = -32002
+
+
+class _Search(object):
+
+  def __init__(self, request_id, cancel, thread):
+    super().__init__()
+
+    self.request_id = request_id
+    self.cancel = cancel
+    self.thread = thread
+
+
+class StdioServer(object):
+  '''
+  one json-rpc 2.0 message a line on input and output, a search request
+  has the command line of a query, helm-ag or helm-files and the working
+  directory of the editor in its params, the output lines are sent as
+  search/line notifications before the response
+
+    {"jsonrpc": "2.0", "id": 1, "method": "search",
+     "params": {"args": ["helm-ag", "foo"], "cwd": "/src"}}
+
+  a search cancels the one still running, so does cancel with its id,
+  the indexers stay open between the searches
+  '''
+
+  def __init__(self, args, input=None, output=None):
+    super().__init__()
+
+    self.args_ = args
+    self.input_ = sys.stdin if input is None else input
+    self.output_ = sys.stdout if output is None else output
+    self.lock_ = threading.Lock()
+    self.search_ = None
+
+  def serve(self):
+    try:
+      for line in self.input_:
+        line = line.strip()
+
+        if len(line) == 0:
+          continue
+
+        try:
+          message = json.loads(line)
+        except ValueError:
+          self.__send_error(None, PARSE_ERROR, 'parse error')
+          continue
+
+        if (not isinstance(message, dict) or message.get('jsonrpc') != '2.0'
+            or not isinstance(message.get('method'), str)):
+          self.__send_error(None, INVALID_REQUEST, 'invalid request')
+          continue
+
+        try:
+          if not self.__dispatch(message):
+            break
+        except Exception as e:
+          logging.exception(f'failed handle message:{message}')
+          self.__send_error(message.get('id'), INTERNAL_ERROR, str(e))
+    finally:
+      self.__cancel_search()
+
+  def __dispatch(self, message):
+    method = message['method']
+    request_id = message.get('id')
+    params = message.get('params', {})
+
+    if not isinstance(params, dict):
+      if request_id is not None:
+        self.__send_error(request_id, INVALID_PARAMS,
+                          'params must be an object')
+      return True
+
+    if method == 'search':
+      self.__search(request_id, params)
+    elif method == 'cancel':
+      if (self.search_ is not None
+          and self.search_.request_id == params.get('id')):
+        self.__cancel_search()
+
+      if request_id is not None:
+        self.__send_result(request_id, None)
+    elif method == 'shutdown':
+      self.__cancel_search()
+
+      if request_id is not None:
+        self.__send_result(request_id, None)
+
+      return False
+    elif request_id is not None:
+      self.__send_error(request_id, METHOD_NOT_FOUND,
+                        f'method not found:{method}')
+
+    return True
+
+  def __cancel_search(self):
+    if self.search_ is None:
+      return
+
+    self.search_.cancel.set()
+    self.search_.thread.join()
+    self.search_ = None
+
+  def __search(self, request_id, params):
+    # the editor only wants the results of what was typed last
+    self.__cancel_search()
+
+    cmd_line_args = params.get('args')
+    cwd = params.get('cwd')
+
+    if (not isinstance(cmd_line_args, list)
+        or not all(isinstance(a, str) for a in cmd_line_args)):
+      self.__send_error(request_id, INVALID_PARAMS, 'args must be strings')
+      return
+
+    if cwd is not None and not isinstance(cwd, str):
+      self.__send_error(request_id, INVALID_PARAMS, 'cwd must be a string')
+      return
+
+    cwd = pathlib.Path(cwd or pathlib.Path('.').cwd())
+
+    args = parse_client_arguments(cmd_line_args)
+
+    if args is None:
+      self.__send_error(request_id, INVALID_PARAMS,
+                        f'invalid args:{cmd_line_args}')
+      return
+
+    if args.op not in QUERY_OPS:
+      self.__send_error(request_id, INVALID_PARAMS,
+                        f'unsupported operation:{args.op}')
+      return
+
+    if args.location is None:
+      args.location = self.args_.location
+
+    if args.op != 'query':
+      if len(args.pattern_and_path) > 2:
+        self.__send_error(request_id, INVALID_PARAMS,
+                          f'invalid args:{cmd_line_args}')
+        return
+
+      if args.location is None:
+        args.location = find_index_location(cwd)
+
+      set_helm_query_args(args, cwd)
+
+    try:
+      indexer = get_indexer(args)
+      indexer.refresh_cache()
+    except Exception as e:
+      logging.exception(f'failed open index:{args.location}')
+      self.__send_error(request_id, SEARCH_FAILED, str(e))
+      return
+
+    # the editor runs ag or rg outside of the indexed paths
+    if args.op != 'query' and not has_pyeverything_index(indexer, cwd):
+      self.__send_error(request_id, NO_INDEX,
+                        f'no index for:{cwd.as_posix()}')
+      return
+
+    cancel = threading.Event()
+    thread = threading.Thread(target=self.__run_search,
+                              args=(request_id, indexer, args, cancel),
+                              daemon=True)
+    self.search_ = _Search(request_id, cancel, thread)
+    thread.start()
+
+  def __run_search(self, request_id, indexer, args, cancel):
+    line_count = 0
+    lines = do_query(indexer, args, cancel)
+
+    try:
+      for line in lines:
+        if cancel.is_set():
+          break
+
+        self.__send({
+            'jsonrpc': '2.0',
+            'method': 'search/line',
+            'params': {
+                'id': request_id,
+                'line': line
+            }
+        })
+        line_count += 1
+    except Exception as e:
+      logging.exception(f'failed search:{request_id}')
+      self.__send_error(request_id, SEARCH_FAILED, str(e))
+      return
+    finally:
+      lines.close()
+
+    if cancel.is_set():
+      self.__send_error(request_id, REQUEST_CANCELLED, 'request cancelled')
+    else:
+      self.__send_result(request_id, {'lines': line_count})
+
+  def __send_result(self, request_id, result):
+    self.__send({'jsonrpc': '2.0', 'id': request_id, 'result': result})
+
+  def __send_error(self, request_id, code, message):
+    self.__send({
+        'jsonrpc': '2.0',
+        'id': request_id,
+        'error': {
+            'code': code,
+            'message': message
+        }
+    })
+
+  def __send(self, message):
+    with self.lock_:
+      self.output_.write(json.dumps(message) + '\n')
+      self.output_.flush()
+
+
+def serve_stdio(args):
+  StdioServer(args).serve()
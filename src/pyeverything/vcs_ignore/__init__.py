@@ -1,4 +1,6 @@
+import os
 import pathlib
+import re
 import globre
 import logging
 
@@ -14,10 +16,19 @@ class VCSIgnore(object):
   def __init__(self, path, parent=None):
     super().__init__()
 
+    if isinstance(path, pathlib.Path):
+      path = path.as_posix()
+
     self.path_ = path
+    self.prefix_ = path.rstrip('/') + '/'
     self.parent_ = parent
     self.patterns_ = []
 
+    # patterns of the same kind which end up in a row are matched by one
+    # regex, the last matching run decides, the runs are kept for files
+    # and for directories
+    self.compiled_ = None
+
   def add_ignore_pattern(self, pattern):
     if pattern.startswith('#'):
       return
@@ -43,28 +54,70 @@ class VCSIgnore(object):
       extra_pattern = pattern
       pattern = '**/' + pattern
 
+    dir_only = False
     if pattern.endswith('/'):
       if white_list:
-        # if white list all under, we should white list itself
-        self.patterns_.append((pattern[:-1], True))
+        # if white list all under, we should white list itself, also at the
+        # top where **/ does not match
+        if extra_pattern is not None:
+          self.__add_pattern(extra_pattern[:-1], True)
+
+        self.__add_pattern(pattern[:-1], True)
+      else:
+        # the directory itself is ignored, so the walker prunes it
+        dir_only = True
 
       pattern = pattern + '**'
       if extra_pattern:
         extra_pattern += '**'
 
     if extra_pattern is not None:
-      self.patterns_.append((extra_pattern, white_list))
+      self.__add_pattern(extra_pattern, white_list, dir_only)
+
+    self.__add_pattern(pattern, white_list, dir_only)
+
+  def __add_pattern(self, pattern, white_list, dir_only=False):
+    try:
+      regex = globre.compile(pattern).pattern
+      dir_regex = regex
+
+      if dir_only:
+        # pattern is <dir>/**, match <dir> and everything under it
+        dir_regex = f'(?:{globre.compile(pattern[:-3]).pattern})(?:/.*)?'
+    except ValueError:
+      logging.warning(f'invalid ignore pattern:{pattern} in {self.path_}')
+      return
+
+    self.patterns_.append((pattern, white_list, regex, dir_regex))
+    self.compiled_ = None
+
+  def __compile(self, is_dir):
+    '''
+    return [(regex, white_list)] of the runs of patterns of the same kind
+    with the last run first
+    '''
+    runs = []
+
+    for _, white_list, regex, dir_regex in self.patterns_:
+      if is_dir:
+        regex = dir_regex
+
+      if len(runs) > 0 and runs[-1][1] == white_list:
+        runs[-1][0].append(regex)
+      else:
+        runs.append(([regex], white_list))
 
-    self.patterns_.append((pattern, white_list))
+    return [(re.compile('|'.join(f'(?:{r})' for r in regexes)), white_list)
+            for regexes, white_list in reversed(runs)]
 
   def load_ignore_patterns(self, path):
-    if isinstance(path, str):
-      path = pathlib.Path(path)
+    if isinstance(path, pathlib.Path):
+      path = path.as_posix()
 
-    if not (path.exists() and path.is_file()):
+    if not os.path.isfile(path):
       return
 
-    with path.open(encoding='utf-8') as f:
+    with open(path, encoding='utf-8') as f:
       for line in f:
         self.add_ignore_pattern(line)
 
@@ -72,33 +125,39 @@ class VCSIgnore(object):
     if path is None:
       path = self.path_
 
-    if isinstance(path, str):
-      path = pathlib.Path(path)
+    if isinstance(path, pathlib.Path):
+      path = path.as_posix()
 
     for f in VCSIgnore.IGNORE_PATTERN_FILES:
-      p = path / f
+      self.load_ignore_patterns(os.path.join(path, f))
 
-      if p.exists() and p.is_file():
-        self.load_ignore_patterns(p)
+  def __match(self, rel_path, is_dir):
+    if self.compiled_ is None:
+      self.compiled_ = (self.__compile(False), self.__compile(True))
 
-  def ignore_path(self, path):
-    if isinstance(path, str):
-      path = pathlib.Path(path)
+    for regex, white_list in self.compiled_[1 if is_dir else 0]:
+      if regex.fullmatch(rel_path) is not None:
+        return not white_list
 
-    if len(self.patterns_) == 0:
-      return False if self.parent_ is None else self.parent_.ignore_path(path)
+    return None
 
-    rel_path = path.relative_to(self.path_).as_posix()
+  def ignore_path(self, path, is_dir=False):
+    '''
+    a directory is ignored by the patterns with a trailing slash itself, so
+    the walker does not descend into it
+    '''
+    if isinstance(path, pathlib.Path):
+      path = path.as_posix()
 
-    ignore = None
+    vi = self
 
-    for pattern, white_list in self.patterns_:
-      match = globre.match(pattern, rel_path) is not None
+    while vi is not None:
+      if len(vi.patterns_) > 0 and path.startswith(vi.prefix_):
+        ignore = vi.__match(path[len(vi.prefix_):], is_dir)
 
-      if match:
-        ignore = not white_list
+        if ignore is not None:
+          return ignore
 
-    if not (ignore is None):
-      return ignore
+      vi = vi.parent_
 
-    return False if self.parent_ is None else self.parent_.ignore_path(path)
+    return False
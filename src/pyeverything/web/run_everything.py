@@ -1,43 +1,115 @@
-from . import create_app
-from .service import start_indexer
-
-import argparse
-import logging
-import pathlib
-
-
-def parse_arguments():
-  parser = argparse.ArgumentParser()
-
-  parser.add_argument("-d",
-                      "--debug",
-                      help="print debug information",
-                      action="count",
-                      default=0)
-  parser.add_argument("-p", "--port", help="the server port", default=8192)
-  parser.add_argument("-l",
-                      "--location",
-                      help="location which index file stores in",
-                      type=pathlib.Path,
-                      required=False,
-                      default=None)
-
-  return parser.parse_args()
-
-
-def main():
-  args = parse_arguments()
-
-  if args.debug > 0:
-    logging.getLogger('').setLevel(logging.DEBUG)
-
-  if args.location is not None:
-    logging.debug(f'index store location:{args.location.resolve().as_posix()}')
-
-  start_indexer(args.location)
-
-  create_app().run(debug=(args.debug > 0), port=args.port)
-
-
-if __name__ == '__main__':
-  main()
+from . import create_app
+from .service import start_indexer
+from .service.workers import QueryWorkers
+from pyeverything.core.indexer import INDEXER_BACKENDS
+
+import argparse
+import logging
+import pathlib
+
+
+def parse_arguments():
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument("-d",
+                      "--debug",
+                      help="print debug information",
+                      action="count",
+                      default=0)
+  parser.add_argument("-p",
+                      "--port",
+                      help="the server port",
+                      type=int,
+                      default=8192)
+  parser.add_argument("--host",
+                      help="the address the server listens on",
+                      default='127.0.0.1')
+  parser.add_argument(
+      "-w",
+      "--workers",
+      help=
+      "query worker processes, 0 runs queries in the process writing the index",
+      type=int,
+      default=0)
+  parser.add_argument("-l",
+                      "--location",
+                      help="location which index file stores in",
+                      type=pathlib.Path,
+                      required=False,
+                      default=None)
+  parser.add_argument("--no-watch",
+                      help="do not watch indexed paths for changes",
+                      action="store_true",
+                      default=False)
+  parser.add_argument(
+      "--no-query-socket",
+      help="do not answer command line queries on a unix socket",
+      action="store_true",
+      default=False)
+  parser.add_argument("--batch-size",
+                      help="max number of queued index tasks run in one commit",
+                      type=int,
+                      default=1000)
+  parser.add_argument("--commit-latency",
+                      help="seconds to wait for more index tasks before commit",
+                      type=float,
+                      default=1.0)
+  parser.add_argument("--read-workers",
+                      help="threads reading files ahead of the index writer",
+                      type=int,
+                      default=4)
+  parser.add_argument("--read-queue-depth",
+                      help="max number of files read ahead of the writer",
+                      type=int,
+                      default=64)
+  parser.add_argument(
+      "--git-index",
+      help="list the files tracked by git from the git index of a root",
+      action="store_true",
+      default=False)
+  parser.add_argument(
+      "--compact-idle",
+      help="seconds the indexer must be idle before segments are merged",
+      type=float,
+      default=300.0)
+  parser.add_argument("--max-segments",
+                      help="merge segments at once when there are more",
+                      type=int,
+                      default=16)
+  parser.add_argument("-b",
+                      "--backend",
+                      help="indexer backend, remembered in the index location",
+                      choices=INDEXER_BACKENDS,
+                      required=False,
+                      default=None)
+
+  return parser.parse_args()
+
+
+def main():
+  args = parse_arguments()
+
+  if args.debug > 0:
+    logging.getLogger('').setLevel(logging.DEBUG)
+
+  if args.location is not None:
+    logging.debug(f'index store location:{args.location.resolve().as_posix()}')
+
+  start_indexer(args.location, args.backend, not args.no_watch,
+                args.batch_size, args.commit_latency, args.compact_idle,
+                args.max_segments, args.read_workers, args.read_queue_depth,
+                args.git_index, not args.no_query_socket)
+
+  if args.workers <= 0:
+    create_app().run(debug=(args.debug > 0), host=args.host, port=args.port)
+    return
+
+  # this process only writes the index, the workers read it
+  workers = QueryWorkers(create_app, args.host, args.port, args.workers,
+                         args.location, args.backend, args.debug > 0)
+  workers.start()
+  workers.serve_forever()
+
+
+if __name__ == '__main__':
+  main()
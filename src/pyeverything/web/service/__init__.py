@@ -1,16 +1,64 @@
 import atexit
+import logging
 
 from .index import index_api
 from .indexer import indexer
+from .query_socket import QuerySocketServer
+from pyeverything.core.compaction import CompactionScheduler
+from pyeverything.core.watcher import IndexWatcher, is_watch_supported
 
+__g_watcher = None
+__g_compaction = None
+__g_query_socket = None
 
-def start_indexer(index_location=None):
-  indexer(index_location).start()
+
+def start_indexer(index_location=None,
+                  backend=None,
+                  watch=True,
+                  batch_size=1000,
+                  commit_latency=1.0,
+                  compact_idle_time=300.0,
+                  max_segments=16,
+                  read_workers=4,
+                  read_queue_depth=64,
+                  use_git_index=False,
+                  query_socket=True):
+  global __g_watcher
+  global __g_compaction
+  global __g_query_socket
+
+  indexer(index_location, backend, batch_size, commit_latency, read_workers,
+          read_queue_depth, use_git_index).start()
+
+  if watch:
+    if is_watch_supported():
+      __g_watcher = IndexWatcher(indexer())
+      __g_watcher.start()
+    else:
+      logging.warning('file system watching is not supported on this platform')
+
+  __g_compaction = CompactionScheduler(indexer(),
+                                       idle_time=compact_idle_time,
+                                       max_segments=max_segments)
+  __g_compaction.start()
+
+  if query_socket:
+    __g_query_socket = QuerySocketServer(indexer().data_path_.as_posix())
+    __g_query_socket.start()
 
   atexit.register(stop_indexer)
 
 
 def stop_indexer():
+  if __g_query_socket is not None:
+    __g_query_socket.stop()
+
+  if __g_watcher is not None:
+    __g_watcher.stop()
+
+  if __g_compaction is not None:
+    __g_compaction.stop()
+
   indexer().stop()
 
 
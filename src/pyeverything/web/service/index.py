@@ -1,16 +1,27 @@
-from flask import Blueprint, request, abort
+import json
+import re
 
-from .indexer import indexer
+from flask import Blueprint, Response, request, abort, stream_with_context
+
+from .indexer import indexer, put_index_task
+from pyeverything.core.indexer.query_result import HIT_ORDERS, compile_path_matcher, verify_hit
 
 index_api = Blueprint('index_api', __name__)
 
 
+def _query_indexer():
+  # the index is written by another process, pick up its commits
+  indexer().refresh_cache()
+
+  return indexer()
+
+
 @index_api.route('/i', methods=['POST'])
 def add_index():
   data = request.get_json()
 
   for p in data:
-    indexer().index(p)
+    put_index_task('index', p)
 
   return {'result': 'ok'}
 
@@ -29,11 +40,24 @@ def delete_index():
     abort(500)
     return
 
-  indexer().remove(path)
+  put_index_task('remove', path)
 
   return {'result': 'ok'}
 
 
+def _verified_hits(result, hits, path_matcher, content, path_only=False):
+  '''
+  yield (hit, matching info) for the hits which still match, the hits of
+  every strategy are candidates
+  '''
+  for hit in hits:
+    found, matching_info = verify_hit(result, hit, path_matcher, content,
+                                      path_only)
+
+    if found:
+      yield hit, matching_info
+
+
 @index_api.route('/q', methods=['GET'])
 def query_index():
   path = None
@@ -51,11 +75,144 @@ def query_index():
   if content and len(content) == 0:
     content = None
 
-  result = indexer().query(path, content)
+  order = request.args.get('sort')
+
+  if order is not None and order not in HIT_ORDERS:
+    abort(400)
+    return
+
+  cursor = request.args.get('cursor')
+  page_size = request.args.get('page_size', type=int)
+
+  if cursor is not None and len(cursor) == 0:
+    cursor = None
+
+  paged = cursor is not None or page_size is not None
+
+  if paged and (order is not None or page_size is None or page_size <= 0):
+    abort(400)
+    return
+
+  try:
+    path_matcher = compile_path_matcher(path)
+  except re.error:
+    abort(400)
+    return
+
+  ix = _query_indexer()
+  plan = ix.plan(path, content, resumable=paged)
+  result = ix.query(path, content, plan=plan)
+
+  try:
+    if not paged:
+      return {
+          "result": [
+              hit['path'] for hit, _ in _verified_hits(
+                  result, result.iter_hits(order), path_matcher, content)
+          ]
+      }
+
+    try:
+      hits = result.iter_hits(cursor=cursor)
+    except ValueError:
+      abort(400)
+      return
+
+    # the page counts the files which still match, the next page resumes
+    # after the last one
+    paths = []
+    next_cursor = None
+
+    for hit, _ in _verified_hits(result, hits, path_matcher, content):
+      paths.append(hit['path'])
+
+      if len(paths) >= page_size:
+        next_cursor = result.cursor(hit)
+        break
+
+    return {"result": paths, "cursor": next_cursor}
+  finally:
+    result.close()
+
+
+def _flag(name):
+  return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def _stream_records(result, hits, path_matcher, content, path_only, limit):
+  '''
+  yield the json lines of the files as they are verified, the server closes
+  the generator when the client goes away, which stops the query
+  '''
+  found_count = 0
+
+  for hit, matching_info in _verified_hits(result, hits, path_matcher,
+                                           content, path_only):
+    path = hit['path']
+
+    if matching_info is None:
+      yield json.dumps({'path': path}) + '\n'
+    else:
+      yield ''.join(
+          json.dumps({
+              'path': path,
+              'line': l + 1,
+              'column': start,
+              'length': length,
+              'text': text
+          }) + '\n' for l, start, length, text in matching_info)
+
+    found_count += 1
+    if limit is not None and found_count >= limit:
+      # the last line resumes the query after this file
+      yield json.dumps({'cursor': result.cursor(hit)}) + '\n'
+      break
+
+
+@index_api.route('/q/stream', methods=['GET'])
+def stream_query_index():
+  path = request.args.get('path') or None
+  content = request.args.get('content') or None
+  cursor = request.args.get('cursor') or None
+  limit = request.args.get('limit', type=int)
+  ignore_case = _flag('ignore_case')
+  raw_pattern = _flag('raw_pattern')
+  path_only = _flag('path_only')
+
+  if path is None and content is None:
+    abort(400)
+    return
+
+  if limit is not None and limit <= 0:
+    abort(400)
+    return
+
+  try:
+    path_matcher = compile_path_matcher(path, ignore_case, raw_pattern)
+  except re.error:
+    abort(400)
+    return
+
+  resumable = cursor is not None or limit is not None
+  ix = _query_indexer()
+  plan = ix.plan(path, content, ignore_case, raw_pattern, resumable)
+  result = ix.query(path, content, ignore_case, raw_pattern, plan)
+
+  try:
+    hits = result.iter_hits(cursor=cursor)
+  except ValueError:
+    result.close()
+    abort(400)
+    return
+
+  response = Response(stream_with_context(
+      _stream_records(result, hits, path_matcher, content, path_only, limit)),
+                      mimetype='application/x-ndjson')
 
-  items = result.query()
+  # also when the client goes away before the first line
+  response.call_on_close(result.close)
 
-  return {"result": [x['path'] for x in items]}
+  return response
 
 
 @index_api.route('/i/refresh', methods=['POST'])
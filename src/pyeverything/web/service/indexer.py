@@ -1,12 +1,45 @@
-from pyeverything.core.indexing import Indexer
-
-__g_indexer = None
-
-
-def indexer(location=None):
-  global __g_indexer
-
-  if __g_indexer is None:
-    __g_indexer = Indexer(location)
-
-  return __g_indexer
+from pyeverything.core.indexing import Indexer
+
+__g_indexer = None
+
+# in a query worker the queue the index tasks are sent to the writer on
+__g_control = None
+
+
+def indexer(location=None,
+            backend=None,
+            batch_size=1000,
+            commit_latency=1.0,
+            read_workers=4,
+            read_queue_depth=64,
+            use_git_index=False,
+            control=None):
+  global __g_indexer
+  global __g_control
+
+  if __g_indexer is None:
+    __g_indexer = Indexer(location,
+                          backend=backend,
+                          batch_size=batch_size,
+                          commit_latency=commit_latency,
+                          read_workers=read_workers,
+                          read_queue_depth=read_queue_depth,
+                          use_git_index=use_git_index)
+
+  if control is not None:
+    __g_control = control
+
+  return __g_indexer
+
+
+def put_index_task(op, path):
+  '''
+  index or remove path, a query worker sends the task to the process
+  running the index writer
+  '''
+  if __g_control is not None:
+    __g_control.put((op, path))
+  elif op == 'remove':
+    indexer().remove(path)
+  else:
+    indexer().index(path)
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import pathlib
+import socket
+import socketserver
+import threading
+
+from .indexer import indexer
+from pyeverything.frontend.cmd.client import QUERY_OPS, query_socket_path
+from pyeverything.frontend.cmd.run import do_query, has_pyeverything_index, parse_client_arguments, set_helm_query_args
+
+
+def _run_query(cmd_line_args, cwd):
+  '''
+  return the output lines of the command line, None when the command line
+  has to run in the client
+  '''
+  args = parse_client_arguments(cmd_line_args)
+
+  if args is None or args.op not in QUERY_OPS:
+    return None
+
+  ix = indexer()
+
+  if args.op != 'query':
+    if len(args.pattern_and_path) > 2:
+      return None
+
+    set_helm_query_args(args, cwd)
+
+    # the client runs ag or rg outside of the indexed paths
+    if not has_pyeverything_index(ix, cwd):
+      return None
+
+  ix.refresh_cache()
+
+  return do_query(ix, args)
+
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+  '''
+  a json line with the command line and the working directory of the
+  client comes in, json lines with the output lines go out
+  '''
+
+  def handle(self):
+    lines = None
+
+    try:
+      request = json.loads(self.rfile.readline())
+      lines = _run_query(request['args'], pathlib.Path(request['cwd']))
+    except:
+      logging.exception('failed read query request')
+
+    if lines is None:
+      self.__send({'fallback': True})
+      return
+
+    try:
+      for line in lines:
+        self.__send({'line': line})
+
+      self.__send({'done': True})
+    except OSError:
+      # the client went away, stop the query
+      logging.debug('query client disconnected')
+    except Exception as e:
+      logging.exception('failed query')
+      self.__send({'error': str(e), 'done': True})
+    finally:
+      lines.close()
+
+  def __send(self, message):
+    self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+
+
+class QuerySocketServer(object):
+  '''
+  answer the queries of the command line on a unix socket in the index
+  location, so it does not have to open the index itself
+  '''
+
+  def __init__(self, location):
+    super().__init__()
+
+    self.path_ = query_socket_path(location)
+    self.server_ = None
+    self.thread_ = None
+
+  def start(self):
+    if not hasattr(socket, 'AF_UNIX'):
+      logging.warning('unix sockets are not supported on this platform')
+      return
+
+    if self.__in_use():
+      logging.warning(f'another service answers queries on {self.path_}')
+      return
+
+    try:
+      os.unlink(self.path_)
+    except FileNotFoundError:
+      pass
+
+    self.server_ = socketserver.ThreadingUnixStreamServer(
+        self.path_, _QueryHandler)
+    self.server_.daemon_threads = True
+
+    self.thread_ = threading.Thread(target=self.server_.serve_forever,
+                                    daemon=True)
+    self.thread_.start()
+
+    logging.info(f'answer queries on {self.path_}')
+
+  def __in_use(self):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+      try:
+        sock.connect(self.path_)
+        return True
+      except OSError:
+        return False
+
+  def stop(self):
+    if self.server_ is None:
+      return
+
+    self.server_.shutdown()
+    self.server_.server_close()
+    self.server_ = None
+
+    try:
+      os.unlink(self.path_)
+    except FileNotFoundError:
+      pass
@@ -0,0 +1,123 @@
+import logging
+import signal
+import socket
+import threading
+
+from werkzeug.serving import make_server
+
+from .indexer import indexer, put_index_task
+from pyeverything.core.indexing import process_context
+
+
+def _serve_queries(create_app, sock, host, port, control, location, backend,
+                   debug):
+  '''
+  run in a query worker process, the index is only read here, the index
+  tasks are sent back to the writer over control
+  '''
+  logging.getLogger('').setLevel(logging.DEBUG if debug else logging.INFO)
+
+  indexer(location, backend, control=control)
+
+  server = make_server(host,
+                       port,
+                       create_app(),
+                       threaded=True,
+                       fd=sock.fileno())
+  server.serve_forever()
+
+
+class QueryWorkers(object):
+  '''
+  query worker processes accepting on one listening socket, the process
+  starting them runs the index writer and the tasks the workers send it
+  '''
+
+  def __init__(self,
+               create_app,
+               host,
+               port,
+               workers,
+               location=None,
+               backend=None,
+               debug=False):
+    super().__init__()
+
+    self.create_app_ = create_app
+    self.host_ = host
+    self.port_ = port
+    self.workers_ = workers
+    self.location_ = location
+    self.backend_ = backend
+    self.debug_ = debug
+    self.socket_ = None
+    self.control_ = None
+    self.processes_ = []
+    self.dispatch_thread_ = None
+
+  def start(self):
+    ctx = process_context()
+
+    self.socket_ = socket.create_server((self.host_, self.port_), backlog=128)
+    self.control_ = ctx.Queue()
+
+    self.dispatch_thread_ = threading.Thread(target=self.__dispatch,
+                                             daemon=True)
+    self.dispatch_thread_.start()
+
+    for _ in range(self.workers_):
+      p = ctx.Process(target=_serve_queries,
+                      args=(self.create_app_, self.socket_, self.host_,
+                            self.port_, self.control_, self.location_,
+                            self.backend_, self.debug_),
+                      daemon=True)
+      p.start()
+      self.processes_.append(p)
+
+    logging.info(f'{self.workers_} query workers serving on '
+                 f'{self.host_}:{self.port_}')
+
+  def __dispatch(self):
+    while True:
+      task = self.control_.get()
+
+      if task is None:
+        break
+
+      op, path = task
+
+      try:
+        put_index_task(op, path)
+      except:
+        logging.exception(f'failed {op} path:{path}')
+
+  def serve_forever(self):
+    # the workers are stopped on terminate as well
+    signal.signal(signal.SIGTERM, lambda *args: self.stop())
+
+    try:
+      for p in self.processes_:
+        p.join()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      self.stop()
+
+  def stop(self):
+    for p in self.processes_:
+      if p.is_alive():
+        p.terminate()
+
+    for p in self.processes_:
+      p.join()
+
+    self.processes_ = []
+
+    if self.control_ is not None:
+      self.control_.put(None)
+      self.dispatch_thread_.join()
+      self.control_ = None
+
+    if self.socket_ is not None:
+      self.socket_.close()
+      self.socket_ = None
@@ -0,0 +1,98 @@
+import pathlib
+
+from pyeverything.core.indexing import Indexer, coalesce_tasks
+
+
+def _index(path):
+  return (pathlib.Path(path), False, False, None, False, None, False)
+
+
+def _update(path):
+  return (pathlib.Path(path), False, False, None, True, None, False)
+
+
+def _sync(path, files):
+  return (pathlib.Path(path), False, False, None, False, files, False)
+
+
+def _remove(path):
+  return (pathlib.Path(path), False, True, None, False, None, False)
+
+
+def test_duplicates_dropped():
+  assert coalesce_tasks([_index('/r'), _index('/r')]) == [_index('/r')]
+  assert coalesce_tasks([_update('/r'), _update('/r')]) == [_update('/r')]
+
+
+def test_nested_index_covered_and_touched():
+  batch = coalesce_tasks([_index('/r'), _index('/r/a')])
+
+  assert batch[0] == _index('/r')
+  assert len(batch) == 2 and batch[1][0] == '/r/a' and batch[1][3] is not None
+
+
+def test_update_covers_index_and_sync():
+  assert coalesce_tasks([_index('/r'), _update('/r')]) == [_update('/r')]
+  assert coalesce_tasks([_sync('/r/a', ['/r/a/x']),
+                         _update('/r')]) == [_update('/r')]
+
+
+def test_index_does_not_cover_update():
+  # indexing never deletes, the update would lose its deletions
+  assert _update('/r') in coalesce_tasks([_index('/r'), _update('/r')])
+  assert _update('/r/a') in coalesce_tasks([_index('/r'), _update('/r/a')])
+  assert _sync('/r/a', ['/r/a/x']) in coalesce_tasks(
+      [_index('/r'), _sync('/r/a', ['/r/a/x'])])
+
+
+def test_remove_splits_runs():
+  tasks = [_index('/r'), _remove('/r'), _index('/r')]
+
+  assert coalesce_tasks(tasks) == tasks
+
+
+def test_batch_index_then_update_removes_deleted(tmp_path):
+  root = tmp_path / 'r'
+  root.mkdir()
+  (root / 'a.txt').write_text('a\n', encoding='utf-8')
+  (root / 'b.txt').write_text('b\n', encoding='utf-8')
+
+  indexer = Indexer(tmp_path / 'index', False, 'trigram')
+  indexer.index(root)
+
+  (root / 'a.txt').unlink()
+
+  with indexer.batch():
+    indexer.index(root)
+    indexer.update(root)
+
+  indexer.refresh_cache()
+  r = indexer.query(r'\.txt$', None)
+  paths = sorted(pathlib.Path(hit['path']).name for hit in r.iter_hits())
+  r.close()
+
+  assert paths == ['b.txt']
+
+
+def test_batch_index_then_remove_whoosh(tmp_path):
+  root = tmp_path / 'tree'
+  root.mkdir()
+  (root / 'a.txt').write_text('a\n', encoding='utf-8')
+  (root / 'b.txt').write_text('b\n', encoding='utf-8')
+
+  indexer = Indexer(tmp_path / 'index', False, 'whoosh')
+
+  # whoosh only deletes committed documents
+  with indexer.batch() as reports:
+    indexer.index(root)
+    indexer.remove(root)
+
+  assert ('remove', root.as_posix(), 2) in reports
+
+  indexer.refresh_cache()
+  r = indexer.query(r'\.txt$', None)
+  paths = [hit['path'] for hit in r.iter_hits()]
+  r.close()
+
+  assert paths == []
+  assert indexer.list_indexed_path() == []
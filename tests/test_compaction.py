@@ -0,0 +1,109 @@
+import threading
+
+from whoosh import index
+
+from pyeverything.core.compaction import CompactionScheduler
+from pyeverything.core.indexer import whoosh as whoosh_indexer
+from pyeverything.core.indexing import Indexer
+
+
+class _FakeIndexer(object):
+  '''
+  an index with too many segments which never gets compacted, like one
+  locked by another process
+  '''
+
+  def __init__(self):
+    self.compacted = threading.Event()
+    self.compact_count = 0
+
+  def refresh_cache(self):
+    pass
+
+  def segment_stats(self):
+    return {'segments': 20, 'documents': 10, 'deleted': 0, 'size': 0}
+
+  def idle_time(self):
+    return 0.0
+
+  def compact(self):
+    self.compact_count += 1
+
+    if self.compact_count == 2:
+      self.compacted.set()
+
+
+def test_compaction_asked_again_after_retry_interval():
+  indexer = _FakeIndexer()
+  scheduler = CompactionScheduler(indexer,
+                                  check_interval=0.01,
+                                  retry_interval=0.05)
+  scheduler.start()
+
+  try:
+    assert indexer.compacted.wait(5.0)
+  finally:
+    scheduler.stop()
+
+
+def test_compaction_not_repeated_for_same_stats():
+  indexer = _FakeIndexer()
+  scheduler = CompactionScheduler(indexer, check_interval=0.01)
+  scheduler.start()
+
+  try:
+    assert not indexer.compacted.wait(0.2)
+  finally:
+    scheduler.stop()
+
+  assert indexer.compact_count == 1
+
+
+def _whoosh_indexer(tmp_path):
+  tree = tmp_path / 'tree'
+  tree.mkdir()
+
+  for i in range(3):
+    (tree / f'{i}.txt').write_text(f'file {i}\n', encoding='utf-8')
+
+  indexer = Indexer(tmp_path / 'index', False, 'whoosh')
+  indexer.index(tree)
+  indexer.index(tree, True)
+  indexer.refresh_cache()
+
+  return indexer
+
+
+def test_whoosh_stats_do_not_count_roots(tmp_path):
+  indexer = _whoosh_indexer(tmp_path)
+
+  assert indexer.segment_stats()['documents'] == 3
+
+
+def _counts(indexer):
+  stats = indexer.segment_stats()
+
+  return stats['segments'], stats['documents'], stats['deleted']
+
+
+def test_whoosh_compact_skipped_while_locked(tmp_path, monkeypatch):
+  monkeypatch.setattr(whoosh_indexer, 'COMPACT_LOCK_TIMEOUT', 0.1)
+
+  indexer = _whoosh_indexer(tmp_path)
+  before = _counts(indexer)
+  assert before[0] > 1
+
+  # another process writing the index
+  writer = index.open_dir((tmp_path / 'index').as_posix()).writer()
+
+  try:
+    indexer.compact()
+  finally:
+    writer.cancel()
+
+  assert _counts(indexer) == before
+
+  indexer.compact()
+  indexer.refresh_cache()
+
+  assert _counts(indexer) == (1, 3, 0)
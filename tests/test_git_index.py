@@ -0,0 +1,115 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from pyeverything.core.file_system_helper import walk_git_files
+from pyeverything.core.git_index import EXTENDED_FLAG_INTENT_TO_ADD, EXTENDED_FLAG_SKIP_WORKTREE, read_git_index, tracked_files
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None,
+                                reason='git is not installed')
+
+FILES = [
+    'a.txt',
+    'src/lib/module_one.py',
+    'src/lib/module_two.py',
+    'src/main.py',
+    'src/zz.txt',
+]
+
+
+def _git(work_tree, *args):
+  subprocess.run(['git', '-C', work_tree.as_posix()] + list(args),
+                 check=True,
+                 stdout=subprocess.DEVNULL,
+                 stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def work_tree(tmp_path):
+  _git(tmp_path, 'init', '-q')
+
+  for name in FILES:
+    p = tmp_path / name
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(f'{name}\n', encoding='utf-8')
+
+  _git(tmp_path, 'add', '.')
+
+  return tmp_path
+
+
+@pytest.mark.parametrize('version', [2, 3, 4])
+def test_read_index_versions(work_tree, version):
+  (work_tree / 'new.txt').write_text('new\n', encoding='utf-8')
+  (work_tree / 'sparse.txt').write_text('sparse\n', encoding='utf-8')
+  _git(work_tree, 'add', 'sparse.txt')
+
+  if version >= 3:
+    # the extended flags need version 3, git upgrades 2 by itself
+    _git(work_tree, 'add', '-N', 'new.txt')
+    _git(work_tree, 'update-index', '--skip-worktree', 'sparse.txt')
+
+  _git(work_tree, 'update-index', '--index-version', str(version))
+
+  index_path = work_tree / '.git' / 'index'
+  assert int.from_bytes(index_path.read_bytes()[4:8], 'big') == version
+
+  entries = {e.path: e for e in read_git_index(index_path.as_posix())}
+
+  expected = FILES + ['sparse.txt'] + (['new.txt'] if version >= 3 else [])
+  assert sorted(entries) == sorted(expected)
+
+  for name in FILES:
+    st = os.stat(work_tree / name)
+    assert entries[name].size == st.st_size
+    assert entries[name].ino == st.st_ino
+
+  if version >= 3:
+    assert entries['new.txt'].extended_flags & EXTENDED_FLAG_INTENT_TO_ADD
+    assert (entries['sparse.txt'].extended_flags
+            & EXTENDED_FLAG_SKIP_WORKTREE)
+
+  found = tracked_files(work_tree.as_posix())
+  assert found is not None
+  assert found[0] == work_tree.as_posix()
+
+  tracked = [e.path for e in found[1]]
+  assert tracked == sorted(
+      FILES + (['sparse.txt'] if version == 2 else []))
+
+
+def test_tracked_files_under_sub_dir(work_tree):
+  _git(work_tree, 'update-index', '--index-version', '4')
+
+  _, entries = tracked_files((work_tree / 'src' / 'lib').as_posix())
+
+  assert [e.path for e in entries] == [
+      'src/lib/module_one.py', 'src/lib/module_two.py'
+  ]
+
+
+def test_walk_sees_edits_after_add(work_tree):
+  p = work_tree / 'src' / 'main.py'
+
+  # the index holds the stat data of the added file, the walk must not
+  # report it for the edited one
+  p.write_text('edited after git add, longer\n', encoding='utf-8')
+
+  entries = {e.path: e for e in walk_git_files(work_tree)}
+
+  assert entries[p.as_posix()].stat.st_size == p.stat().st_size
+  assert entries[p.as_posix()].stat.st_mtime_ns == p.stat().st_mtime_ns
+
+
+def test_walk_lists_untracked_and_skips_deleted(work_tree):
+  (work_tree / 'untracked.txt').write_text('u\n', encoding='utf-8')
+  (work_tree / 'a.txt').unlink()
+
+  paths = sorted(
+      os.path.relpath(e.path, work_tree.as_posix())
+      for e in walk_git_files(work_tree))
+
+  assert paths == sorted([f for f in FILES if f != 'a.txt'] +
+                         ['untracked.txt'])
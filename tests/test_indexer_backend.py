@@ -0,0 +1,19 @@
+import pytest
+
+from pyeverything.core.indexer import get_indexer_backend, get_indexer_impl
+
+
+def test_backend_is_remembered(tmp_path):
+  get_indexer_impl(tmp_path, 'trigram')
+
+  assert get_indexer_backend(tmp_path) == 'trigram'
+  assert type(get_indexer_impl(tmp_path)).__name__ == 'TrigramIndexerImpl'
+
+
+def test_other_backend_needs_migrate(tmp_path):
+  get_indexer_impl(tmp_path, 'trigram')
+
+  with pytest.raises(ValueError, match='migrate'):
+    get_indexer_impl(tmp_path, 'sqlite')
+
+  assert get_indexer_backend(tmp_path) == 'trigram'
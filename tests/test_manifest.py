@@ -0,0 +1,127 @@
+import os
+
+from pyeverything.core.manifest import FileManifest, file_digest
+
+
+def _scan(manifest, root, files):
+  '''
+  record files as seen by a scan of root, return the paths the scan found
+  unchanged
+  '''
+  unchanged = []
+
+  manifest.begin_scan(root)
+
+  for p in files:
+    st = os.stat(p)
+
+    if manifest.mark_unchanged(p, st):
+      unchanged.append(p)
+    else:
+      manifest.record(p, st, file_digest(p))
+
+  return unchanged
+
+
+def _files(tmp_path, *names):
+  paths = []
+
+  for name in names:
+    p = tmp_path / 'root' / name
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(name, encoding='utf-8')
+    paths.append(p.as_posix())
+
+  return paths
+
+
+def test_record_and_mark_unchanged(tmp_path):
+  a, b = _files(tmp_path, 'a.txt', 'b.txt')
+  root = (tmp_path / 'root').as_posix()
+  manifest = FileManifest(tmp_path)
+
+  manifest.begin()
+  assert _scan(manifest, root, [a, b]) == []
+  assert manifest.get_digest(a) == file_digest(a)
+  manifest.end_scan()
+  manifest.end()
+
+  # b changes size, a keeps its stat data
+  with open(b, 'a', encoding='utf-8') as f:
+    f.write('more')
+
+  manifest.begin()
+  assert _scan(manifest, root, [a, b]) == [a]
+  assert manifest.get_digest(b) == file_digest(b)
+  assert list(manifest.unseen_paths()) == []
+  manifest.end_scan()
+  manifest.end()
+
+
+def test_unseen_paths_removed(tmp_path):
+  a, b = _files(tmp_path, 'a.txt', 'b.txt')
+  root = (tmp_path / 'root').as_posix()
+  manifest = FileManifest(tmp_path)
+
+  manifest.begin()
+  _scan(manifest, root, [a, b])
+  manifest.end_scan()
+  manifest.end()
+
+  manifest.begin()
+  _scan(manifest, root, [a])
+  assert list(manifest.unseen_paths()) == [b]
+  assert manifest.remove_unseen() == 1
+  assert manifest.get_digest(a) is not None
+  assert manifest.get_digest(b) is None
+  manifest.end_scan()
+  manifest.end()
+
+
+def test_scan_rolled_back(tmp_path):
+  a, b = _files(tmp_path, 'a.txt', 'b.txt')
+  root = (tmp_path / 'root').as_posix()
+  manifest = FileManifest(tmp_path)
+
+  manifest.begin()
+  _scan(manifest, root, [a])
+  manifest.end_scan()
+  manifest.end()
+
+  # a failed scan leaves the manifest of the last good one
+  manifest.begin()
+  _scan(manifest, root, [b])
+  manifest.end_scan(False)
+  manifest.end()
+
+  manifest.begin()
+  assert _scan(manifest, root, [a]) == [a]
+  assert manifest.get_digest(b) is None
+  assert list(manifest.unseen_paths()) == []
+  manifest.end_scan()
+  manifest.end()
+
+
+def test_remove_prefix_drops_roots(tmp_path):
+  a, b = _files(tmp_path, 'a.txt', 'sub/b.txt')
+  outside = tmp_path / 'outside.txt'
+  outside.write_text('outside', encoding='utf-8')
+
+  root = (tmp_path / 'root').as_posix()
+  sub_root = (tmp_path / 'root' / 'sub').as_posix()
+  manifest = FileManifest(tmp_path)
+
+  manifest.begin()
+  _scan(manifest, root, [a, b])
+  manifest.end_scan()
+  # a file linked from the sub root
+  _scan(manifest, sub_root, [b, outside.as_posix()])
+  manifest.end_scan()
+  manifest.end()
+
+  manifest.begin()
+  assert manifest.remove_prefix(root) == [outside.as_posix()]
+  manifest.end()
+
+  assert not manifest.has_root(root)
+  assert not manifest.has_root(sub_root)
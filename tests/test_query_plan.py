@@ -0,0 +1,66 @@
+import pathlib
+
+import pytest
+
+from pyeverything.core.indexing import Indexer
+from pyeverything.core.query_planner import QueryPlan
+
+
+def _names(indexer, path, content, strategy):
+  r = indexer.query(path, content, plan=QueryPlan(strategy, None, None))
+  names = sorted(pathlib.Path(hit['path']).name for hit in r.iter_hits())
+  r.close()
+
+  return names
+
+
+@pytest.mark.parametrize('backend', ['whoosh', 'trigram', 'sqlite'])
+def test_scan_and_index_agree_after_remove(tmp_path, backend):
+  tree = tmp_path / 'tree'
+  (tree / 'a' / 'b').mkdir(parents=True)
+  (tree / 'c').mkdir()
+
+  (tree / 'a' / 'x.txt').write_text('needle\n', encoding='utf-8')
+  (tree / 'a' / 'b' / 'y.py').write_text('needle\n', encoding='utf-8')
+  (tree / 'c' / 'z.txt').write_text('needle\n', encoding='utf-8')
+  (tree / 'c' / 'w.txt').write_text('hay\n', encoding='utf-8')
+
+  indexer = Indexer(tmp_path / 'index', False, backend, read_workers=2)
+  indexer.index(tree)
+  indexer.remove(tree / 'a')
+  indexer.refresh_cache()
+
+  # a file the index never saw
+  (tree / 'c' / 'new.txt').write_text('needle\n', encoding='utf-8')
+
+  for path in [None, tree.as_posix()]:
+    scanned = _names(indexer, path, 'needle', 'scan')
+
+    assert scanned == ['z.txt']
+    assert scanned == _names(indexer, path, 'needle', 'index')
+
+
+def test_scan_hits_carry_match_info(tmp_path, monkeypatch):
+  tree = tmp_path / 'tree'
+  tree.mkdir()
+  (tree / 'x.txt').write_text('hay\nneedle one\nneedle two\n', encoding='utf-8')
+
+  indexer = Indexer(tmp_path / 'index', False, 'whoosh', read_workers=2)
+  indexer.index(tree)
+  indexer.refresh_cache()
+
+  r = indexer.query(None, 'needle', plan=QueryPlan('scan', None, None))
+  hits = list(r.iter_hits())
+
+  # verifying a scan hit must not read the file again
+  def read_again(*args):
+    raise AssertionError('the file was read again')
+
+  monkeypatch.setattr('pyeverything.core.indexer.query_result.match_info',
+                      read_again)
+
+  assert len(hits) == 1
+  assert list(r.get_matching_info(hits[0], 'needle')) == [
+      (1, 0, 6, 'needle one'), (2, 0, 6, 'needle two')
+  ]
+  r.close()
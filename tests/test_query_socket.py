@@ -0,0 +1,108 @@
+import importlib
+import socket
+
+import pytest
+
+from pyeverything.core.indexing import Indexer
+from pyeverything.frontend.cmd.client import query_service
+from pyeverything.frontend.cmd.run import do_query, forward_to_service, parse_arguments, set_helm_query_args
+from pyeverything.web.service.query_socket import QuerySocketServer
+
+# the package exports the indexer function under the name of the module
+service_indexer = importlib.import_module('pyeverything.web.service.indexer')
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                reason='unix sockets are not supported')
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+  '''
+  a query socket on an index of tree, return (location, tree)
+  '''
+  tree = tmp_path / 'tree'
+  (tree / 'sub').mkdir(parents=True)
+  (tree / 'a.txt').write_text('needle one\nhay\n', encoding='utf-8')
+  (tree / 'sub' / 'b.txt').write_text('hay\nneedle two\n', encoding='utf-8')
+  (tree / 'c.txt').write_text('hay\n', encoding='utf-8')
+
+  location = tmp_path / 'index'
+  Indexer(location, False, 'whoosh').index(tree)
+
+  monkeypatch.setattr(service_indexer, '__g_indexer', None)
+  service_indexer.indexer(location, 'whoosh')
+
+  server = QuerySocketServer(location.as_posix())
+  server.start()
+
+  yield location, tree
+
+  server.stop()
+
+
+def _local_lines(location, cmd_line_args, cwd):
+  args = parse_arguments(cmd_line_args)
+
+  if args.op != 'query':
+    set_helm_query_args(args, cwd)
+
+  lines = do_query(Indexer(location, False, 'whoosh'), args)
+
+  try:
+    return list(lines)
+  finally:
+    lines.close()
+
+
+def test_query_forwarded(service):
+  location, tree = service
+  cmd_line_args = ['-l', location.as_posix(), 'query', '-c', 'needle',
+                   '--no_color']
+
+  lines = forward_to_service(cmd_line_args, tree)
+
+  assert lines is not None
+  lines = list(lines)
+
+  assert lines == _local_lines(location, cmd_line_args, tree)
+  assert any('needle one' in l for l in lines)
+  assert any('needle two' in l for l in lines)
+
+
+def test_helm_ag_forwarded(service):
+  location, tree = service
+  cmd_line_args = ['-l', location.as_posix(), 'helm-ag', 'needle']
+  cwd = tree / 'sub'
+
+  lines = list(forward_to_service(cmd_line_args, cwd))
+
+  # only the files under the working directory
+  assert lines == _local_lines(location, cmd_line_args, cwd)
+  assert len(lines) == 1 and 'needle two' in lines[0]
+
+
+def test_fallback_outside_index(service, tmp_path):
+  location, _ = service
+  other = tmp_path / 'other'
+  other.mkdir()
+
+  # the client runs ag or rg itself
+  assert forward_to_service(['-l', location.as_posix(), 'helm-ag', 'x'],
+                            other) is None
+
+
+def test_fallback_for_other_operations(service):
+  location, tree = service
+
+  assert query_service(location.as_posix(), ['index', tree.as_posix()],
+                       tree.as_posix()) is None
+  assert query_service(location.as_posix(), ['query', '--bad-option'],
+                       tree.as_posix()) is None
+  assert forward_to_service(
+      ['-l', location.as_posix(), '--no-service', 'query', '-c', 'needle'],
+      tree) is None
+
+
+def test_no_service(tmp_path):
+  assert query_service(tmp_path.as_posix(), ['query', '-c', 'x'],
+                       tmp_path.as_posix()) is None
@@ -0,0 +1,130 @@
+import mmap
+import os
+import re
+import time
+
+import pytest
+
+from pyeverything.core import regexp_match_utils
+from pyeverything.core.regexp_match_utils import match_info
+
+TEXT = 'first line\nneedle here\nno match\nanother needle, Needle\n'
+
+
+@pytest.fixture
+def mapped(monkeypatch):
+  '''
+  count the files mapped, every file is large enough to be mapped
+  '''
+  maps = []
+  real_mmap = mmap.mmap
+
+  def spy(*args, **kwargs):
+    m = real_mmap(*args, **kwargs)
+    maps.append(m)
+    return m
+
+  monkeypatch.setattr(regexp_match_utils, 'MMAP_MIN_SIZE', 0)
+  monkeypatch.setattr(regexp_match_utils.mmap, 'mmap', spy)
+
+  return maps
+
+
+def _old_file(path, text):
+  path.write_text(text, encoding='utf-8')
+
+  t = time.time() - 3600
+  os.utime(path, (t, t))
+
+  return path
+
+
+@pytest.mark.parametrize('content', ['needle', 'need.e', r'\bline$'])
+def test_mapped_and_read_files_agree(tmp_path, mapped, content):
+  path = _old_file(tmp_path / 'a.txt', TEXT)
+
+  mapped_info = list(match_info(path, content, True))
+  assert len(mapped) == 1
+
+  path.write_text(TEXT, encoding='utf-8')
+  read_info = list(match_info(path, content, True))
+  assert len(mapped) == 1
+
+  assert mapped_info == read_info
+  assert len(read_info) > 0
+
+
+def test_recently_modified_file_is_read(tmp_path, mapped):
+  path = tmp_path / 'a.txt'
+  path.write_text(TEXT, encoding='utf-8')
+
+  assert [m[0] for m in match_info(path, 'needle')] == [1, 3]
+  assert mapped == []
+
+
+def test_small_file_is_read(tmp_path, mapped, monkeypatch):
+  monkeypatch.setattr(regexp_match_utils, 'MMAP_MIN_SIZE', 1024 * 1024)
+  path = _old_file(tmp_path / 'a.txt', TEXT)
+
+  assert [m[0] for m in match_info(path, 'needle')] == [1, 3]
+  assert mapped == []
+
+
+def test_empty_file(tmp_path, mapped):
+  path = _old_file(tmp_path / 'a.txt', '')
+
+  assert list(match_info(path, 'needle')) == []
+  assert list(match_info(path, '')) == []
+
+
+def test_file_changed_while_mapped_is_read(tmp_path, monkeypatch):
+  path = _old_file(tmp_path / 'a.txt', TEXT)
+  real_mmap = mmap.mmap
+
+  def grow_after_map(*args, **kwargs):
+    m = real_mmap(*args, **kwargs)
+
+    with open(path, 'a', encoding='utf-8') as f:
+      f.write('appended needle\n')
+
+    return m
+
+  monkeypatch.setattr(regexp_match_utils, 'MMAP_MIN_SIZE', 0)
+  monkeypatch.setattr(regexp_match_utils.mmap, 'mmap', grow_after_map)
+
+  assert [m[0] for m in match_info(path, 'needle')] == [1, 3, 4]
+
+
+LITERAL_TEXTS = {
+    'ascii': 'foo bar\nFOO Bar foo\nx.y and xzy\n\nlast foo',
+    'crlf': 'foo bar\r\nFOO Bar foo\r\nx.y\r\n',
+    'non_ascii': 'café foo\nCAFÉ Foo\nstraße foo\n',
+}
+
+
+@pytest.mark.parametrize('name', sorted(LITERAL_TEXTS))
+@pytest.mark.parametrize('literal',
+                         ['foo', 'Foo', 'foo bar', 'x.y', 'o', 'café'])
+@pytest.mark.parametrize('ignore_case', [False, True])
+def test_literal_matches_regex(tmp_path, name, literal, ignore_case):
+  path = tmp_path / f'{name}.txt'
+  path.write_bytes(LITERAL_TEXTS[name].encode('utf-8'))
+
+  expected = list(
+      regexp_match_utils.regexp_match_info(path, re.escape(literal),
+                                           ignore_case))
+
+  assert list(regexp_match_utils.literal_match_info(
+      path, literal, ignore_case)) == expected
+  assert list(match_info(path, literal, ignore_case, True)) == expected
+
+
+def test_literal_pattern():
+  literal_pattern = regexp_match_utils.literal_pattern
+
+  assert literal_pattern('foo bar') == 'foo bar'
+  assert literal_pattern(r'x\.y') == 'x.y'
+  assert literal_pattern('x.y') is None
+  assert literal_pattern('fo+') is None
+  assert literal_pattern('(?i)foo') is None
+  assert literal_pattern('') is None
@@ -0,0 +1,75 @@
+from pyeverything.core.indexer import sqlite
+from pyeverything.core.indexer.sqlite import SqliteIndexerImpl
+
+
+def test_path_looked_up_by_trigrams(tmp_path):
+  root = tmp_path / 'files'
+  root.mkdir()
+
+  names = [f'other{i}.txt' for i in range(8)] + ['wanted.txt']
+  for name in names:
+    (root / name).write_text(f'content of {name}\n', encoding='utf-8')
+
+  impl = SqliteIndexerImpl(tmp_path)
+  impl.begin_index()
+  for name in names:
+    impl.add_document(root / name)
+  impl.end_index()
+
+  regexp_calls = []
+
+  def regexp(pattern, value):
+    regexp_calls.append(value)
+    return sqlite._regexp(pattern, value)
+
+  impl.conn_.create_function('regexp', 2, regexp, deterministic=True)
+
+  r = impl.query(r'wanted\.txt', 'content')
+  paths = [hit['path'] for hit in r.iter_hits()]
+  r.close()
+
+  assert paths == [(root / 'wanted.txt').as_posix()]
+  assert len(regexp_calls) == 1
+
+  estimate, total = impl.estimate(r'wanted\.txt', 'content')
+  assert (estimate, total) == (1, len(names))
+
+
+def test_cursor_survives_reindexing(tmp_path):
+  root = tmp_path / 'files'
+  root.mkdir()
+
+  names = [f'f{i}.txt' for i in range(6)]
+  for name in names:
+    (root / name).write_text('needle\n', encoding='utf-8')
+
+  impl = SqliteIndexerImpl(tmp_path)
+  impl.begin_index()
+  for name in names:
+    impl.add_document(root / name)
+  impl.end_index()
+
+  r = impl.query(None, 'needle')
+  first_page = [hit for _, hit in zip(range(3), r.iter_hits())]
+  cursor = r.cursor(first_page[-1])
+  r.close()
+
+  # a file of the first page changes and is indexed again
+  (root / 'f0.txt').write_text('needle again\n', encoding='utf-8')
+  impl.begin_index()
+  impl.add_document(root / 'f0.txt')
+  impl.end_index()
+
+  r = impl.query(None, 'needle')
+  next_page = [hit['path'] for hit in r.iter_hits(cursor=cursor)]
+  r.close()
+
+  paths = [hit['path'] for hit in first_page] + next_page
+
+  assert sorted(paths) == sorted((root / name).as_posix() for name in names)
+
+  r = impl.query(None, 'again')
+  assert [hit['path'] for hit in r.iter_hits()] == [
+      (root / 'f0.txt').as_posix()
+  ]
+  r.close()
@@ -0,0 +1,25 @@
+import importlib.util
+import pathlib
+
+# the import time budget depends on the machine and stays a manual check
+# with benchmarks/startup.py, which modules are imported does not
+STARTUP_BENCHMARK = (pathlib.Path(__file__).resolve().parent.parent /
+                     'benchmarks' / 'startup.py')
+
+
+def _load_benchmark():
+  spec = importlib.util.spec_from_file_location('startup_benchmark',
+                                                STARTUP_BENCHMARK)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+
+  return module
+
+
+def test_command_line_imports_lazily():
+  startup = _load_benchmark()
+
+  cumulative, packages = startup.import_time_ms()
+
+  assert cumulative is not None
+  assert sorted(packages.intersection(startup.LAZY_MODULES)) == []
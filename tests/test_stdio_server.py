@@ -0,0 +1,107 @@
+import argparse
+import io
+import json
+import time
+
+from pyeverything.core.indexing import Indexer
+from pyeverything.frontend.cmd.stdio_server import StdioServer
+
+
+def _request(request_id, method, params=None):
+  message = {'jsonrpc': '2.0', 'id': request_id, 'method': method}
+
+  if params is not None:
+    message['params'] = params
+
+  return json.dumps(message) + '\n'
+
+
+def _serve(location, lines, wait_for=None):
+  '''
+  run the server on the input lines, wait_for maps the id of a line to the
+  id of the request whose response is written before the line is sent
+  '''
+  wait_for = wait_for or {}
+  output = io.StringIO()
+
+  def input_lines():
+    for request_id, line in lines:
+      if request_id in wait_for:
+        deadline = time.monotonic() + 10
+
+        while (f'"id": {wait_for[request_id]}, "result"'
+               not in output.getvalue()
+               and time.monotonic() < deadline):
+          time.sleep(0.01)
+
+      yield line
+
+  StdioServer(argparse.Namespace(location=location), input_lines(),
+              output).serve()
+
+  return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def _responses(messages):
+  return {m['id']: m for m in messages if 'id' in m}
+
+
+def _index(tmp_path):
+  root = tmp_path / 'files'
+  root.mkdir()
+  (root / 'a.txt').write_text('needle one\nhay\n', encoding='utf-8')
+  (root / 'b.txt').write_text('hay\n', encoding='utf-8')
+
+  location = tmp_path / 'index'
+  Indexer(location, False, 'trigram').index(root)
+
+  return root, location
+
+
+def test_search_streams_lines(tmp_path):
+  root, location = _index(tmp_path)
+
+  messages = _serve(location, [
+      (1,
+       _request(1, 'search', {
+           'args': ['query', '-c', 'needle', '--no_color'],
+           'cwd': root.as_posix()
+       })),
+      (2, _request(2, 'shutdown')),
+  ],
+                    wait_for={2: 1})
+
+  lines = [
+      m['params']['line'] for m in messages
+      if m.get('method') == 'search/line'
+  ]
+  responses = _responses(messages)
+
+  assert (root / 'a.txt').as_posix() in lines
+  assert any('needle one' in line for line in lines)
+  assert responses[1]['result'] == {'lines': len(lines)}
+  assert responses[2]['result'] is None
+
+
+def test_invalid_messages_answered(tmp_path, capsys):
+  root, location = _index(tmp_path)
+
+  messages = _serve(location, [
+      (0, 'not json\n'),
+      (1, _request(1, 'search', ['query', '-c', 'needle'])),
+      (2, _request(2, 'search', {'args': ['-h']})),
+      (3, _request(3, 'search', {'args': ['--version']})),
+      (4, _request(4, 'search', {'args': ['query'], 'cwd': 5})),
+      (5, _request(5, 'search', {'args': ['index', 'x']})),
+      (6, _request(6, 'nope')),
+      (7, _request(7, 'cancel', 'x')),
+  ])
+  responses = _responses(messages)
+
+  assert messages[0]['error']['code'] == -32700
+  for request_id in [1, 2, 3, 4, 5, 7]:
+    assert responses[request_id]['error']['code'] == -32602
+  assert responses[6]['error']['code'] == -32601
+
+  # the help of argparse must not get into the json-rpc channel
+  assert capsys.readouterr().out == ''
@@ -0,0 +1,57 @@
+import os
+import pathlib
+
+import pytest
+
+from pyeverything.core.indexing import Indexer
+
+
+def _names(indexer, base):
+  indexer.refresh_cache()
+
+  r = indexer.query(r'\.txt$', None)
+  names = sorted(
+      pathlib.Path(hit['path']).relative_to(base).as_posix()
+      for hit in r.iter_hits())
+  r.close()
+
+  return names
+
+
+@pytest.fixture
+def linked_tree(tmp_path):
+  '''
+  root/link points to target next to root, the documents are stored under
+  their real path
+  '''
+  root = tmp_path / 'root'
+  target = tmp_path / 'target'
+  root.mkdir()
+  target.mkdir()
+
+  (root / 'r.txt').write_text('r\n', encoding='utf-8')
+  (target / 't.txt').write_text('t\n', encoding='utf-8')
+  (target / 'u.txt').write_text('u\n', encoding='utf-8')
+  os.symlink('../target', root / 'link')
+
+  return tmp_path
+
+
+@pytest.mark.parametrize('backend', ['whoosh', 'trigram', 'sqlite'])
+def test_update_removes_deleted_file_behind_link(linked_tree, backend):
+  root = linked_tree / 'root'
+
+  indexer = Indexer(linked_tree / 'index', False, backend)
+  indexer.index(root)
+
+  assert _names(indexer, linked_tree) == ['root/r.txt', 'target/t.txt', 'target/u.txt']
+
+  (linked_tree / 'target' / 't.txt').unlink()
+
+  indexer.update(root)
+
+  assert _names(indexer, linked_tree) == ['root/r.txt', 'target/u.txt']
+
+  indexer.remove(root)
+
+  assert _names(indexer, linked_tree) == []
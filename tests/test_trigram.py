@@ -0,0 +1,70 @@
+import pathlib
+
+from pyeverything.core.indexer.trigram import TrigramIndexerImpl
+
+
+def _write_files(root, names):
+  for name in names:
+    p = root / name
+    p.write_text(f'needle in {name}\n', encoding='utf-8')
+
+
+def _index(data_path, root, names):
+  impl = TrigramIndexerImpl(data_path)
+
+  impl.begin_index()
+  for name in names:
+    impl.add_document(root / name)
+  impl.end_index()
+
+  return impl
+
+
+def test_refresh_during_query(tmp_path):
+  root = tmp_path / 'files'
+  root.mkdir()
+  data_path = tmp_path / 'index'
+  data_path.mkdir()
+
+  first = [f'a{i}.txt' for i in range(5)]
+  second = [f'b{i}.txt' for i in range(4)]
+  _write_files(root, first + second + ['c.txt'])
+
+  _index(data_path, root, first)
+  impl = _index(data_path, root, second)
+
+  r = impl.query(None, 'needle')
+  hits = r.iter_hits()
+  paths = [next(hits)['path']]
+
+  # another writer commits a new generation while the query reads the
+  # segments of the old one
+  _index(data_path, root, ['c.txt'])
+  impl.refresh_cache()
+
+  paths.extend(hit['path'] for hit in hits)
+  r.close()
+
+  assert sorted(pathlib.Path(p).name for p in paths) == sorted(first + second)
+
+  r = impl.query(None, 'needle')
+  assert len(list(r.iter_hits())) == len(first + second) + 1
+  r.close()
+
+
+def test_estimate_path_stops_counting(tmp_path):
+  root = tmp_path / 'files'
+  root.mkdir()
+  data_path = tmp_path / 'index'
+  data_path.mkdir()
+
+  names = [f'a{i}.txt' for i in range(10)] + ['b.txt']
+  _write_files(root, names)
+  impl = _index(data_path, root, names)
+
+  estimate, total = impl.estimate(r'b\.txt', None)
+  assert (estimate, total) == (1, 11)
+
+  # past half of the documents the exact count does not change the plan
+  estimate, total = impl.estimate(r'a\d\.txt', None)
+  assert estimate == 6
@@ -0,0 +1,120 @@
+import globre
+
+from pyeverything.core.file_system_helper import walk_files
+from pyeverything.vcs_ignore import VCSIgnore
+
+ROOT_PATTERNS = [
+    '# comment',
+    '*.log',
+    '!keep.log',
+    'build/',
+    '/root_only.txt',
+    'docs/**/*.md',
+    '!docs/keep/**',
+    'a?c.txt',
+    '**/tmp',
+    'cache/',
+    '!cache/',
+]
+
+SUB_PATTERNS = ['!*.log', 'local.txt']
+
+PATHS = [
+    'x.log', 'keep.log', 'sub/x.log', 'sub/deep/keep.log', 'build/out.o',
+    'src/build/out.o', 'build', 'root_only.txt', 'sub/root_only.txt',
+    'docs/a.md', 'docs/guide/b.md', 'docs/keep/c.md', 'docs/readme.txt',
+    'abc.txt', 'ac.txt', 'sub/abc.txt', 'tmp', 'src/tmp', 'src/tmp/file',
+    'cache/file', 'sub/local.txt', 'local.txt', 'sub/deep/local.txt'
+]
+
+
+def _reference_ignore(vi, path):
+  '''
+  the matcher before the patterns were compiled, every glob of a directory
+  is matched in order and the last match decides, then the parent decides
+  '''
+  while vi is not None:
+    if len(vi.patterns_) > 0 and path.startswith(vi.prefix_):
+      rel_path = path[len(vi.prefix_):]
+      ignore = None
+
+      for pattern, white_list, _, _ in vi.patterns_:
+        if globre.match(pattern, rel_path) is not None:
+          ignore = not white_list
+
+      if ignore is not None:
+        return ignore
+
+    vi = vi.parent_
+
+  return False
+
+
+def _ignores(tmp_path):
+  root = VCSIgnore(tmp_path)
+  for p in ROOT_PATTERNS:
+    root.add_ignore_pattern(p + '\n')
+
+  sub = VCSIgnore(tmp_path / 'sub', root)
+  for p in SUB_PATTERNS:
+    sub.add_ignore_pattern(p)
+
+  return root, sub
+
+
+def test_compiled_matches_reference(tmp_path):
+  root, sub = _ignores(tmp_path)
+
+  for p in PATHS:
+    path = (tmp_path / p).as_posix()
+    vi = sub if p.startswith('sub/') else root
+
+    assert vi.ignore_path(path) == _reference_ignore(vi, path), p
+
+
+def test_patterns_added_after_match(tmp_path):
+  root, _ = _ignores(tmp_path)
+  path = (tmp_path / 'new.txt').as_posix()
+
+  assert not root.ignore_path(path)
+
+  # the compiled runs are rebuilt for the new pattern
+  root.add_ignore_pattern('new.txt')
+
+  assert root.ignore_path(path)
+  assert root.ignore_path(path) == _reference_ignore(root, path)
+
+
+def test_dir_only_patterns(tmp_path):
+  root, _ = _ignores(tmp_path)
+
+  # a trailing slash matches the directory itself, not a file of that name
+  assert root.ignore_path(tmp_path / 'build', is_dir=True)
+  assert root.ignore_path(tmp_path / 'src' / 'build', is_dir=True)
+  assert not root.ignore_path(tmp_path / 'build', is_dir=False)
+  assert not root.ignore_path(tmp_path / 'cache', is_dir=True)
+  assert not root.ignore_path(tmp_path / 'src', is_dir=True)
+
+
+def test_walk_prunes_ignored_directories(tmp_path):
+  files = [
+      'a.txt', 'x.log', 'keep.log', 'build/out.o', 'build/keep.log',
+      'src/main.c', 'src/build/gen.c', 'cache/data', 'build.txt'
+  ]
+
+  for name in files:
+    p = tmp_path / name
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(name, encoding='utf-8')
+
+  (tmp_path / '.gitignore').write_text(
+      '*.log\n!keep.log\nbuild/\ncache/\n!cache/\n', encoding='utf-8')
+
+  walked = sorted(
+      e.path[len(tmp_path.as_posix()) + 1:] for e in walk_files(tmp_path))
+
+  # as in git, a file of an ignored directory can not be re-included, the
+  # directory itself can
+  assert walked == [
+      'a.txt', 'build.txt', 'cache/data', 'keep.log', 'src/main.c'
+  ]
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from pyeverything.core.watcher import IndexWatcher, is_watch_supported
+
+pytestmark = pytest.mark.skipif(not is_watch_supported(),
+                                reason='inotify is not available')
+
+
+class _FakeIndexer(object):
+  '''
+  records the tasks the watcher queues
+  '''
+
+  def __init__(self, root):
+    self.root = root
+    self.synced = {}
+    self.updated = []
+    self.changed = threading.Condition()
+
+  def refresh_cache(self):
+    pass
+
+  def list_indexed_path(self):
+    return [(self.root, None)]
+
+  def sync_files(self, root, paths):
+    with self.changed:
+      self.synced.setdefault(root, set()).update(paths)
+      self.changed.notify_all()
+
+  def update(self, root):
+    with self.changed:
+      self.updated.append(root)
+      self.changed.notify_all()
+
+  def wait_synced(self, paths, timeout=5.0):
+    with self.changed:
+      return self.changed.wait_for(
+          lambda: set(paths) <= self.synced.get(self.root, set()), timeout)
+
+
+@pytest.fixture
+def watched(tmp_path):
+  root = tmp_path / 'root'
+  root.mkdir()
+  (root / '.gitignore').write_text('*.log\n', encoding='utf-8')
+  (root / 'old.txt').write_text('old\n', encoding='utf-8')
+
+  indexer = _FakeIndexer(root.as_posix())
+  watcher = IndexWatcher(indexer,
+                         debounce=0.05,
+                         max_delay=0.5,
+                         root_check_interval=60.0)
+  watcher.start()
+
+  # the roots are watched by the thread of the watcher
+  deadline = time.monotonic() + 5.0
+  while len(watcher.roots_.get(root.as_posix(), [])) == 0:
+    assert time.monotonic() < deadline
+    time.sleep(0.01)
+
+  yield root, indexer
+
+  watcher.stop()
+
+
+def test_file_events_synced(watched):
+  root, indexer = watched
+
+  (root / 'new.txt').write_text('new\n', encoding='utf-8')
+  (root / 'old.txt').unlink()
+  (root / 'skipped.log').write_text('log\n', encoding='utf-8')
+
+  expected = [(root / 'new.txt').as_posix(), (root / 'old.txt').as_posix()]
+  assert indexer.wait_synced(expected)
+
+  # the ignored file is never synced
+  time.sleep(0.2)
+  synced = indexer.synced[root.as_posix()]
+  assert (root / 'skipped.log').as_posix() not in synced
+  assert indexer.updated == []
+
+
+def test_new_directory_watched(watched):
+  root, indexer = watched
+
+  # files written before the watch of the new directory are reported too
+  (root / 'sub').mkdir()
+  (root / 'sub' / 'a.txt').write_text('a\n', encoding='utf-8')
+  assert indexer.wait_synced([(root / 'sub' / 'a.txt').as_posix()])
+
+  (root / 'sub' / 'b.txt').write_text('b\n', encoding='utf-8')
+  assert indexer.wait_synced([(root / 'sub' / 'b.txt').as_posix()])
+
+
+def test_removed_directory_synced(watched):
+  root, indexer = watched
+
+  (root / 'gone').mkdir()
+  (root / 'gone' / 'a.txt').write_text('a\n', encoding='utf-8')
+  assert indexer.wait_synced([(root / 'gone' / 'a.txt').as_posix()])
+
+  (root / 'gone' / 'a.txt').unlink()
+  (root / 'gone').rmdir()
+  assert indexer.wait_synced([(root / 'gone').as_posix()])
@@ -0,0 +1,159 @@
+import importlib
+import json
+import queue
+
+import pytest
+
+from pyeverything.core.indexing import Indexer
+from pyeverything.web import create_app
+
+# the package exports the indexer function under the name of the module
+service_indexer = importlib.import_module('pyeverything.web.service.indexer')
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+  '''
+  a flask client searching an index of tree, one file of it is changed
+  after it was indexed
+  '''
+  tree = tmp_path / 'tree'
+  tree.mkdir()
+
+  for name in ['a.txt', 'b.txt', 'c.txt', 'stale.txt']:
+    (tree / name).write_text(f'{name}\nneedle\n', encoding='utf-8')
+
+  location = tmp_path / 'index'
+  Indexer(location, False, 'whoosh').index(tree)
+
+  (tree / 'stale.txt').write_text('no longer\n', encoding='utf-8')
+
+  monkeypatch.setattr(service_indexer, '__g_indexer', None)
+  service_indexer.indexer(location, 'whoosh')
+
+  app = create_app()
+  app.config['TESTING'] = True
+
+  return app.test_client(), tree
+
+
+def _names(paths):
+  return sorted(p.rsplit('/', 1)[-1] for p in paths)
+
+
+def test_query_verifies_content(client):
+  c, _ = client
+
+  r = c.get('/q', query_string={'content': 'needle'})
+
+  assert r.status_code == 200
+  assert _names(r.get_json()['result']) == ['a.txt', 'b.txt', 'c.txt']
+
+
+def test_query_pages_verify_content(client):
+  c, _ = client
+
+  paths = []
+  cursor = ''
+
+  while cursor is not None:
+    r = c.get('/q',
+              query_string={
+                  'content': 'needle',
+                  'page_size': 2,
+                  'cursor': cursor
+              })
+    assert r.status_code == 200
+
+    paths += r.get_json()['result']
+    cursor = r.get_json()['cursor']
+
+  assert _names(paths) == ['a.txt', 'b.txt', 'c.txt']
+
+
+def _stream(c, **query):
+  r = c.get('/q/stream', query_string=query)
+
+  assert r.status_code == 200
+  assert r.mimetype == 'application/x-ndjson'
+
+  body = r.get_data(as_text=True)
+
+  # one json object a line, the last one ends with a newline too
+  assert body == '' or body.endswith('\n')
+
+  return [json.loads(line) for line in body.splitlines()]
+
+
+def test_stream_limit_and_cursor(client):
+  c, _ = client
+
+  records = _stream(c, content='needle', limit=2)
+
+  assert 'cursor' in records[-1]
+  first = records[:-1]
+  assert len(set(r['path'] for r in first)) == 2
+
+  records = _stream(c,
+                    content='needle',
+                    limit=2,
+                    cursor=records[-1]['cursor'])
+
+  # the last file is not followed by a cursor, the page is not full
+  assert all('cursor' not in r for r in records)
+
+  matches = first + records
+  assert _names(set(r['path'] for r in matches)) == ['a.txt', 'b.txt', 'c.txt']
+
+  for r in matches:
+    assert (r['line'], r['column'], r['length']) == (2, 0, 6)
+    assert r['text'] == 'needle'
+
+
+def test_stream_path_only(client):
+  c, _ = client
+
+  records = _stream(c, path=r'/[ab]\.txt$', path_only='1')
+
+  assert _names(r['path'] for r in records) == ['a.txt', 'b.txt']
+  assert all(list(r) == ['path'] for r in records)
+
+
+def test_stream_rejects_bad_requests(client):
+  c, _ = client
+
+  assert c.get('/q/stream').status_code == 400
+  assert c.get('/q/stream',
+               query_string={
+                   'content': 'needle',
+                   'limit': 0
+               }).status_code == 400
+  assert c.get('/q/stream',
+               query_string={
+                   'content': 'needle',
+                   'cursor': 'bad'
+               }).status_code == 400
+  assert c.get('/q/stream', query_string={
+      'path': '('
+  }).status_code == 400
+
+
+def test_worker_sends_index_tasks_to_writer(client, monkeypatch):
+  c, tree = client
+
+  # a query worker only reads the index, the writer gets the tasks
+  control = queue.Queue()
+  monkeypatch.setattr(service_indexer, '__g_control', control)
+
+  assert c.post('/i', json=[tree.as_posix()]).status_code == 200
+  assert c.delete('/i', query_string={
+      'path': tree.as_posix()
+  }).status_code == 200
+
+  assert control.get_nowait() == ('index', tree.as_posix())
+  assert control.get_nowait() == ('remove', tree.as_posix())
+  assert control.empty()
+
+  # nothing was written by the worker
+  r = c.get('/q', query_string={'content': 'needle'})
+  assert _names(r.get_json()['result']) == ['a.txt', 'b.txt', 'c.txt']
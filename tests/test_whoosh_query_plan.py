@@ -0,0 +1,78 @@
+import pathlib
+import re
+
+import pytest
+from whoosh.query import And, Term
+
+from pyeverything.core.indexer.whoosh.query_plan import plan_query
+from pyeverything.core.indexing import Indexer
+from pyeverything.core.query_planner import QueryPlan
+
+CONTENTS = {
+    'a.txt': 'foobar\n',
+    'b.txt': 'foo and bar\n',
+    'c.txt': 'boo\n',
+    'd.txt': 'barqux bazqux\n',
+    'e.txt': 'xxy xxxy\n',
+    'f.txt': 'a.b\n',
+    'g.txt': 'aXb FOO\n',
+    'h.txt': 'nothing here\n',
+}
+
+PATTERNS = [
+    'foobar', 'foo.*bar', '[fb]oo', 'ba(r|z)qux', 'x{2,3}y', r'a\.b', 'a.b',
+    'Foo', 'here$', '^boo', '[a]?.*'
+]
+
+
+@pytest.fixture(scope='module')
+def indexer(tmp_path_factory):
+  tmp_path = tmp_path_factory.mktemp('whoosh_plan')
+  tree = tmp_path / 'tree'
+  tree.mkdir()
+
+  for name, text in CONTENTS.items():
+    (tree / name).write_text(text, encoding='utf-8')
+
+  indexer = Indexer(tmp_path / 'index', False, 'whoosh')
+  indexer.index(tree)
+  indexer.refresh_cache()
+
+  return indexer
+
+
+@pytest.mark.parametrize('pattern', PATTERNS)
+@pytest.mark.parametrize('ignore_case', [False, True])
+def test_index_candidates_cover_matches(indexer, pattern, ignore_case):
+  r = indexer.query(None,
+                    pattern,
+                    ignore_case,
+                    plan=QueryPlan('index', None, None))
+  candidates = set(pathlib.Path(hit['path']).name for hit in r.iter_hits())
+  r.close()
+
+  regex = re.compile(f'(?m){"(?i)" if ignore_case else ""}{pattern}')
+  matches = set(name for name, text in CONTENTS.items()
+                if regex.search(text) is not None)
+
+  assert matches <= candidates
+
+
+def test_literal_queries():
+  # the n-gram fields are lowercased, case only matters to the regex
+  assert plan_query('content', 'Foo', False) == Term('content', 'foo')
+  assert plan_query('content', 'a.b', True, True) == Term('content', 'a.b')
+  assert plan_query('content', '[a]?.*') is None
+
+  # a longer literal is the and of its 3 grams
+  q = plan_query('content', 'abcd')
+  assert isinstance(q, And)
+  assert set(q.subqueries) == {Term('content', 'abc'), Term('content', 'bcd')}
+
+
+def test_selective_literal_narrows(indexer):
+  r = indexer.query(None, 'qux', plan=QueryPlan('index', None, None))
+  candidates = set(pathlib.Path(hit['path']).name for hit in r.iter_hits())
+  r.close()
+
+  assert candidates == {'d.txt'}